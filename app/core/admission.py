@@ -0,0 +1,205 @@
+# app/core/admission.py
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Pattern, Tuple
+
+
+@dataclass
+class RouteClass:
+    name: str
+    priority: int                # lower is admitted first
+    max_concurrent: int
+    max_queue: int
+    max_wait: float              # seconds a request may wait for a slot
+    retry_after: int = 2         # seconds, sent with 503s
+    # Shed instead of queueing while average latency is above this (seconds)
+    latency_threshold: Optional[float] = None
+
+
+OVERLOADED_BODY = json.dumps({"detail": "Server is busy, please retry shortly"}).encode("utf-8")
+MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+
+DEFAULT_CLASSES = [
+    RouteClass("checkout", 0, max_concurrent=MAX_CONCURRENCY, max_queue=200, max_wait=10.0, retry_after=1),
+    RouteClass("standard", 1, max_concurrent=16, max_queue=100, max_wait=5.0),
+    RouteClass("polling", 2, max_concurrent=16, max_queue=50, max_wait=2.0, latency_threshold=1.0),
+    RouteClass("analytics", 3, max_concurrent=4, max_queue=10, max_wait=1.0, retry_after=5, latency_threshold=0.5),
+]
+
+# (method or None for any, path pattern, class name); first match wins
+DEFAULT_RULES = [
+    ("POST", r"^/api/orders$", "checkout"),
+    (None, r"^/api/(admin/)?analytics/", "analytics"),
+    (None, r"^/api/admin/dashboard", "analytics"),
+    ("GET", r"^/api/(admin/)?orders", "polling"),
+    ("GET", r"^/api/(items|daily-specials|categories)", "polling"),
+    ("GET", r"^/items-html", "polling"),
+]
+
+# Long-lived streams would hold a slot for as long as they are open
+DEFAULT_EXEMPT = [r"^/api/.*/stream$"]
+
+
+class AdmissionController:
+    """Bounded, prioritised admission for requests.
+
+    Requests run while both the global and their class's concurrency limits
+    allow it. Otherwise they wait in a bounded per-class queue. When a slot
+    frees up, the highest-priority waiter gets it. A request is shed
+    straight away when its queue is full, or when its class has a latency
+    threshold and the recent average latency is above it. It is also shed
+    if it waits longer than max_wait. All state lives on the event loop, so
+    no locking is needed.
+    """
+
+    EWMA_WEIGHT = 0.2
+
+    def __init__(
+        self,
+        classes: List[RouteClass] = DEFAULT_CLASSES,
+        rules: List[Tuple[Optional[str], str, str]] = DEFAULT_RULES,
+        max_concurrent: int = MAX_CONCURRENCY,
+        default_class: str = "standard",
+        exempt: List[str] = DEFAULT_EXEMPT,
+    ):
+        self.classes: Dict[str, RouteClass] = {c.name: c for c in classes}
+        self._by_priority = sorted(classes, key=lambda c: c.priority)
+        self._rules: List[Tuple[Optional[str], Pattern, RouteClass]] = [
+            (method, re.compile(pattern), self.classes[name]) for method, pattern, name in rules
+        ]
+        self.default_class = self.classes[default_class]
+        self._exempt: List[Pattern] = [re.compile(pattern) for pattern in exempt]
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self._class_in_flight: Dict[str, int] = {c.name: 0 for c in classes}
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {c.name: deque() for c in classes}
+        self.avg_latency = 0.0
+        self.shed_count = 0
+
+    def is_exempt(self, path: str) -> bool:
+        return any(pattern.match(path) for pattern in self._exempt)
+
+    def classify(self, method: str, path: str) -> RouteClass:
+        for rule_method, pattern, route_class in self._rules:
+            if (rule_method is None or rule_method == method) and pattern.match(path):
+                return route_class
+        return self.default_class
+
+    def queue_depth(self, route_class: Optional[RouteClass] = None) -> int:
+        if route_class is not None:
+            return len(self._waiters[route_class.name])
+        return sum(len(w) for w in self._waiters.values())
+
+    def _has_capacity(self, route_class: RouteClass) -> bool:
+        return (
+            self.in_flight < self.max_concurrent
+            and self._class_in_flight[route_class.name] < route_class.max_concurrent
+        )
+
+    def _can_start(self, route_class: RouteClass) -> bool:
+        if not self._has_capacity(route_class):
+            return False
+        # Don't overtake waiters of the same or higher priority that could run
+        for other in self._by_priority:
+            if other.priority > route_class.priority:
+                break
+            if self._waiters[other.name] and self._has_capacity(other):
+                return False
+        return True
+
+    def _start(self, route_class: RouteClass) -> None:
+        self.in_flight += 1
+        self._class_in_flight[route_class.name] += 1
+
+    async def acquire(self, route_class: RouteClass) -> bool:
+        """Wait for a slot; False means the request should be shed."""
+        if self._can_start(route_class):
+            self._start(route_class)
+            return True
+
+        waiters = self._waiters[route_class.name]
+        overloaded = (
+            route_class.latency_threshold is not None
+            and self.avg_latency > route_class.latency_threshold
+        )
+        if len(waiters) >= route_class.max_queue or overloaded:
+            self.shed_count += 1
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        try:
+            await asyncio.wait_for(future, route_class.max_wait)
+            return True
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Slot was handed over just as we gave up
+                return True
+            if future in waiters:
+                waiters.remove(future)
+            self.shed_count += 1
+            return False
+
+    def release(self, route_class: RouteClass, latency: float) -> None:
+        self.in_flight -= 1
+        self._class_in_flight[route_class.name] -= 1
+        self.avg_latency += self.EWMA_WEIGHT * (latency - self.avg_latency)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        for route_class in self._by_priority:
+            waiters = self._waiters[route_class.name]
+            while waiters and self._has_capacity(route_class):
+                future = waiters.popleft()
+                if future.done():
+                    continue
+                self._start(route_class)
+                future.set_result(True)
+            if self.in_flight >= self.max_concurrent:
+                return
+
+
+class AdmissionMiddleware:
+    """Applies an AdmissionController to every HTTP request, answering 503 + Retry-After when shed."""
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or AdmissionController()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.controller.is_exempt(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        route_class = self.controller.classify(scope["method"], scope["path"])
+        if not await self.controller.acquire(route_class):
+            await _send_overloaded(send, route_class)
+            return
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route_class, time.monotonic() - started)
+
+
+async def _send_overloaded(send, route_class: RouteClass) -> None:
+    body = OVERLOADED_BODY
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(route_class.retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
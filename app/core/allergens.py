@@ -0,0 +1,63 @@
+# app/core/allergens.py
+
+from __future__ import annotations
+
+from typing import Iterable, List
+
+# Bit i of an item's allergen_mask stands for ALLERGENS[i]. Stored masks
+# depend on these positions: only ever append.
+ALLERGENS = (
+    "gluten",
+    "dairy",
+    "eggs",
+    "nuts",
+    "peanuts",
+    "soy",
+    "fish",
+    "shellfish",
+    "sesame",
+    "celery",
+    "mustard",
+    "sulphites",
+    "lupin",
+    "molluscs",
+)
+
+ALIASES = {
+    "wheat": "gluten",
+    "milk": "dairy",
+    "lactose": "dairy",
+    "egg": "eggs",
+    "nut": "nuts",
+    "tree nuts": "nuts",
+    "peanut": "peanuts",
+    "soya": "soy",
+    "soybean": "soy",
+    "soybeans": "soy",
+    "crustaceans": "shellfish",
+    "sulfites": "sulphites",
+    "mollusks": "molluscs",
+}
+
+_BITS = {name: 1 << i for i, name in enumerate(ALLERGENS)}
+
+
+def normalize_allergen(name: str) -> str:
+    """Canonical vocabulary name for name; ValueError if it isn't an allergen we know"""
+    key = " ".join(name.strip().lower().replace("_", " ").replace("-", " ").split())
+    key = ALIASES.get(key, key)
+    if key not in _BITS:
+        raise ValueError(f"Unknown allergen: {name}")
+    return key
+
+
+def normalize_allergens(names: Iterable[str]) -> List[str]:
+    """Canonical names, in first-seen order without duplicates"""
+    return list(dict.fromkeys(normalize_allergen(n) for n in names))
+
+
+def allergen_mask(names: Iterable[str]) -> int:
+    mask = 0
+    for name in names:
+        mask |= _BITS[normalize_allergen(name)]
+    return mask
@@ -0,0 +1,178 @@
+# app/core/compression.py
+
+from __future__ import annotations
+
+import gzip
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+# Bodies smaller than this aren't worth compressing
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+# Per-request compression favours speed; cached variants are built once, so
+# they can afford the best ratio.
+FAST_LEVELS = {"gzip": 6, "br": 4}
+BEST_LEVELS = {"gzip": 9, "br": 11}
+
+
+def supported_encodings() -> tuple:
+    """Encodings this server can produce, in order of preference"""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best encoding the client accepts, or None for identity"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in supported_encodings():
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body: bytes, encoding: str, best: bool = False) -> bytes:
+    level = (BEST_LEVELS if best else FAST_LEVELS)[encoding]
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class StreamCompressor:
+    """Compresses a body in pieces, flushing each piece so it can go out right away."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=FAST_LEVELS["br"])
+        else:
+            self._compressor = zlib.compressobj(FAST_LEVELS["gzip"], zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def is_compressible(status: int, headers: Headers) -> bool:
+    if status < 200 or status in (204, 304):
+        return False
+    if "content-encoding" in headers:
+        # Already encoded, e.g. a precompressed cached variant
+        return False
+    content_type = headers.get("content-type", "")
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Content-negotiated gzip/brotli for responses of at least ``minimum_size`` bytes.
+
+    Responses that already carry a Content-Encoding are passed through, so
+    endpoints can serve precompressed variants themselves. Streaming
+    responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self._start = None
+        self._stream: Optional[StreamCompressor] = None
+        self._passthrough = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk shows how big the response is
+            self._start = message
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        if self._start is not None:
+            await self._send_first(message)
+        elif self._passthrough:
+            await self._send(message)
+        else:
+            more_body = message.get("more_body", False)
+            body = self._stream.compress(message.get("body", b""))
+            if not more_body:
+                body += self._stream.finish()
+            await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    async def _send_first(self, message):
+        start, self._start = self._start, None
+        start["headers"] = list(start.get("headers", []))
+        headers = MutableHeaders(raw=start["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if not is_compressible(start["status"], headers) or (not more_body and len(body) < self.minimum_size):
+            self._passthrough = True
+            await self._send(start)
+            await self._send(message)
+            return
+
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if not more_body:
+            body = compress(body, self.encoding)
+            headers["Content-Length"] = str(len(body))
+            await self._send(start)
+            await self._send({"type": "http.response.body", "body": body})
+            return
+
+        if "content-length" in headers:
+            del headers["content-length"]
+        self._stream = StreamCompressor(self.encoding)
+        await self._send(start)
+        await self._send({
+            "type": "http.response.body",
+            "body": self._stream.compress(body),
+            "more_body": True,
+        })
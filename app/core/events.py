@@ -0,0 +1,54 @@
+# app/core/events.py
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Dict, Tuple
+
+
+class EventBroker:
+    """Fans events out to asyncio subscribers in this process.
+
+    ``publish()`` may be called from any thread (sync endpoints run in a
+    threadpool); each subscriber gets the event on its own loop. Queues are
+    bounded: a subscriber that falls behind loses its oldest events rather
+    than holding up the publisher.
+    """
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self._subscribers: Dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> asyncio.Queue:
+        """Register a queue on the running loop; call from async code"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: Any) -> None:
+        with self._lock:
+            subscribers: Tuple[Tuple[asyncio.Queue, asyncio.AbstractEventLoop], ...] = tuple(
+                self._subscribers.items()
+            )
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(_put_latest, queue, event)
+            except RuntimeError:
+                # The subscriber's loop has closed
+                self.unsubscribe(queue)
+
+
+def _put_latest(queue: asyncio.Queue, event: Any) -> None:
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
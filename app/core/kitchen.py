@@ -0,0 +1,114 @@
+# app/core/kitchen.py
+
+from __future__ import annotations
+
+import heapq
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+
+@dataclass
+class KitchenTicket:
+    order_id: int
+    minutes: float
+    started_at: Optional[datetime] = None
+    eta: Optional[datetime] = None
+
+
+class KitchenScheduler:
+    """In-memory model of the kitchen queue used to estimate ready times.
+
+    Orders are worked first-in first-out across ``stations`` parallel
+    stations. A heap holds the time each station frees up, so queueing a new
+    order at the tail costs O(log stations). When the queue shifts (an order
+    starts early, finishes or is cancelled) the tickets behind it are
+    re-estimated and only the ETAs that moved are returned.
+    """
+
+    def __init__(self, stations: int = 1):
+        self.stations = max(1, int(stations))
+        self._tickets: Dict[int, KitchenTicket] = {}
+        self._free_at: List[datetime] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tickets)
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._tickets
+
+    def eta(self, order_id: int) -> Optional[datetime]:
+        ticket = self._tickets.get(order_id)
+        return ticket.eta if ticket else None
+
+    def enqueue(self, order_id: int, minutes: float, now: datetime) -> datetime:
+        """Queue an order behind everything already in the kitchen."""
+        with self._lock:
+            if not self._free_at:
+                self._free_at = [now] * self.stations
+            ticket = KitchenTicket(order_id=order_id, minutes=float(minutes))
+            self._tickets[order_id] = ticket
+            ticket.eta = self._assign(ticket, now)
+            return ticket.eta
+
+    def load(self, tickets: List[KitchenTicket], now: datetime) -> Dict[int, datetime]:
+        """Replace the queue with ``tickets`` (oldest first) and estimate all of them."""
+        with self._lock:
+            self._tickets = {t.order_id: t for t in tickets}
+            return self._rebuild(now)
+
+    def start(self, order_id: int, now: datetime) -> Dict[int, datetime]:
+        """Mark an order as being prepared; returns the ETAs that changed."""
+        return self.start_many([order_id], now)
+
+    def start_many(self, order_ids: Iterable[int], now: datetime) -> Dict[int, datetime]:
+        """Mark several orders as being prepared, re-estimating the queue once."""
+        with self._lock:
+            started = False
+            for order_id in order_ids:
+                ticket = self._tickets.get(order_id)
+                if ticket is not None and ticket.started_at is None:
+                    ticket.started_at = now
+                    started = True
+            return self._rebuild(now) if started else {}
+
+    def finish(self, order_id: int, now: datetime) -> Dict[int, datetime]:
+        """Drop a ready, completed or cancelled order; returns the ETAs that changed."""
+        return self.finish_many([order_id], now)
+
+    def finish_many(self, order_ids: Iterable[int], now: datetime) -> Dict[int, datetime]:
+        """Drop several orders, re-estimating the queue once."""
+        with self._lock:
+            removed = [self._tickets.pop(order_id, None) for order_id in order_ids]
+            if not any(removed):
+                return {}
+            return self._rebuild(now)
+
+    def _assign(self, ticket: KitchenTicket, now: datetime) -> datetime:
+        free = heapq.heappop(self._free_at)
+        if ticket.started_at is not None:
+            start = ticket.started_at
+        else:
+            start = max(free, now)
+        # An order running over its estimate is due "now", not in the past.
+        eta = max(start + timedelta(minutes=ticket.minutes), now)
+        heapq.heappush(self._free_at, max(free, eta))
+        return eta
+
+    def _rebuild(self, now: datetime) -> Dict[int, datetime]:
+        self._free_at = [now] * self.stations
+        started = sorted(
+            (t for t in self._tickets.values() if t.started_at is not None),
+            key=lambda t: t.started_at,
+        )
+        waiting = [t for t in self._tickets.values() if t.started_at is None]
+
+        changed = {}
+        for ticket in started + waiting:
+            eta = self._assign(ticket, now)
+            if eta != ticket.eta:
+                ticket.eta = eta
+                changed[ticket.order_id] = eta
+        return changed
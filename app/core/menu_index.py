@@ -0,0 +1,95 @@
+# app/core/menu_index.py
+
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.core.models import CafeteriaItem
+
+# effective_price is the price after the discounts the index is built with
+SORT_FIELDS = ("id", "name", "price", "effective_price", "calories", "preparation_time", "rating")
+RANGE_FIELDS = ("price", "effective_price", "calories", "preparation_time")
+
+
+class MenuIndex:
+    """Immutable snapshot of the menu with one sorted array per sortable field.
+
+    Range filters are two bisects per field and sorting is a walk over a
+    presorted array, so browsing a large menu page by page doesn't sort or
+    scan it per request. Items without a value for a field (e.g. no
+    calories) never match a range on it and sort after those that have one.
+    """
+
+    def __init__(
+        self,
+        items: List[CafeteriaItem],
+        discounts: Optional[Dict[int, float]] = None,
+        version: Hashable = None,
+    ):
+        discounts = discounts or {}
+        self.version = version
+        self.items: Dict[int, CafeteriaItem] = {item.id: item for item in items}
+        self._dicts: Dict[int, dict] = {}
+        values: Dict[str, Callable[[CafeteriaItem], Any]] = {
+            "id": lambda it: it.id,
+            "name": lambda it: it.name.casefold(),
+            "price": lambda it: it.price,
+            "effective_price": lambda it: round(it.price * (1 - discounts.get(it.id, 0.0) / 100), 2),
+            "calories": lambda it: it.calories,
+            "preparation_time": lambda it: it.preparation_time,
+            "rating": lambda it: it.rating_avg,
+        }
+        self._keys: Dict[str, list] = {}
+        self._ids: Dict[str, List[int]] = {}
+        for field, value in values.items():
+            pairs = sorted((value(it), it.id) for it in items if value(it) is not None)
+            self._keys[field] = [v for v, _ in pairs]
+            self._ids[field] = [iid for _, iid in pairs]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def in_range(self, field: str, low: Optional[float] = None, high: Optional[float] = None) -> List[int]:
+        """Ids with low <= value <= high, in ascending order of the field"""
+        keys = self._keys[field]
+        start = 0 if low is None else bisect_left(keys, low)
+        end = len(keys) if high is None else bisect_right(keys, high)
+        return self._ids[field][start:end]
+
+    def ordered(self, field: str, descending: bool = False) -> List[int]:
+        ids = self._ids[field][::-1] if descending else self._ids[field]
+        if len(ids) == len(self.items):
+            return ids
+        present = set(ids)
+        return ids + [iid for iid in self.items if iid not in present]
+
+    def as_dict(self, item_id: int) -> dict:
+        d = self._dicts.get(item_id)
+        if d is None:
+            d = self._dicts.setdefault(item_id, self.items[item_id].to_dict())
+        return d
+
+    def query(
+        self,
+        ranges: Dict[str, Tuple[Optional[float], Optional[float]]],
+        where: Optional[Callable[[CafeteriaItem], bool]] = None,
+        sort: str = "id",
+        descending: bool = False,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> Tuple[int, List[dict]]:
+        """(number of matches, the requested page of them as item dicts)"""
+        candidates = None
+        for field, (low, high) in ranges.items():
+            if low is None and high is None:
+                continue
+            ids = set(self.in_range(field, low, high))
+            candidates = ids if candidates is None else candidates & ids
+        matches = [
+            iid for iid in self.ordered(sort, descending)
+            if (candidates is None or iid in candidates)
+            and (where is None or where(self.items[iid]))
+        ]
+        page = matches[offset:] if limit is None else matches[offset:offset + limit]
+        return len(matches), [self.as_dict(iid) for iid in page]
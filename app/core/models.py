@@ -29,6 +29,8 @@ class CafeteriaItem:
     discount_percentage: float = 0.0
     calories: Optional[int] = None
     preparation_time: Optional[int] = None  # in minutes
+    low_stock_threshold: int = 5  # fewer units than this raises a low-stock alert
+    allergen_mask: int = 0  # bit per allergen in app.core.allergens.ALLERGENS; not serialized
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -50,6 +52,7 @@ class CafeteriaItem:
             "discount_percentage": self.discount_percentage,
             "calories": self.calories,
             "preparation_time": self.preparation_time,
+            "low_stock_threshold": self.low_stock_threshold,
         }
 
     @classmethod
@@ -73,6 +76,8 @@ class CafeteriaItem:
             discount_percentage=float(d.get("discount_percentage", 0.0)),
             calories=d.get("calories"),
             preparation_time=d.get("preparation_time"),
+            low_stock_threshold=int(d.get("low_stock_threshold", 5)),
+            allergen_mask=int(d.get("allergen_mask", 0)),
         )
 
 
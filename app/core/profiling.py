@@ -0,0 +1,287 @@
+# app/core/profiling.py
+
+from __future__ import annotations
+
+import cProfile
+import functools
+import hmac
+import inspect
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+# Requests carrying "X-Profile: 1" and "X-Admin-Token: <ADMIN_TOKEN>" are
+# profiled; without ADMIN_TOKEN set, only sampling can turn profiling on.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_TOP_FUNCTIONS = 40
+
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+class RequestProfile:
+    """What one profiled request did: its CPU profile and the Mongo commands it issued."""
+
+    def __init__(self, method: str, path: str):
+        self.started_at = datetime.utcnow()
+        # Sorts by time, which is how ProfileStore decides what to rotate out
+        self.id = f"{self.started_at:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.status: Optional[int] = None
+        self.duration_ms = 0.0
+        self.stats: Optional[pstats.Stats] = None
+        self.commands: List[dict] = []
+        self._pending: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+
+    def add_stats(self, profiler: cProfile.Profile) -> None:
+        with self._lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profiler)
+            else:
+                self.stats.add(profiler)
+
+    def command_started(self, event) -> None:
+        target = event.command.get(event.command_name)
+        with self._lock:
+            self._pending[event.request_id] = {
+                "command": event.command_name,
+                "collection": target if isinstance(target, str) else None,
+                "started": time.perf_counter(),
+            }
+
+    def command_finished(self, event, ok: bool) -> None:
+        with self._lock:
+            entry = self._pending.pop(event.request_id, None)
+            if entry is None:
+                return
+            started = entry.pop("started")
+            entry["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            entry["ok"] = ok
+            self.commands.append(entry)
+
+    def summary(self) -> dict:
+        by_command: Dict[str, dict] = {}
+        for c in self.commands:
+            key = f"{c['command']} {c['collection'] or ''}".strip()
+            row = by_command.setdefault(key, {"command": key, "count": 0, "total_ms": 0.0})
+            row["count"] += 1
+            row["total_ms"] = round(row["total_ms"] + c["duration_ms"], 3)
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_ms, 3),
+            "mongo": {
+                "count": len(self.commands),
+                "total_ms": round(sum(c["duration_ms"] for c in self.commands), 3),
+                "by_command": sorted(by_command.values(), key=lambda r: r["total_ms"], reverse=True),
+                "commands": self.commands,
+            },
+        }
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+# cProfile can't nest on one thread (e.g. two profiled async requests on the loop)
+_thread_state = threading.local()
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+class MongoCommandRecorder(monitoring.CommandListener):
+    """Attributes every Mongo command to the profiled request it was issued from, if any"""
+
+    def started(self, event):
+        profile = _current.get()
+        if profile is not None:
+            profile.command_started(event)
+
+    def succeeded(self, event):
+        profile = _current.get()
+        if profile is not None:
+            profile.command_finished(event, ok=True)
+
+    def failed(self, event):
+        profile = _current.get()
+        if profile is not None:
+            profile.command_finished(event, ok=False)
+
+
+def _start_profiler() -> Optional[cProfile.Profile]:
+    if _current.get() is None or getattr(_thread_state, "active", False):
+        return None
+    profiler = cProfile.Profile()
+    _thread_state.active = True
+    profiler.enable()
+    return profiler
+
+
+def _stop_profiler(profiler: Optional[cProfile.Profile]) -> None:
+    if profiler is None:
+        return
+    profiler.disable()
+    _thread_state.active = False
+    _current.get().add_stats(profiler)
+
+
+def profiled(endpoint):
+    """Wrap an endpoint so it runs under cProfile when its request is being profiled.
+
+    Sync endpoints are wrapped as sync functions, so the profiler runs in
+    the threadpool thread that actually executes them.
+    """
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            profiler = _start_profiler()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _stop_profiler(profiler)
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profiler = _start_profiler()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            _stop_profiler(profiler)
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute whose endpoint can be profiled per request"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, profiled(endpoint), **kwargs)
+
+
+class ProfileStore:
+    """Profiles on disk: <id>.json (summary, top functions) and <id>.prof (pstats), newest kept."""
+
+    _ID = re.compile(r"^[0-9T]+-[0-9a-f]{8}$")
+
+    def __init__(self, directory: str = PROFILE_DIR, keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def path(self, profile_id: str, ext: str) -> Optional[str]:
+        if not self._ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.{ext}")
+        return path if os.path.exists(path) else None
+
+    def save(self, profile: RequestProfile) -> None:
+        summary = profile.summary()
+        if profile.stats is not None:
+            out = io.StringIO()
+            profile.stats.stream = out
+            profile.stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+            summary["top_functions"] = out.getvalue()
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if profile.stats is not None:
+                profile.stats.dump_stats(os.path.join(self.directory, f"{profile.id}.prof"))
+            with open(os.path.join(self.directory, f"{profile.id}.json"), "w") as f:
+                json.dump(summary, f)
+            self._rotate()
+
+    def _rotate(self) -> None:
+        ids = sorted(n[:-5] for n in os.listdir(self.directory) if n.endswith(".json"))
+        for old in ids[:-self.keep] if self.keep > 0 else ids:
+            for ext in ("json", "prof"):
+                try:
+                    os.remove(os.path.join(self.directory, f"{old}.{ext}"))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> List[dict]:
+        """Summaries of stored profiles, newest first, without per-command detail"""
+        if not os.path.isdir(self.directory):
+            return []
+        out = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if not name.endswith(".json"):
+                continue
+            summary = self.get(name[:-5])
+            if summary is None:
+                continue
+            summary.pop("top_functions", None)
+            summary["mongo"].pop("commands", None)
+            out.append(summary)
+        return out
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        path = self.path(profile_id, "json")
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+profile_store = ProfileStore()
+
+
+class ProfilingMiddleware:
+    """Profiles requests asked for by an admin (X-Profile + X-Admin-Token) or picked by sampling."""
+
+    def __init__(self, app, store: ProfileStore = profile_store, sample_rate: float = PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.store = store
+        self.sample_rate = sample_rate
+
+    def _wanted(self, scope) -> bool:
+        headers = Headers(scope=scope)
+        if headers.get("x-profile") and is_admin(headers.get("x-admin-token")):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        token = _current.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration_ms = (time.perf_counter() - started) * 1000
+            _current.reset(token)
+            await run_in_threadpool(self.store.save, profile)
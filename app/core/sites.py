@@ -0,0 +1,82 @@
+# app/core/sites.py
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+
+# Requests without X-Site-Id (or ?site=) belong to this site, and so does
+# every document written before sites existed.
+DEFAULT_SITE_ID = os.getenv("DEFAULT_SITE_ID", "main")
+# Comma-separated sites served besides the default one. Workers keep state
+# per site (kitchen queues, caches, invalidation subscribers) for as long as
+# they run, so ids outside this list are rejected rather than given their own.
+SITES = list(dict.fromkeys(
+    [DEFAULT_SITE_ID] + [s.strip().lower() for s in os.getenv("SITES", "").split(",") if s.strip()]
+))
+
+_SITE_ID = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+
+_current: ContextVar[str] = ContextVar("site_id", default=DEFAULT_SITE_ID)
+
+
+def normalize_site_id(value: str) -> str:
+    """Lowercased site id; ValueError if it isn't one we serve"""
+    site = value.strip().lower()
+    if not _SITE_ID.match(site):
+        raise ValueError(f"Invalid site id: {value}")
+    if site not in SITES:
+        raise ValueError(f"Unknown site: {value}")
+    return site
+
+
+def current_site() -> str:
+    return _current.get()
+
+
+@contextmanager
+def use_site(site_id: Optional[str]) -> Iterator[str]:
+    """Run a block (e.g. a background task) as ``site_id``"""
+    token = _current.set(site_id or DEFAULT_SITE_ID)
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+class SiteMiddleware:
+    """Sets the request's site from the X-Site-Id header or the ``site`` query parameter."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        raw = Headers(scope=scope).get("x-site-id")
+        if raw is None:
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            raw = query.get("site", [None])[0]
+        try:
+            site = normalize_site_id(raw) if raw else DEFAULT_SITE_ID
+        except ValueError as e:
+            body = json.dumps({"detail": str(e)}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 400,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        with use_site(site):
+            await self.app(scope, receive, send)
@@ -0,0 +1,180 @@
+# app/core/traffic.py
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import time
+from typing import Iterable, List, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers
+
+# Off unless TRAFFIC_CAPTURE_RATE > 0. Each worker writes its own
+# traffic-<pid>.jsonl in TRAFFIC_CAPTURE_DIR; replay_traffic.py merges them.
+TRAFFIC_CAPTURE_RATE = float(os.getenv("TRAFFIC_CAPTURE_RATE", "0"))
+TRAFFIC_CAPTURE_DIR = os.getenv("TRAFFIC_CAPTURE_DIR", "traffic")
+TRAFFIC_CAPTURE_MAX_MB = float(os.getenv("TRAFFIC_CAPTURE_MAX_MB", "50"))
+TRAFFIC_CAPTURE_FILES = int(os.getenv("TRAFFIC_CAPTURE_FILES", "5"))
+TRAFFIC_SCRUB_FIELDS = [
+    f.strip() for f in os.getenv("TRAFFIC_SCRUB_FIELDS", "customer_id,notes").split(",") if f.strip()
+]
+# Streams never finish, so there's nothing useful to record or replay
+TRAFFIC_CAPTURE_EXCLUDE = os.getenv("TRAFFIC_CAPTURE_EXCLUDE", r"/stream$|^/api/admin/profiles")
+
+MAX_BODY_BYTES = 64 * 1024
+# Only these headers are recorded; tokens and cookies never are
+RECORDED_HEADERS = ("content-type", "accept", "accept-encoding", "if-none-match", "idempotency-key", "x-site-id")
+
+
+def scrub_value(value) -> str:
+    """Stable pseudonym, so one customer stays one customer in a replay"""
+    return "s-" + hashlib.sha256(str(value).encode()).hexdigest()[:10]
+
+
+def scrub(data, fields: Iterable[str]):
+    """Copy of a JSON value with every key in ``fields`` replaced by its pseudonym, at any depth"""
+    fields = set(fields)
+    if isinstance(data, dict):
+        return {
+            k: (scrub_value(v) if k in fields and v is not None else scrub(v, fields))
+            for k, v in data.items()
+        }
+    if isinstance(data, list):
+        return [scrub(v, fields) for v in data]
+    return data
+
+
+def scrub_query(query: str, fields: Iterable[str]) -> str:
+    fields = set(fields)
+    pairs = parse_qsl(query, keep_blank_values=True)
+    return urlencode([(k, scrub_value(v) if k in fields else v) for k, v in pairs])
+
+
+def _capture_logger(directory: str, max_mb: float, files: int) -> logging.Logger:
+    """A logger whose records are written, rotated, by a background thread"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"traffic-{os.getpid()}.jsonl")
+    handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=int(max_mb * 1024 * 1024), backupCount=files, encoding="utf-8"
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    records: queue.Queue = queue.Queue(maxsize=10000)
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+
+    # Not registered with logging, so app log config can't reroute captured traffic
+    logger = logging.Logger(f"{__name__}.capture", logging.INFO)
+    logger.addHandler(_DroppingQueueHandler(records))
+    return logger
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the writer falls behind"""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+class TrafficCaptureMiddleware:
+    """Records a sample of requests as JSON lines for replay_traffic.py.
+
+    A line holds the wall-clock start time (so replays keep the original
+    spacing), method, path, scrubbed query and body, the allowed headers,
+    and the status and server time of the response. Writing happens on a
+    background thread; if it can't keep up, lines are dropped.
+    """
+
+    def __init__(
+        self,
+        app,
+        sample_rate: float = TRAFFIC_CAPTURE_RATE,
+        directory: str = TRAFFIC_CAPTURE_DIR,
+        max_mb: float = TRAFFIC_CAPTURE_MAX_MB,
+        files: int = TRAFFIC_CAPTURE_FILES,
+        scrub_fields: Optional[List[str]] = None,
+        exclude: str = TRAFFIC_CAPTURE_EXCLUDE,
+    ):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.scrub_fields = TRAFFIC_SCRUB_FIELDS if scrub_fields is None else scrub_fields
+        self.exclude = re.compile(exclude) if exclude else None
+        self.directory = directory
+        self.max_mb = max_mb
+        self.files = files
+        self._logger: Optional[logging.Logger] = None
+
+    @property
+    def logger(self) -> logging.Logger:
+        if self._logger is None:
+            self._logger = _capture_logger(self.directory, self.max_mb, self.files)
+        return self._logger
+
+    def _body(self, chunks: List[bytes], content_type: str):
+        raw = b"".join(chunks)
+        if not raw:
+            return None
+        if len(raw) > MAX_BODY_BYTES:
+            return {"truncated": True}
+        if "json" in content_type:
+            try:
+                return {"json": scrub(json.loads(raw), self.scrub_fields)}
+            except ValueError:
+                pass
+        return {"text": raw.decode("utf-8", "replace")}
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or self.sample_rate <= 0
+            or random.random() >= self.sample_rate
+            or (self.exclude is not None and self.exclude.search(scope["path"]))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        chunks: List[bytes] = []
+        size = 0
+        status = None
+
+        async def receive_wrapper():
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request" and size <= MAX_BODY_BYTES:
+                body = message.get("body", b"")
+                size += len(body)
+                chunks.append(body)
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        ts = time.time()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            query = scope.get("query_string", b"").decode("latin-1")
+            self.logger.info(json.dumps({
+                "ts": round(ts, 6),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scrub_query(query, self.scrub_fields) if query else "",
+                "headers": {h: headers[h] for h in RECORDED_HEADERS if h in headers},
+                "body": self._body(chunks, headers.get("content-type", "")),
+                "status": status,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            }, separators=(",", ":")))
@@ -0,0 +1,92 @@
+# app/core/write_behind.py
+
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class CoalescingBuffer:
+    """Accumulates (sum, count) per key until it is drained and written out.
+
+    A drained batch stays visible through ``pending()`` until ``commit()``
+    confirms it was persisted (or ``restore()`` puts it back), so readers
+    never miss values that are mid-flush. Readers that combine persisted
+    values with pending ones use ``read()``, which keeps their load from
+    overlapping the write of a batch.
+    """
+
+    def __init__(self, max_pending: int = 500):
+        self.max_pending = max_pending
+        self._pending: Dict[Hashable, Tuple[float, int]] = {}
+        self._in_flight: Dict[Hashable, Tuple[float, int]] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._written = threading.Condition(self._lock)
+        # A drained batch is being written; bumped every time one is done
+        self._writing = False
+        self._flushes = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, key: Hashable, value: float) -> bool:
+        """Buffer one value; True means the size threshold was reached."""
+        with self._lock:
+            total, count = self._pending.get(key, (0.0, 0))
+            self._pending[key] = (total + value, count + 1)
+            self._size += 1
+            return self._size >= self.max_pending
+
+    def pending(self, key: Hashable) -> Tuple[float, int]:
+        with self._lock:
+            total, count = self._pending.get(key, (0.0, 0))
+            flushing_total, flushing_count = self._in_flight.get(key, (0.0, 0))
+            return total + flushing_total, count + flushing_count
+
+    def read(self, load: Callable[[], T]) -> Tuple[T, Dict[Hashable, Tuple[float, int]]]:
+        """``load()`` (a read of the persisted values) and the pending values as of the same moment.
+
+        load never overlaps the write of a drained batch (it waits for it,
+        or runs again if one started meanwhile), so the batch is counted
+        either in what load read or in the pending values, never both.
+        """
+        while True:
+            with self._written:
+                while self._writing:
+                    self._written.wait()
+                flushes = self._flushes
+            result = load()
+            with self._lock:
+                if not self._writing and self._flushes == flushes:
+                    return result, dict(self._pending)
+
+    def drain(self) -> Dict[Hashable, Tuple[float, int]]:
+        with self._lock:
+            if self._in_flight:
+                raise RuntimeError("previous batch was neither committed nor restored")
+            batch, self._pending, self._size = self._pending, {}, 0
+            self._in_flight = batch
+            self._writing = bool(batch)
+            return dict(batch)
+
+    def _done(self) -> None:
+        self._in_flight = {}
+        self._writing = False
+        self._flushes += 1
+        self._written.notify_all()
+
+    def commit(self) -> None:
+        with self._lock:
+            self._done()
+
+    def restore(self) -> None:
+        """Put a batch that failed to persist back in front of newer values."""
+        with self._lock:
+            for key, (total, count) in self._in_flight.items():
+                pending_total, pending_count = self._pending.get(key, (0.0, 0))
+                self._pending[key] = (total + pending_total, count + pending_count)
+                self._size += count
+            self._done()
@@ -1,30 +1,142 @@
 
-from typing import Optional, List
-from datetime import datetime
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel, Field
-
+import asyncio
+import hashlib
+import json
+import os
+from typing import Optional, List, Type
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, TypeAdapter, create_model
+
+from app.core.allergens import ALLERGENS, allergen_mask
+from app.core.cache import TTLCache, VersionedCache
+from app.core.menu_index import RANGE_FIELDS, SORT_FIELDS
+from app.core.profiling import ProfiledRoute, is_admin, profile_store
+from app.core.sites import current_site
+from app.fastapi_responses import EncodedPayload, PreEncodedJSONResponse, dumps, payload_response
 from app.storage.mongo_repo import (
-    list_items,
+    list_menu_items,
     get_item_by_id,
+    find_item_docs,
+    get_item_facets,
+    get_menu_index,
+    list_categories,
+    get_item_doc,
     add_item,
     update_item,
     delete_item,
     add_rating,
     get_top_rated_items,
     create_order,
+    begin_idempotent_request,
+    complete_idempotent_request,
+    abort_idempotent_request,
+    IdempotencyKeyConflict,
+    rate_order,
+    OrderAlreadyRated,
     list_orders,
     get_order_by_id,
     update_order_status,
+    update_order_statuses,
+    get_order_status_history,
+    archive_orders,
+    ORDER_ARCHIVE_AFTER_DAYS,
     get_top_selling_items,
+    get_sales_rollups,
+    backfill_sales_rollups,
+    get_dashboard_snapshot,
+    get_stock_alerts,
+    get_task_stats,
+    stock_events,
     add_favorite,
     remove_favorite,
     get_favorites,
     get_daily_specials,
+    todays_specials,
+    apply_specials,
+    list_specials,
+    add_special,
+    delete_special,
+    get_menu_version,
+    slow_queries,
 )
 
-router = APIRouter(prefix="/api", tags=["items"])
+router = APIRouter(prefix="/api", tags=["items"], route_class=ProfiledRoute)
+
+# Encoded menu payloads, reused until the menu version moves. Like the
+# dashboard cache below, keys start with the site the payload belongs to.
+_payload_cache = VersionedCache()
+
+# Dashboard snapshots, shared by every admin session for a few seconds.
+DASHBOARD_TTL_SECONDS = float(os.getenv("DASHBOARD_TTL_SECONDS", "5"))
+_dashboard_cache = TTLCache(ttl=DASHBOARD_TTL_SECONDS)
+
+
+def _cached_json(request: Request, key: tuple, build, encode=dumps):
+    payload = _payload_cache.get(
+        (current_site(),) + key, get_menu_version(), lambda: EncodedPayload(encode(build()))
+    )
+    return payload_response(payload, request)
+
+
+def _cached_json_ttl(request: Request, key: tuple, build):
+    payload = _dashboard_cache.get((current_site(),) + key, lambda: EncodedPayload(dumps(build())))
+    return payload_response(payload, request)
+
+
+def _paged_items(request: Request, key: tuple, query, encode):
+    """Serve one page of a MenuIndex query, with the number of matches in X-Total-Count"""
+    index = get_menu_index()
 
+    def build():
+        total, docs = query(index)
+        return total, EncodedPayload(encode(docs))
+
+    total, payload = _payload_cache.get((current_site(),) + key, index.version, build)
+    return payload_response(payload, request, headers={"X-Total-Count": str(total)})
+
+
+def _parse_fields(fields: Optional[str], model: Type[BaseModel]) -> Optional[List[str]]:
+    """Turn ?fields=a,b into a validated field list (id is always included)"""
+    if fields is None:
+        return None
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(["id"] + names))
+
+
+@lru_cache(maxsize=128)
+def _sparse_adapter(model: Type[BaseModel], fields: tuple, many: bool) -> TypeAdapter:
+    """Serializer for a trimmed copy of model holding only fields"""
+    trimmed = create_model(
+        f"{model.__name__}Sparse",
+        **{f: (model.model_fields[f].annotation, model.model_fields[f]) for f in fields},
+    )
+    return TypeAdapter(List[trimmed] if many else trimmed)
+
+
+def _sparse_encoder(model: Type[BaseModel], fields: List[str], many: bool = False):
+    adapter = _sparse_adapter(model, tuple(fields), many)
+    return lambda content: adapter.dump_json(adapter.validate_python(content))
+
+
+def _parse_allergens(value: Optional[str]) -> int:
+    """Turn ?exclude_allergens=gluten,dairy into an allergen bitmask"""
+    if not value:
+        return 0
+    try:
+        return allergen_mask(a for a in value.split(",") if a.strip())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _sparse_json(model: Type[BaseModel], fields: List[str], content, many: bool = False) -> PreEncodedJSONResponse:
+    return PreEncodedJSONResponse(_sparse_encoder(model, fields, many)(content))
 
 
 class ItemBase(BaseModel):
@@ -43,6 +155,7 @@ class ItemBase(BaseModel):
     discount_percentage: float = 0.0
     calories: Optional[int] = None
     preparation_time: Optional[int] = None
+    low_stock_threshold: Optional[int] = Field(None, ge=0)
 
 
 class ItemOut(ItemBase):
@@ -67,43 +180,141 @@ class ItemUpdate(BaseModel):
     discount_percentage: Optional[float] = None
     calories: Optional[int] = None
     preparation_time: Optional[int] = None
+    low_stock_threshold: Optional[int] = Field(None, ge=0)
 
 
 @router.get("/items", response_model=List[ItemOut])
 def get_items(
+    request: Request,
     available: Optional[bool] = None,
     category: Optional[str] = None,
     vegetarian: Optional[bool] = Query(None, description="Filter vegetarian items"),
     vegan: Optional[bool] = Query(None, description="Filter vegan items"),
     gluten_free: Optional[bool] = Query(None, description="Filter gluten-free items"),
     daily_special: Optional[bool] = Query(None, description="Filter daily specials"),
+    exclude_allergens: Optional[str] = Query(None, description="Comma-separated allergens to leave out"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_effective_price: Optional[float] = Query(None, description="Price after today's discount"),
+    max_effective_price: Optional[float] = Query(None, description="Price after today's discount"),
+    min_calories: Optional[int] = None,
+    max_calories: Optional[int] = None,
+    min_preparation_time: Optional[int] = None,
+    max_preparation_time: Optional[int] = None,
+    sort: Optional[str] = Query(None, description=f"One of {', '.join(SORT_FIELDS)}"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    offset: int = Query(0, ge=0),
 ):
     """Get all items with optional filters"""
-    items = [item.to_dict() for item in list_items()]
-    
-    if available is not None:
-        items = [it for it in items if it["available"] == available]
-    if category is not None:
-        items = [it for it in items if it["category"] == category]
-    if vegetarian is True:
-        items = [it for it in items if it["is_vegetarian"]]
-    if vegan is True:
-        items = [it for it in items if it["is_vegan"]]
-    if gluten_free is True:
-        items = [it for it in items if it["is_gluten_free"]]
-    if daily_special is True:
-        items = [it for it in items if it["is_daily_special"]]
+    field_list = _parse_fields(fields, ItemOut)
+    excluded = _parse_allergens(exclude_allergens)
+    # Payloads carry today's specials, so they change with them as well as with the menu
+    key = (
+        "items", todays_specials()["key"],
+        available, category, vegetarian, vegan, gluten_free, daily_special, excluded,
+    )
     
-    return items
+    ranges = {
+        "price": (min_price, max_price),
+        "effective_price": (min_effective_price, max_effective_price),
+        "calories": (min_calories, max_calories),
+        "preparation_time": (min_preparation_time, max_preparation_time),
+    }
+    if sort is not None or limit is not None or offset or any(v is not None for r in ranges.values() for v in r):
+        if sort is not None and sort not in SORT_FIELDS:
+            raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORT_FIELDS)}")
+
+        def where(item):
+            return (
+                (available is None or item.available == available)
+                and (category is None or item.category == category)
+                and (vegetarian is not True or item.is_vegetarian)
+                and (vegan is not True or item.is_vegan)
+                and (gluten_free is not True or item.is_gluten_free)
+                and (daily_special is not True or item.is_daily_special)
+                and not item.allergen_mask & excluded
+            )
+
+        return _paged_items(
+            request,
+            key + (tuple(ranges[f] for f in RANGE_FIELDS), sort, order, limit, offset, tuple(field_list or ())),
+            lambda index: index.query(
+                ranges, where, sort=sort or "id", descending=order == "desc", offset=offset, limit=limit,
+            ),
+            _sparse_encoder(ItemOut, field_list, many=True) if field_list is not None else dumps,
+        )
+
+    if field_list is not None:
+        return _cached_json(
+            request,
+            key + (tuple(field_list),),
+            lambda: find_item_docs(
+                field_list, available, category, vegetarian, vegan, gluten_free, daily_special, excluded,
+            ),
+            _sparse_encoder(ItemOut, field_list, many=True),
+        )
+
+    def build():
+        items = [item.to_dict() for item in list_menu_items() if not item.allergen_mask & excluded]
+        
+        if available is not None:
+            items = [it for it in items if it["available"] == available]
+        if category is not None:
+            items = [it for it in items if it["category"] == category]
+        if vegetarian is True:
+            items = [it for it in items if it["is_vegetarian"]]
+        if vegan is True:
+            items = [it for it in items if it["is_vegan"]]
+        if gluten_free is True:
+            items = [it for it in items if it["is_gluten_free"]]
+        if daily_special is True:
+            items = [it for it in items if it["is_daily_special"]]
+        
+        return items
+
+    return _cached_json(request, key, build)
+
+
+@router.get("/items/facets")
+def get_facets(
+    request: Request,
+    available: Optional[bool] = None,
+    category: Optional[str] = None,
+    vegetarian: Optional[bool] = Query(None, description="Filter vegetarian items"),
+    vegan: Optional[bool] = Query(None, description="Filter vegan items"),
+    gluten_free: Optional[bool] = Query(None, description="Filter gluten-free items"),
+    daily_special: Optional[bool] = Query(None, description="Filter daily specials"),
+    exclude_allergens: Optional[str] = Query(None, description="Comma-separated allergens to leave out"),
+):
+    """Get item counts per category, dietary flag, allergen and availability"""
+    filters = (
+        available, category, vegetarian, vegan, gluten_free, daily_special,
+        _parse_allergens(exclude_allergens),
+    )
+    return _cached_json(
+        request, ("facets", todays_specials()["key"]) + filters, lambda: get_item_facets(*filters),
+    )
 
 
 @router.get("/items/{item_id}", response_model=ItemOut)
-def get_single_item(item_id: int):
+def get_single_item(
+    item_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+):
     """Get a single item by ID"""
+    field_list = _parse_fields(fields, ItemOut)
+    if field_list is not None:
+        doc = get_item_doc(item_id, field_list)
+        if doc is None:
+            raise HTTPException(status_code=404, detail="Item not found")
+        return _sparse_json(ItemOut, field_list, apply_specials(doc))
+
     item = get_item_by_id(item_id)
     if item is None:
         raise HTTPException(status_code=404, detail="Item not found")
-    return item.to_dict()
+    return apply_specials(item.to_dict())
 
 
 @router.post("/items", response_model=ItemOut, status_code=201)
@@ -112,23 +323,27 @@ def create_item(payload: ItemBase):
     if payload.price < 0 or payload.quantity < 0:
         raise HTTPException(status_code=400, detail="price and quantity must be non-negative")
 
-    item = add_item(
-        name=payload.name,
-        category=payload.category,
-        price=payload.price,
-        quantity=payload.quantity,
-        available=payload.available,
-        image_url=payload.image_url,
-        description=payload.description,
-        is_vegetarian=payload.is_vegetarian,
-        is_vegan=payload.is_vegan,
-        is_gluten_free=payload.is_gluten_free,
-        allergens=payload.allergens,
-        is_daily_special=payload.is_daily_special,
-        discount_percentage=payload.discount_percentage,
-        calories=payload.calories,
-        preparation_time=payload.preparation_time,
-    )
+    try:
+        item = add_item(
+            name=payload.name,
+            category=payload.category,
+            price=payload.price,
+            quantity=payload.quantity,
+            available=payload.available,
+            image_url=payload.image_url,
+            description=payload.description,
+            is_vegetarian=payload.is_vegetarian,
+            is_vegan=payload.is_vegan,
+            is_gluten_free=payload.is_gluten_free,
+            allergens=payload.allergens,
+            is_daily_special=payload.is_daily_special,
+            discount_percentage=payload.discount_percentage,
+            calories=payload.calories,
+            preparation_time=payload.preparation_time,
+            low_stock_threshold=payload.low_stock_threshold,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return item.to_dict()
 
 
@@ -153,6 +368,7 @@ def update_item_route(item_id: int, payload: ItemUpdate):
             discount_percentage=payload.discount_percentage,
             calories=payload.calories,
             preparation_time=payload.preparation_time,
+            low_stock_threshold=payload.low_stock_threshold,
         )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -194,9 +410,48 @@ def rate_item(item_id: int, payload: RatingIn):
 
 
 @router.get("/daily-specials", tags=["specials"])
-def daily_specials():
+def daily_specials(request: Request):
     """Get today's daily specials"""
-    return get_daily_specials()
+    return _cached_json(request, ("daily-specials", todays_specials()["key"]), get_daily_specials)
+
+
+class SpecialIn(BaseModel):
+    item_id: int
+    start_date: date
+    end_date: Optional[date] = None  # defaults to start_date (a one-day special)
+    discount_percentage: float = Field(0.0, ge=0, le=100)
+
+
+class SpecialOut(SpecialIn):
+    id: int
+    end_date: date
+
+
+@router.get("/admin/specials", response_model=List[SpecialOut], tags=["specials"])
+def get_specials_schedule(on: Optional[date] = Query(None, description="Only specials running on this day")):
+    """Get the specials schedule (admin)"""
+    return list_specials(on=on)
+
+
+@router.post("/admin/specials", response_model=SpecialOut, status_code=201, tags=["specials"])
+def schedule_special(payload: SpecialIn):
+    """Schedule an item as a special for a date range (admin)"""
+    try:
+        return add_special(
+            item_id=payload.item_id,
+            start_date=payload.start_date,
+            end_date=payload.end_date or payload.start_date,
+            discount_percentage=payload.discount_percentage,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/admin/specials/{special_id}", status_code=204, tags=["specials"])
+def unschedule_special(special_id: int):
+    """Remove a scheduled special (admin)"""
+    if not delete_special(special_id):
+        raise HTTPException(status_code=404, detail="Special not found")
 
 
 
@@ -222,7 +477,7 @@ def remove_from_favorites(item_id: int, customer_id: str = Query(..., descriptio
 def get_my_favorites(customer_id: str = Query(..., description="Customer ID")):
     """Get user's favorite items"""
     favorite_ids = get_favorites(customer_id)
-    items = [item.to_dict() for item in list_items() if item.id in favorite_ids]
+    items = [item.to_dict() for item in list_menu_items() if item.id in favorite_ids]
     return items
 
 
@@ -251,56 +506,154 @@ class OrderOut(BaseModel):
     estimated_ready_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
     notes: Optional[str] = None
+    rated_at: Optional[datetime] = None
+
+
+class OrderItemRatingIn(BaseModel):
+    item_id: int
+    rating: int = Field(..., ge=1, le=5)
+
+
+class OrderRatingsIn(BaseModel):
+    ratings: List[OrderItemRatingIn] = Field(..., min_length=1)
 
 
 class OrderStatusUpdate(BaseModel):
     status: str  # pending | preparing | ready | completed | cancelled
 
 
+class BulkStatusUpdate(BaseModel):
+    status: str
+    order_ids: Optional[List[int]] = Field(None, max_length=1000)
+    # Used instead of order_ids, e.g. {"from_status": "preparing"} for "all preparing -> ready"
+    from_status: Optional[str] = None
+    customer_id: Optional[str] = None
+
+
+class BulkStatusOut(BaseModel):
+    status: str
+    changed: List[int]
+
+
+class StatusChangeOut(BaseModel):
+    status: str
+    at: datetime
+
+
 @router.post("/orders", response_model=OrderOut, status_code=201, tags=["orders"])
-def create_order_endpoint(payload: OrderCreateIn):
+def create_order_endpoint(
+    payload: OrderCreateIn,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+):
     """Create a new order"""
     if payload.items and len(payload.items) > 0:
         items = [{"item_id": x.item_id, "quantity": x.quantity} for x in payload.items]
+    elif payload.item_id is None or payload.quantity is None:
+        raise HTTPException(status_code=400, detail="Provide either items[] or item_id + quantity")
+    else:
+        items = [{"item_id": payload.item_id, "quantity": payload.quantity}]
+
+    if idempotency_key is None:
         try:
             return create_order(payload.customer_id, items, payload.notes)
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
 
-    if payload.item_id is None or payload.quantity is None:
-        raise HTTPException(status_code=400, detail="Provide either items[] or item_id + quantity")
+    # A replayed key returns the stored order without touching stock or ids
+    fingerprint = hashlib.sha256(json.dumps(
+        {"customer_id": payload.customer_id, "items": items, "notes": payload.notes},
+        sort_keys=True,
+    ).encode("utf-8")).hexdigest()
+    try:
+        stored = begin_idempotent_request(idempotency_key, fingerprint)
+    except IdempotencyKeyConflict as e:
+        raise HTTPException(status_code=409 if e.in_progress else 422, detail=str(e))
+    if stored is not None:
+        response.headers["Idempotent-Replayed"] = "true"
+        return stored
 
     try:
-        return create_order(
-            payload.customer_id,
-            [{"item_id": payload.item_id, "quantity": payload.quantity}],
-            payload.notes
-        )
+        order = create_order(payload.customer_id, items, payload.notes)
     except ValueError as e:
+        abort_idempotent_request(idempotency_key)
         raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        abort_idempotent_request(idempotency_key)
+        raise
+    complete_idempotent_request(idempotency_key, fingerprint, order)
+    return order
 
 
 @router.get("/orders/{order_id}", response_model=OrderOut, tags=["orders"])
-def get_order(order_id: int):
+def get_order(
+    order_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+):
     """Get order by ID"""
-    doc = get_order_by_id(order_id)
+    field_list = _parse_fields(fields, OrderOut)
+    doc = get_order_by_id(order_id, fields=field_list)
     if doc is None:
         raise HTTPException(status_code=404, detail="Order not found")
+    if field_list is not None:
+        return _sparse_json(OrderOut, field_list, doc)
     return doc
 
 
+@router.post("/orders/{order_id}/ratings", tags=["orders"])
+def rate_order_items(order_id: int, payload: OrderRatingsIn):
+    """Rate the items of a completed order in one go (once per order)"""
+    ratings = {r.item_id: r.rating for r in payload.ratings}
+    if len(ratings) != len(payload.ratings):
+        raise HTTPException(status_code=400, detail="Each item can only be rated once")
+    try:
+        items = rate_order(order_id, ratings)
+    except OrderAlreadyRated as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if items is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    return {"order_id": order_id, "items": items}
+
+
 @router.get("/orders", response_model=List[OrderOut], tags=["orders"])
-def list_my_orders(customer_id: str = "guest"):
+def list_my_orders(
+    customer_id: str = "guest",
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    since: Optional[datetime] = Query(None, description="Only orders created at or after this (UTC)"),
+    until: Optional[datetime] = Query(None, description="Only orders created before this (UTC)"),
+):
     """Get all orders for a customer"""
-    return list_orders(customer_id=customer_id)
+    field_list = _parse_fields(fields, OrderOut)
+    docs = list_orders(customer_id=customer_id, fields=field_list, since=since, until=until)
+    if field_list is not None:
+        return _sparse_json(OrderOut, field_list, docs, many=True)
+    return docs
 
 
 
 
 @router.get("/admin/orders", response_model=List[OrderOut], tags=["admin"])
-def admin_orders():
+def admin_orders(
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    since: Optional[datetime] = Query(None, description="Only orders created at or after this (UTC)"),
+    until: Optional[datetime] = Query(None, description="Only orders created before this (UTC)"),
+):
     """Get all orders (admin only)"""
-    return list_orders(customer_id=None)
+    field_list = _parse_fields(fields, OrderOut)
+    docs = list_orders(customer_id=None, fields=field_list, since=since, until=until)
+    if field_list is not None:
+        return _sparse_json(OrderOut, field_list, docs, many=True)
+    return docs
+
+
+@router.post("/admin/orders/archive", tags=["admin"])
+def archive_old_orders(older_than_days: float = Query(ORDER_ARCHIVE_AFTER_DAYS, ge=0)):
+    """Move finished orders older than older_than_days to the archive now (admin)"""
+    return {"orders_archived": archive_orders(older_than_days=older_than_days)}
 
 
 @router.put("/admin/orders/{order_id}/status", response_model=OrderOut, tags=["admin"])
@@ -312,6 +665,41 @@ def change_status(order_id: int, payload: OrderStatusUpdate):
     return updated
 
 
+@router.post("/admin/orders/status", response_model=BulkStatusOut, tags=["admin"])
+def bulk_update_order_status(payload: BulkStatusUpdate):
+    """Move many orders to a status at once; only allowed transitions are made (admin only)"""
+    if payload.order_ids is None and payload.from_status is None and payload.customer_id is None:
+        raise HTTPException(status_code=400, detail="Give order_ids or a filter (from_status, customer_id)")
+    try:
+        changed = update_order_statuses(
+            payload.status,
+            order_ids=payload.order_ids,
+            from_status=payload.from_status,
+            customer_id=payload.customer_id,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": payload.status, "changed": changed}
+
+
+@router.get("/admin/orders/{order_id}/history", response_model=List[StatusChangeOut], tags=["admin"])
+def order_history(order_id: int):
+    """Get the status history of an order (admin only)"""
+    if get_order_by_id(order_id) is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return get_order_status_history(order_id)
+
+
+
+@router.get("/admin/dashboard", tags=["admin"])
+def admin_dashboard(request: Request, top_limit: int = Query(5, ge=1, le=20)):
+    """Get the admin dashboard snapshot (admin)"""
+    return _cached_json_ttl(
+        request,
+        ("dashboard", top_limit),
+        lambda: get_dashboard_snapshot(top_limit=top_limit),
+    )
+
 
 @router.get("/admin/analytics/top-selling", tags=["admin"])
 def top_selling_admin(limit: int = 5):
@@ -325,6 +713,122 @@ def top_selling_public(limit: int = 5):
     return get_top_selling_items(limit=limit)
 
 
+# Seconds between keep-alive comments on an idle stock alert stream
+STOCK_STREAM_KEEPALIVE = 15.0
+
+
+def _sse(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+async def _stock_alert_events(request: Request):
+    site = current_site()
+    queue = stock_events.subscribe()
+    try:
+        yield _sse("snapshot", await run_in_threadpool(get_stock_alerts))
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), STOCK_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield b": keep-alive\n\n"
+                continue
+            # One broker for all sites; each stream only follows its own
+            if event.get("site_id") == site:
+                yield _sse("stock", event)
+    finally:
+        stock_events.unsubscribe(queue)
+
+
+@router.get("/admin/stock-alerts", tags=["admin"])
+def stock_alerts():
+    """Get items that are low on or out of stock (admin)"""
+    return get_stock_alerts()
+
+
+@router.get("/admin/stock-alerts/stream", tags=["admin"])
+async def stock_alerts_stream(request: Request):
+    """Server-sent events: current alerts, then every change of an item's stock level (admin)"""
+    return StreamingResponse(
+        _stock_alert_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/admin/tasks", tags=["admin"])
+def task_stats():
+    """Background side-effect tasks: queued, in the outbox by status, and recent failures"""
+    return get_task_stats()
+
+
+@router.get("/admin/slow-queries", tags=["admin"])
+def get_slow_queries(
+    limit: int = Query(50, ge=1, le=500),
+    flagged: bool = Query(False, description="Only commands whose plan had a COLLSCAN or in-memory SORT"),
+):
+    """Recent Mongo commands slower than SLOW_QUERY_MS, with their caller and sampled explain plans"""
+    return {
+        "threshold_ms": slow_queries.threshold_ms,
+        "by_caller": slow_queries.by_caller(),
+        "entries": slow_queries.entries(limit, flagged_only=flagged),
+    }
+
+
+def _require_admin(token: Optional[str]) -> None:
+    if not is_admin(token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@router.get("/admin/profiles", tags=["admin"])
+def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """List recent request profiles, newest first (admin token required)"""
+    _require_admin(x_admin_token)
+    return profile_store.list()
+
+
+@router.get("/admin/profiles/{profile_id}", tags=["admin"])
+def get_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Get a profile's summary, Mongo commands and top functions (admin token required)"""
+    _require_admin(x_admin_token)
+    summary = profile_store.get(profile_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return summary
+
+
+@router.get("/admin/profiles/{profile_id}/download", tags=["admin"])
+def download_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Download a profile's pstats file, e.g. for snakeviz (admin token required)"""
+    _require_admin(x_admin_token)
+    path = profile_store.path(profile_id, "prof")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
+
+@router.get("/admin/analytics/sales", tags=["admin"])
+def sales_rollups(
+    granularity: str = Query("day", description="hour or day"),
+    start: Optional[datetime] = Query(None, description="Range start (UTC), defaults to 7 days ago"),
+    end: Optional[datetime] = Query(None, description="Range end (UTC), defaults to now"),
+):
+    """Get hourly or daily sales rollups for a time range (admin)"""
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=7)
+    try:
+        return get_sales_rollups(granularity, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/admin/analytics/sales/backfill", tags=["admin"])
+def sales_rollups_backfill():
+    """Rebuild sales rollups from all existing orders (admin)"""
+    return {"orders_processed": backfill_sales_rollups()}
+
+
 @router.get("/analytics/top-rated", tags=["analytics"])
 def top_rated(limit: int = 5):
     """Get top-rated items"""
@@ -333,12 +837,16 @@ def top_rated(limit: int = 5):
 
 
 
+@router.get("/allergens", tags=["categories"])
+def get_allergens():
+    """Get the allergen names items can list and exclude_allergens accepts"""
+    return list(ALLERGENS)
+
+
 @router.get("/categories", tags=["categories"])
-def get_categories():
+def get_categories(request: Request):
     """Get list of all categories"""
-    items = list_items()
-    categories = list(set(item.category for item in items))
-    return sorted(categories)
+    return _cached_json(request, ("categories",), list_categories)
 
 
 
@@ -349,7 +857,7 @@ def search_items(
     category: Optional[str] = None,
 ):
     """Search items by name or description"""
-    items = [item.to_dict() for item in list_items()]
+    items = [item.to_dict() for item in list_menu_items()]
     query = q.lower()
     
     results = [
@@ -1,23 +1,73 @@
 # app/fastapi_app.py
 
 import os
+import threading
+from contextlib import asynccontextmanager
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, HTMLResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
+from app.core.admission import AdmissionMiddleware
+from app.core.compression import CompressionMiddleware
+from app.core.profiling import ProfiledRoute, ProfilingMiddleware
+from app.core.sites import SiteMiddleware, current_site
+from app.core.traffic import TRAFFIC_CAPTURE_RATE, TrafficCaptureMiddleware
 from app.fastapi_api import router as api_router
-from app.storage.mongo_repo import list_items
+from app.fastapi_responses import EncodedPayload, FastJSONResponse, payload_response
+from app.storage.mongo_repo import (
+    count_items,
+    get_menu_changed_at,
+    get_menu_version,
+    iter_items,
+    list_items,
+    start_invalidation_listener,
+    start_order_archiver,
+    start_rating_flusher,
+    start_task_workers,
+    stop_invalidation_listener,
+    stop_order_archiver,
+    stop_rating_flusher,
+    stop_task_workers,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_invalidation_listener()
+    start_rating_flusher()
+    start_order_archiver()
+    start_task_workers()
+    yield
+    stop_task_workers()
+    stop_order_archiver()
+    stop_rating_flusher()
+    stop_invalidation_listener()
+
 
 app = FastAPI(
     title="Cafeteria API (FastAPI)",
     version="1.0.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan,
 )
+app.router.route_class = ProfiledRoute
 
 
 templates = Jinja2Templates(directory="app/templates")
 
+# Menus with more items than this are streamed instead of rendered up front
+ITEMS_HTML_STREAM_THRESHOLD = int(os.getenv("ITEMS_HTML_STREAM_THRESHOLD", "200"))
+ITEMS_HTML_CHUNK_BYTES = 16 * 1024
+
+# Rendered /items-html per site, for the site's current menu version. The
+# version is shared by all workers, so the ETag is too.
+_items_pages: dict = {}
+_items_page_lock = threading.Lock()
+
 
 origins_env = os.getenv(
     "ALLOWED_ORIGINS",
@@ -25,14 +75,32 @@ origins_env = os.getenv(
 )
 origins = [o.strip() for o in origins_env.split(",") if o.strip()]
 
+# Everything below it (routes, repo) sees the request's site through current_site()
+app.add_middleware(SiteMiddleware)
+
+# Innermost but for the site, so profiles time the request itself and not its wait for admission
+app.add_middleware(ProfilingMiddleware)
+
+# Inside CORS, so shed 503s still get CORS headers
+if os.getenv("ADMISSION_CONTROL", "1") == "1":
+    app.add_middleware(AdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Paged /api/items responses carry the number of matches
+    expose_headers=["X-Total-Count"],
 )
 
+app.add_middleware(CompressionMiddleware)
+
+# Outermost, so captured timings and statuses are what clients saw
+if TRAFFIC_CAPTURE_RATE > 0:
+    app.add_middleware(TrafficCaptureMiddleware)
+
 
 @app.get("/", include_in_schema=False)
 def root():
@@ -56,20 +124,108 @@ def hello_html():
     """
 
 
+def _last_modified() -> str:
+    changed_at = get_menu_changed_at()
+    if changed_at is None:
+        return formatdate(usegmt=True)
+    return formatdate(changed_at.replace(tzinfo=timezone.utc).timestamp(), usegmt=True)
+
+
+def _items_page_state(site: str, version: int) -> dict:
+    with _items_page_lock:
+        page = _items_pages.get(site)
+        if page is None or page["version"] != version:
+            page = _items_pages[site] = {
+                "version": version,
+                "etag": f'"menu-{site}-{version}"',
+                "last_modified": _last_modified(),
+                "body": None,
+            }
+        return dict(page)
+
+
+def _store_items_page(site: str, version: int, body: bytes) -> EncodedPayload:
+    payload = EncodedPayload(body)
+    with _items_page_lock:
+        page = _items_pages.get(site)
+        if page is not None and page["version"] == version:
+            page["body"] = payload
+    return payload
+
+
+def _not_modified(request: Request, page: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or page["etag"] in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(page["last_modified"])
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _stream_items_page(chunks, site: str, version: int):
+    """Yield the rendered page in blocks, caching the whole body once it's done"""
+    parts, pending, size = [], [], 0
+    for chunk in chunks:
+        data = chunk.encode("utf-8")
+        pending.append(data)
+        size += len(data)
+        if size >= ITEMS_HTML_CHUNK_BYTES:
+            block = b"".join(pending)
+            parts.append(block)
+            pending, size = [], 0
+            yield block
+    block = b"".join(pending)
+    parts.append(block)
+    yield block
+    _store_items_page(site, version, b"".join(parts))
+
+
 @app.get("/items-html", response_class=HTMLResponse, include_in_schema=False)
 def items_html(request: Request):
-    items = [item.to_dict() for item in list_items()]
-    total_items = len(items)
-    available_items = sum(1 for item in items if item["available"])
-
-    return templates.TemplateResponse(
-        "items.html",
-        {
-            "request": request,
-            "items": items,
-            "total_items": total_items,
-            "available_items": available_items,
-        },
+    site = current_site()
+    version = get_menu_version()
+    page = _items_page_state(site, version)
+    headers = {
+        "ETag": page["etag"],
+        "Last-Modified": page["last_modified"],
+        "Cache-Control": "no-cache",
+    }
+    if _not_modified(request, page):
+        return Response(status_code=304, headers=headers)
+    if page["body"] is not None:
+        return payload_response(page["body"], request, HTMLResponse, headers)
+
+    template = templates.get_template("items.html")
+    total_items = count_items()
+
+    if total_items <= ITEMS_HTML_STREAM_THRESHOLD:
+        items = [item.to_dict() for item in list_items()]
+        body = template.render(
+            request=request,
+            items=items,
+            total_items=len(items),
+            available_items=sum(1 for item in items if item["available"]),
+        ).encode("utf-8")
+        payload = _store_items_page(site, version, body)
+        return payload_response(payload, request, HTMLResponse, headers)
+
+    # Large menu: rows are rendered as the cursor is read, so the first
+    # bytes go out before the whole table is built
+    chunks = template.generate(
+        request=request,
+        items=(item.to_dict() for item in iter_items()),
+        total_items=total_items,
+        available_items=count_items(available=True),
+    )
+    return StreamingResponse(
+        _stream_items_page(chunks, site, version),
+        media_type="text/html",
+        headers=headers,
     )
 
 
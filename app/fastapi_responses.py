@@ -0,0 +1,77 @@
+# app/fastapi_responses.py
+
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Type
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+from app.core.compression import COMPRESSION_MIN_SIZE, choose_encoding, compress
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback keeps the app importable without orjson
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content to JSON bytes, handling datetimes natively."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """Default response class: orjson encoding instead of json.dumps."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class PreEncodedJSONResponse(Response):
+    """Serves a JSON body that was already encoded (e.g. from a cache) as-is."""
+
+    media_type = "application/json"
+
+
+class EncodedPayload:
+    """An encoded body plus its compressed variants, each built on first use."""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self._variants: Dict[str, bytes] = {}
+
+    def variant(self, encoding: str) -> bytes:
+        data = self._variants.get(encoding)
+        if data is None:
+            data = self._variants.setdefault(encoding, compress(self.body, encoding, best=True))
+        return data
+
+
+def payload_response(
+    payload: EncodedPayload,
+    request: Request,
+    response_class: Type[Response] = PreEncodedJSONResponse,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """Serve a cached payload, picking the compressed variant the client accepts"""
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    if len(payload.body) >= COMPRESSION_MIN_SIZE:
+        encoding = choose_encoding(request.headers.get("accept-encoding"))
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+            return response_class(payload.variant(encoding), headers=headers)
+    return response_class(payload.body, headers=headers)
@@ -0,0 +1,143 @@
+# app/storage/invalidation.py
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Backoff between attempts to reopen a change stream that failed
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+
+
+class InvalidationBus:
+    """Cross-process version counters for cached data.
+
+    Each topic ("menu", "orders", ...) is one small document ``{_id: topic,
+    v: n, at: datetime}``. Writers ``publish()`` a topic, which bumps the
+    counter in Mongo. Every worker keeps a local copy of the counters and
+    refreshes it from a change stream, or by polling the collection where
+    change streams aren't available (standalone servers). Caches keyed by
+    ``version(topic)`` therefore go stale in every worker, not only the one
+    that did the write.
+    """
+
+    def __init__(self, col: Collection, mode: str = "auto", poll_interval: float = 0.5):
+        self.col = col
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self._versions: Dict[str, int] = {}
+        self._changed_at: Dict[str, datetime] = {}
+        self._subscribers: Dict[str, List[Callable[[int], None]]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def version(self, topic: str) -> int:
+        return self._versions.get(topic, 0)
+
+    def changed_at(self, topic: str) -> Optional[datetime]:
+        return self._changed_at.get(topic)
+
+    def subscribe(self, topic: str, callback: Callable[[int], None]) -> None:
+        """Call ``callback(version)`` when another process publishes ``topic``"""
+        self._subscribers.setdefault(topic, []).append(callback)
+
+    def publish(self, topic: str) -> int:
+        doc = self.col.find_one_and_update(
+            {"_id": topic},
+            {"$inc": {"v": 1}, "$set": {"at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        version = int(doc["v"])
+        # Our own writes are visible here straight away; no callbacks for them,
+        # unless the counter also moved past bumps from other workers we hadn't seen
+        missed = version > self.version(topic) + 1
+        self._apply(topic, version, doc.get("at"), notify=missed)
+        return version
+
+    def refresh(self) -> None:
+        """Pull every topic's current version from Mongo"""
+        for doc in self.col.find({}):
+            self._apply(doc["_id"], int(doc.get("v", 0)), doc.get("at"))
+
+    def _apply(self, topic: str, version: int, at: Optional[datetime], notify: bool = True) -> None:
+        with self._lock:
+            if version <= self._versions.get(topic, 0):
+                return
+            self._versions[topic] = version
+            if at is not None:
+                self._changed_at[topic] = at
+        if notify:
+            for callback in self._subscribers.get(topic, []):
+                try:
+                    callback(version)
+                except Exception:
+                    logger.exception("invalidation subscriber for %s failed", topic)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="invalidation-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        delay = RECONNECT_MIN_DELAY
+        while self.mode in ("auto", "changestream") and not self._stop.is_set():
+            opened = time.monotonic()
+            try:
+                self._watch()
+                return
+            except OperationFailure as e:
+                # Standalone servers have no change streams
+                if self.mode == "changestream":
+                    logger.error("change stream unavailable: %s", e)
+                    return
+                logger.info("change streams unavailable, polling every %ss", self.poll_interval)
+                break
+            except PyMongoError:
+                # Network errors, failovers: reopen the stream (it catches up with refresh())
+                if time.monotonic() - opened > RECONNECT_MAX_DELAY:
+                    delay = RECONNECT_MIN_DELAY
+                logger.exception("change stream failed, reopening in %ss", delay)
+                self._stop.wait(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        if not self._stop.is_set():
+            self._poll()
+
+    def _watch(self) -> None:
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        with self.col.watch(pipeline, full_document="updateLookup", max_await_time_ms=500) as stream:
+            # Catch up on anything published before the stream opened
+            self.refresh()
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is None or change.get("fullDocument") is None:
+                    continue
+                doc = change["fullDocument"]
+                self._apply(doc["_id"], int(doc.get("v", 0)), doc.get("at"))
+
+    def _poll(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except PyMongoError:
+                logger.exception("polling cache versions failed")
@@ -2,27 +2,168 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timedelta
-from typing import List, Optional
+from dataclasses import replace
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, Optional
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import os
+import threading
+from app.core.allergens import allergen_mask, normalize_allergen, normalize_allergens
+from app.core.background import PeriodicWorker
+from app.core.cache import LRUCache, VersionedCache
+from app.core.events import EventBroker
+from app.core.kitchen import KitchenScheduler, KitchenTicket
+from app.core.menu_index import MenuIndex
 from app.core.models import CafeteriaItem, UserFavorite
+from app.core.profiling import MongoCommandRecorder
+from app.core.sites import DEFAULT_SITE_ID, SITES, current_site, use_site
+from app.core.write_behind import CoalescingBuffer
+from app.storage.invalidation import InvalidationBus
+from app.storage.outbox import TaskOutbox
+from app.storage.site_collection import INDEX_NOT_FOUND, SiteScopedCollection
+from app.storage.slow_queries import SlowQueryLog
 
 
 # MongoDB connection
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://127.0.0.1:27017")
-client = MongoClient(MONGO_URL)
+# The recorder attributes commands to requests being profiled (and ignores the rest);
+# slow_queries logs and explains any command over SLOW_QUERY_MS
+slow_queries = SlowQueryLog()
+client = MongoClient(MONGO_URL, event_listeners=[MongoCommandRecorder(), slow_queries])
+slow_queries.bind(client)
 db = client["cafeteria_db"]
 
-items_col = db["items"]
-orders_col = db["orders"]
-favorites_col = db["favorites"]
+# Per-site data: every document carries site_id and these only see the
+# current site's (app.core.sites). Every index leads with site_id, so the
+# collections can be sharded on a key that starts with site_id.
+items_col = SiteScopedCollection(db["items"])
+orders_col = SiteScopedCollection(db["orders"])
+favorites_col = SiteScopedCollection(db["favorites"])
+status_history_col = SiteScopedCollection(db["order_status_history"])
+rollups_col = SiteScopedCollection(db["sales_rollups"])
+orders_archive_col = SiteScopedCollection(db["orders_archive"])
+archived_sales_col = SiteScopedCollection(db["archived_item_sales"])
+specials_col = SiteScopedCollection(db["specials_schedule"])
+SITE_COLLECTIONS = (
+    items_col, orders_col, favorites_col, status_history_col, rollups_col,
+    orders_archive_col, archived_sales_col, specials_col,
+)
+# Shared by all sites; their keys include the site where it matters
+idempotency_col = db["idempotency_keys"]
+cache_versions_col = db["cache_versions"]
+outbox_col = db["task_outbox"]
+counters_col = db["counters"]
 
 # Constants
 VALID_STATUSES = {"pending", "preparing", "ready", "completed", "cancelled"}
+# Moves bulk status updates may make; single updates may still set any status
+ALLOWED_TRANSITIONS = {
+    "pending": ("preparing", "ready", "cancelled"),
+    "preparing": ("ready", "cancelled"),
+    "ready": ("completed", "cancelled"),
+    "completed": (),
+    "cancelled": (),
+}
 BASE_PREP_MINUTES = 5
 PER_ITEM_MINUTES = 2
+ROLLUP_GRANULARITIES = ("hour", "day")
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "5"))
+ACTIVE_ORDER_STATUSES = ("pending", "preparing", "ready")
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# An in-progress key older than this is assumed abandoned and may be taken over
+IDEMPOTENCY_LOCK_SECONDS = 30
+KITCHEN_STATIONS = int(os.getenv("KITCHEN_STATIONS", "2"))
+ACTIVE_KITCHEN_STATUSES = ("pending", "preparing")
+# "auto" uses a change stream when the server supports one, else polls
+INVALIDATION_MODE = os.getenv("INVALIDATION_MODE", "auto")
+INVALIDATION_POLL_INTERVAL = float(os.getenv("INVALIDATION_POLL_INTERVAL", "0.5"))
+# Completed/cancelled orders older than this move to orders_archive (0 = never)
+ORDER_ARCHIVE_AFTER_DAYS = float(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", "30"))
+ORDER_ARCHIVE_INTERVAL = float(os.getenv("ORDER_ARCHIVE_INTERVAL", "3600"))
+ORDER_ARCHIVE_BATCH_SIZE = int(os.getenv("ORDER_ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVABLE_STATUSES = ("completed", "cancelled")
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_QUEUE_SIZE = int(os.getenv("OUTBOX_QUEUE_SIZE", "1000"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+
+# Only the fields OrderOut needs; item_id/quantity cover legacy single-item orders.
+ORDER_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "customer_id": 1,
+    "status": 1,
+    "items": 1,
+    "total_price": 1,
+    "created_at": 1,
+    "estimated_ready_at": 1,
+    "completed_at": 1,
+    "notes": 1,
+    "rated_at": 1,
+    "item_id": 1,
+    "quantity": 1,
+}
+
+# Versions are kept in Mongo so every worker process sees every bump.
+# Topics are per site ("menu:<site>", see _topic). "menu" is bumped on
+# every write that changes what the menu endpoints return, so callers can
+# cache menu payloads and know when they went stale; "orders" tells other
+# workers their kitchen model is out of date.
+invalidation = InvalidationBus(
+    cache_versions_col,
+    mode=INVALIDATION_MODE,
+    poll_interval=INVALIDATION_POLL_INTERVAL,
+)
+
+# Order side effects (sales rollups, stock alerts, ETA writes) run here,
+# after the order is committed and the request has returned.
+tasks = TaskOutbox(
+    outbox_col,
+    workers=OUTBOX_WORKERS,
+    queue_size=OUTBOX_QUEUE_SIZE,
+    max_attempts=OUTBOX_MAX_ATTEMPTS,
+)
+
+
+def _topic(name: str) -> str:
+    return f"{name}:{current_site()}"
+
+
+def _in_site(site: str, fn):
+    """``fn`` run as ``site``; for callbacks fired from background threads"""
+    def run(*args):
+        with use_site(site):
+            return fn(*args)
+    return run
+
+
+def get_menu_version() -> int:
+    return invalidation.version(_topic("menu"))
+
+
+def get_menu_changed_at() -> Optional[datetime]:
+    return invalidation.changed_at(_topic("menu"))
+
+
+def _bump_menu_version() -> None:
+    invalidation.publish(_topic("menu"))
+
+
+def start_invalidation_listener():
+    """Follow version bumps made by other worker processes"""
+    invalidation.start()
+
+
+def stop_invalidation_listener():
+    invalidation.stop()
+
+
+def _migrate_default_site():
+    """Give documents from before sites the default site, and drop the indexes that don't lead with site_id"""
+    for col in SITE_COLLECTIONS:
+        col.raw.update_many({"site_id": {"$exists": False}}, {"$set": {"site_id": DEFAULT_SITE_ID}})
+        col.drop_unscoped_indexes()
 
 
 def _seed_initial_items():
@@ -192,9 +333,99 @@ def _seed_initial_items():
         ])
 
 
+def _migrate_rollup_generations():
+    """Put rollups from before generations in generation 0, and drop their unique
+    index, which leaves no room for a second generation of a bucket"""
+    rollups_col.raw.update_many({"gen": {"$exists": False}}, {"$set": {"gen": 0}})
+    if "site_id_1_granularity_1_bucket_1" in rollups_col.raw.index_information():
+        try:
+            rollups_col.raw.drop_index("site_id_1_granularity_1_bucket_1")
+        except OperationFailure as e:
+            if e.code != INDEX_NOT_FOUND:
+                raise
+
+
+_migrate_default_site()
+_migrate_rollup_generations()
 _seed_initial_items()
 
 
+def _ensure_indexes():
+    # Indexes on site collections get site_id as their first key
+    items_col.create_index("id")
+    orders_col.create_index("id")
+    favorites_col.create_index([("customer_id", 1), ("item_id", 1)])
+    status_history_col.create_index([("order_id", 1), ("at", 1)])
+    rollups_col.create_index([("gen", 1), ("granularity", 1), ("bucket", 1)], unique=True)
+    idempotency_col.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+    orders_col.create_index([("status", 1), ("created_at", 1)])
+    orders_archive_col.create_index("id", unique=True)
+    outbox_col.create_index([("status", 1), ("next_at", 1)])
+    orders_archive_col.create_index([("customer_id", 1), ("id", -1)])
+    orders_archive_col.create_index("created_at")
+    archived_sales_col.create_index("item_id", unique=True)
+    specials_col.create_index([("start_date", 1), ("end_date", 1)])
+    # Only items that need attention carry stock_alert, so this stays tiny
+    items_col.create_index(
+        [("stock_alert", 1), ("quantity", 1)],
+        partialFilterExpression={"stock_alert": {"$exists": True}},
+    )
+
+
+def _migrate_status_history():
+    """Move status_history arrays embedded in old orders into their own collection"""
+    for doc in orders_col.find(
+        {"status_history": {"$exists": True}},
+        {"_id": 0, "id": 1, "status_history": 1},
+    ):
+        entries = [
+            status_history_col.scope({"order_id": int(doc["id"]), "status": h.get("status"), "at": h.get("at")})
+            for h in doc.get("status_history") or []
+        ]
+        if entries:
+            # Upserts, so a rerun (after a crash, or in another worker) adds no duplicates
+            status_history_col.bulk_write([ReplaceOne(entry, entry, upsert=True) for entry in entries], ordered=False)
+        orders_col.update_one({"id": doc["id"]}, {"$unset": {"status_history": ""}})
+
+
+def _next_id(name: str) -> int:
+    """Next id for ``name`` ("items", "orders", "specials") within the current site"""
+    doc = counters_col.find_one_and_update(
+        {"_id": f"{current_site()}:{name}"},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return int(doc["seq"])
+
+
+def _sync_id_counters():
+    """Move the current site's counters past ids handed out before they existed"""
+    sources = {
+        "items": (items_col,),
+        # Archived ids stay taken, even if every order has been archived
+        "orders": (orders_col, orders_archive_col),
+        "specials": (specials_col,),
+    }
+    for name, cols in sources.items():
+        last = max(
+            (
+                int(doc["id"])
+                for col in cols
+                for doc in [col.find_one({}, {"_id": 0, "id": 1}, sort=[("id", -1)])]
+                if doc
+            ),
+            default=0,
+        )
+        if last:
+            counters_col.update_one({"_id": f"{current_site()}:{name}"}, {"$max": {"seq": last}}, upsert=True)
+
+
+_ensure_indexes()
+_migrate_status_history()
+_sync_id_counters()
+
+
 def _doc_to_item(doc: dict) -> CafeteriaItem:
     return CafeteriaItem(
         id=int(doc["id"]),
@@ -215,26 +446,18 @@ def _doc_to_item(doc: dict) -> CafeteriaItem:
         discount_percentage=float(doc.get("discount_percentage", 0.0)),
         calories=doc.get("calories"),
         preparation_time=doc.get("preparation_time"),
+        low_stock_threshold=int(doc.get("low_stock_threshold", LOW_STOCK_THRESHOLD)),
+        allergen_mask=int(doc.get("allergen_mask", 0)),
     )
 
 
-def _get_next_item_id() -> int:
-    last = items_col.find_one(sort=[("id", -1)])
-    return 1 if not last else int(last["id"]) + 1
-
-
-def _get_next_order_id() -> int:
-    last = orders_col.find_one(sort=[("id", -1)])
-    return 1 if not last else int(last["id"]) + 1
-
-
-def _normalize_order_doc(doc: dict) -> dict:
+def _normalize_order_doc(doc: dict, with_items: bool = True) -> dict:
     if doc is None:
         return None
     doc = dict(doc)
     doc.pop("_id", None)
     
-    if "items" in doc and isinstance(doc["items"], list):
+    if not with_items or ("items" in doc and isinstance(doc["items"], list)):
         doc.setdefault("customer_id", doc.get("customer_id", "guest"))
         return doc
     
@@ -264,16 +487,213 @@ def _normalize_order_doc(doc: dict) -> dict:
     return doc
 
 
+def _order_projection(fields: Optional[List[str]] = None) -> dict:
+    if fields is None:
+        return ORDER_PROJECTION
+    projection = {"_id": 0, "id": 1}
+    projection.update({f: 1 for f in fields})
+    if "items" in fields:
+        # Legacy single-item orders build their items list from these
+        projection.update({"item_id": 1, "quantity": 1, "total_price": 1})
+    return projection
+
+
+def _item_query(
+    available: Optional[bool] = None,
+    category: Optional[str] = None,
+    vegetarian: Optional[bool] = None,
+    vegan: Optional[bool] = None,
+    gluten_free: Optional[bool] = None,
+    daily_special: Optional[bool] = None,
+    exclude_allergens: int = 0,
+) -> dict:
+    q = {}
+    if available is not None:
+        q["available"] = available
+    if category is not None:
+        q["category"] = category
+    if vegetarian is True:
+        q["is_vegetarian"] = True
+    if vegan is True:
+        q["is_vegan"] = True
+    if gluten_free is True:
+        q["is_gluten_free"] = True
+    if daily_special is True:
+        q["id"] = {"$in": todays_specials()["item_ids"]}
+    if exclude_allergens:
+        q["allergen_mask"] = {"$bitsAllClear": exclude_allergens}
+    return q
+
+
+def _prep_minutes(lines: list[dict], by_id: dict) -> float:
+    """Kitchen time for an order: each line takes its item's preparation_time,
+    plus PER_ITEM_MINUTES for every extra unit of the same item."""
+    minutes = BASE_PREP_MINUTES
+    for line in lines:
+        prep = by_id.get(line["item_id"], {}).get("preparation_time")
+        prep = PER_ITEM_MINUTES if prep is None else int(prep)
+        minutes += prep + (int(line["quantity"]) - 1) * PER_ITEM_MINUTES
+    return minutes
+
+
+def _apply_eta_changes(changes: dict) -> None:
+    if not changes:
+        return
+    orders_col.bulk_write(
+        [
+            UpdateOne(orders_col.scope({"id": oid}), {"$set": {"estimated_ready_at": eta}})
+            for oid, eta in changes.items()
+        ],
+        ordered=False,
+    )
+
+
+# One kitchen model per site, loaded the first time the site needs it
+_kitchens: dict = {}
+_kitchens_lock = threading.Lock()
+
+
+def _kitchen() -> KitchenScheduler:
+    site = current_site()
+    kitchen = _kitchens.get(site)
+    if kitchen is not None:
+        return kitchen
+    with _kitchens_lock:
+        if site not in _kitchens:
+            kitchen = KitchenScheduler(stations=KITCHEN_STATIONS)
+            _load_kitchen_queue(kitchen)
+            # The worker that changed an order already wrote the new ETAs; the
+            # others only need their in-memory model to match.
+            invalidation.subscribe(
+                _topic("orders"),
+                _in_site(site, lambda version: _load_kitchen_queue(kitchen, persist=False)),
+            )
+            _kitchens[site] = kitchen
+        return _kitchens[site]
+
+
+def _load_kitchen_queue(kitchen: KitchenScheduler, persist: bool = True):
+    """Rebuild a kitchen model from the site's orders still pending or preparing"""
+    tickets = []
+    docs = orders_col.find(
+        {"status": {"$in": list(ACTIVE_KITCHEN_STATUSES)}},
+        {"_id": 0, "id": 1, "status": 1, "prep_minutes": 1, "started_at": 1,
+         "items": 1, "quantity": 1},
+    ).sort([("id", 1)])
+    for doc in docs:
+        minutes = doc.get("prep_minutes")
+        if minutes is None:
+            qty = sum(int(x.get("quantity", 0)) for x in doc.get("items") or []) or int(doc.get("quantity", 0))
+            minutes = BASE_PREP_MINUTES + qty * PER_ITEM_MINUTES
+        started_at = doc.get("started_at") if doc.get("status") == "preparing" else None
+        tickets.append(KitchenTicket(order_id=int(doc["id"]), minutes=minutes, started_at=started_at))
+    changes = kitchen.load(tickets, datetime.utcnow())
+    if persist:
+        _apply_eta_changes(changes)
+
+
+invalidation.refresh()
+_kitchen()
+
+
 # ITEMS API
 def list_items() -> List[CafeteriaItem]:
     return [_doc_to_item(d) for d in items_col.find({})]
 
 
+def iter_items() -> Iterator[CafeteriaItem]:
+    """Lazily yield items straight off the cursor"""
+    for d in items_col.find({}):
+        yield _doc_to_item(d)
+
+
+def count_items(available: Optional[bool] = None) -> int:
+    q = {} if available is None else {"available": available}
+    return items_col.count_documents(q)
+
+
 def get_item_by_id(item_id: int) -> Optional[CafeteriaItem]:
     doc = items_col.find_one({"id": item_id})
     return _doc_to_item(doc) if doc else None
 
 
+def find_item_docs(
+    fields: List[str],
+    available: Optional[bool] = None,
+    category: Optional[str] = None,
+    vegetarian: Optional[bool] = None,
+    vegan: Optional[bool] = None,
+    gluten_free: Optional[bool] = None,
+    daily_special: Optional[bool] = None,
+    exclude_allergens: int = 0,
+) -> list[dict]:
+    """Filtered items as raw documents holding only the requested fields"""
+    q = _item_query(available, category, vegetarian, vegan, gluten_free, daily_special, exclude_allergens)
+    projection = {"_id": 0, "id": 1}
+    projection.update({f: 1 for f in fields})
+    specials = todays_specials()
+    return [apply_specials(doc, specials) for doc in items_col.find(q, projection)]
+
+
+def list_categories() -> list[str]:
+    return sorted(items_col.distinct("category"))
+
+
+def _count_true(field: str) -> dict:
+    return {"$sum": {"$cond": [{"$eq": [f"${field}", True]}, 1, 0]}}
+
+
+def get_item_facets(
+    available: Optional[bool] = None,
+    category: Optional[str] = None,
+    vegetarian: Optional[bool] = None,
+    vegan: Optional[bool] = None,
+    gluten_free: Optional[bool] = None,
+    daily_special: Optional[bool] = None,
+    exclude_allergens: int = 0,
+) -> dict:
+    """Counts per category, dietary flag, allergen and availability for the filtered items"""
+    q = _item_query(available, category, vegetarian, vegan, gluten_free, daily_special, exclude_allergens)
+    special_ids = todays_specials()["item_ids"]
+    facets = list(items_col.aggregate([
+        {"$match": q},
+        {"$facet": {
+            "categories": [{"$group": {"_id": "$category", "count": {"$sum": 1}}}],
+            "flags": [{"$group": {
+                "_id": None,
+                "total": {"$sum": 1},
+                "vegetarian": _count_true("is_vegetarian"),
+                "vegan": _count_true("is_vegan"),
+                "gluten_free": _count_true("is_gluten_free"),
+                "daily_special": {"$sum": {"$cond": [{"$in": ["$id", special_ids]}, 1, 0]}},
+                "available": _count_true("available"),
+            }}],
+            "allergens": [
+                {"$unwind": "$allergens"},
+                {"$group": {"_id": "$allergens", "count": {"$sum": 1}}},
+            ],
+        }},
+    ]))[0]
+    flags = facets["flags"][0] if facets["flags"] else {}
+    total = flags.get("total", 0)
+    return {
+        "total": total,
+        "categories": {r["_id"]: r["count"] for r in sorted(facets["categories"], key=lambda r: str(r["_id"]))},
+        "dietary": {k: flags.get(k, 0) for k in ("vegetarian", "vegan", "gluten_free", "daily_special")},
+        "allergens": {r["_id"]: r["count"] for r in sorted(facets["allergens"], key=lambda r: str(r["_id"]))},
+        "availability": {
+            "available": flags.get("available", 0),
+            "unavailable": total - flags.get("available", 0),
+        },
+    }
+
+
+def get_item_doc(item_id: int, fields: List[str]) -> Optional[dict]:
+    projection = {"_id": 0, "id": 1}
+    projection.update({f: 1 for f in fields})
+    return items_col.find_one({"id": item_id}, projection)
+
+
 def add_item(
     name: str,
     category: str,
@@ -290,8 +710,11 @@ def add_item(
     discount_percentage: float = 0.0,
     calories: Optional[int] = None,
     preparation_time: Optional[int] = None,
+    low_stock_threshold: Optional[int] = None,
 ) -> CafeteriaItem:
-    new_id = _get_next_item_id()
+    allergens = normalize_allergens(allergens or [])
+    new_id = _next_id("items")
+    threshold = LOW_STOCK_THRESHOLD if low_stock_threshold is None else int(low_stock_threshold)
     doc = {
         "id": new_id,
         "name": name,
@@ -306,13 +729,22 @@ def add_item(
         "is_vegetarian": is_vegetarian,
         "is_vegan": is_vegan,
         "is_gluten_free": is_gluten_free,
-        "allergens": allergens or [],
+        "allergens": allergens,
+        "allergen_mask": allergen_mask(allergens),
         "is_daily_special": is_daily_special,
         "discount_percentage": float(discount_percentage),
         "calories": calories,
         "preparation_time": preparation_time,
+        "low_stock_threshold": threshold,
     }
+    level = _stock_alert(doc["quantity"], threshold)
+    if level is not None:
+        doc["stock_alert"] = level
     items_col.insert_one(doc)
+    _bump_menu_version()
+    if is_daily_special or doc["discount_percentage"] > 0:
+        _bump_specials_version()
+    _announce_stock([doc])
     return _doc_to_item(doc)
 
 
@@ -333,6 +765,7 @@ def update_item(
     discount_percentage: Optional[float] = None,
     calories: Optional[int] = None,
     preparation_time: Optional[int] = None,
+    low_stock_threshold: Optional[int] = None,
 ) -> Optional[CafeteriaItem]:
     update_fields = {}
     
@@ -353,7 +786,8 @@ def update_item(
     if is_gluten_free is not None:
         update_fields["is_gluten_free"] = is_gluten_free
     if allergens is not None:
-        update_fields["allergens"] = allergens
+        update_fields["allergens"] = normalize_allergens(allergens)
+        update_fields["allergen_mask"] = allergen_mask(update_fields["allergens"])
     if is_daily_special is not None:
         update_fields["is_daily_special"] = is_daily_special
     if discount_percentage is not None:
@@ -372,61 +806,487 @@ def update_item(
     if available is not None:
         update_fields["available"] = bool(available)
     
+    if low_stock_threshold is not None:
+        if low_stock_threshold < 0:
+            raise ValueError("low_stock_threshold must be >= 0")
+        update_fields["low_stock_threshold"] = int(low_stock_threshold)
+    
     if not update_fields:
         return get_item_by_id(item_id)
     
-    res = items_col.update_one({"id": item_id}, {"$set": update_fields})
+    update = {"$set": update_fields}
+    stock = None
+    if quantity is not None or low_stock_threshold is not None:
+        stock = items_col.find_one({"id": item_id}, STOCK_ALERT_PROJECTION)
+        if stock is None:
+            return None
+        stock.update({k: update_fields[k] for k in ("quantity", "low_stock_threshold") if k in update_fields})
+        update = _stock_update(
+            int(stock["quantity"]),
+            int(stock.get("low_stock_threshold", LOW_STOCK_THRESHOLD)),
+            update_fields,
+        )
+    
+    res = items_col.update_one({"id": item_id}, update)
     if res.matched_count == 0:
         return None
+    _bump_menu_version()
+    if is_daily_special is not None or discount_percentage is not None:
+        _bump_specials_version()
+    if stock is not None:
+        _announce_stock([stock])
     
     return get_item_by_id(item_id)
 
 
 def delete_item(item_id: int) -> bool:
     res = items_col.delete_one({"id": item_id})
-    return res.deleted_count == 1
+    if res.deleted_count != 1:
+        return False
+    _bump_menu_version()
+    _bump_specials_version()
+    return True
+
+
+# STOCK ALERTS
+# Items carry stock_alert ("low" or "out") only while they need attention,
+# set in the same write that changes their quantity, so the partial index
+# on it holds just those items. Every change of level is published on
+# stock_events (tagged with the site); other workers pick up the change
+# through the site's "stock" topic.
+STOCK_ALERT_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "name": 1,
+    "category": 1,
+    "quantity": 1,
+    "low_stock_threshold": 1,
+    "stock_alert": 1,
+}
+
+stock_events = EventBroker()
+# site -> item_id -> the alert level this worker last announced
+_known_alerts: dict = {}
+_known_alerts_lock = threading.Lock()
+
+
+def _site_alerts() -> dict:
+    """The current site's announced levels, read from its items the first time"""
+    site = current_site()
+    known = _known_alerts.get(site)
+    if known is not None:
+        return known
+    current = {doc["id"]: doc["stock_alert"] for doc in get_stock_alerts()}
+    with _known_alerts_lock:
+        if site not in _known_alerts:
+            _known_alerts[site] = current
+            invalidation.subscribe(_topic("stock"), _in_site(site, _sync_stock_alerts))
+        return _known_alerts[site]
+
+
+def _stock_alert(quantity: int, threshold: int) -> Optional[str]:
+    if quantity <= 0:
+        return "out"
+    if quantity < threshold:
+        return "low"
+    return None
+
+
+def _stock_update(quantity: int, threshold: int, fields: dict) -> dict:
+    """An update that sets fields along with the stock_alert they imply"""
+    level = _stock_alert(quantity, threshold)
+    if level is None:
+        return {"$set": fields, "$unset": {"stock_alert": ""}}
+    return {"$set": {**fields, "stock_alert": level}}
+
+
+def _announce_stock(docs: list[dict], publish: bool = True) -> None:
+    """Emit an event for every item whose alert level changed since it was last announced"""
+    now = datetime.utcnow()
+    known = _site_alerts()
+    events = []
+    with _known_alerts_lock:
+        for doc in docs:
+            threshold = int(doc.get("low_stock_threshold", LOW_STOCK_THRESHOLD))
+            level = _stock_alert(int(doc["quantity"]), threshold) or "ok"
+            if known.get(doc["id"], "ok") == level:
+                continue
+            if level == "ok":
+                known.pop(doc["id"], None)
+            else:
+                known[doc["id"]] = level
+            events.append({
+                "site_id": current_site(),
+                "item_id": doc["id"],
+                "name": doc.get("name"),
+                "quantity": int(doc["quantity"]),
+                "threshold": threshold,
+                "level": level,
+                "at": now,
+            })
+    if not events:
+        return
+    if publish:
+        invalidation.publish(_topic("stock"))
+    for event in events:
+        stock_events.publish(event)
+
+
+def get_stock_alerts() -> list[dict]:
+    """Items that are low on or out of stock, emptiest first"""
+    docs = items_col.find({"stock_alert": {"$exists": True}}, STOCK_ALERT_PROJECTION)
+    return list(docs.sort([("quantity", 1), ("id", 1)]))
+
+
+def _sync_stock_alerts(version: int = 0) -> None:
+    """Announce alert changes made by other workers"""
+    current = get_stock_alerts()
+    alerted = {doc["id"] for doc in current}
+    known = _site_alerts()
+    with _known_alerts_lock:
+        gone = [iid for iid in known if iid not in alerted]
+    cleared = list(items_col.find({"id": {"$in": gone}}, STOCK_ALERT_PROJECTION)) if gone else []
+    with _known_alerts_lock:
+        # Deleted items have nothing left to announce
+        for iid in set(gone) - {doc["id"] for doc in cleared}:
+            known.pop(iid, None)
+    _announce_stock(current + cleared, publish=False)
+
+
+def _migrate_stock_thresholds():
+    """Give items created before per-item thresholds the default one and their stock_alert"""
+    for doc in items_col.find({"low_stock_threshold": {"$exists": False}}, {"_id": 0, "id": 1, "quantity": 1}):
+        quantity = int(doc.get("quantity", 0))
+        items_col.update_one(
+            {"id": doc["id"]},
+            _stock_update(quantity, LOW_STOCK_THRESHOLD, {"low_stock_threshold": LOW_STOCK_THRESHOLD}),
+        )
+
+
+_migrate_stock_thresholds()
+
+
+def _migrate_allergen_masks():
+    """Normalize allergens of items stored before the vocabulary existed and give them a mask"""
+    for doc in items_col.find({"allergen_mask": {"$exists": False}}, {"_id": 0, "id": 1, "allergens": 1}):
+        known, unknown = [], []
+        for name in doc.get("allergens") or []:
+            try:
+                known.append(normalize_allergen(name))
+            except ValueError:
+                unknown.append(name)
+        # Names outside the vocabulary are kept for display but can't be filtered on
+        items_col.update_one(
+            {"id": doc["id"]},
+            {"$set": {"allergens": list(dict.fromkeys(known)) + unknown, "allergen_mask": allergen_mask(known)}},
+        )
+
+
+_migrate_allergen_masks()
+_site_alerts()
 
 
 # RATINGS
+# Items keep rating_sum next to rating_avg/rating_count so ratings can be
+# added atomically (and in batches) without reading the document first.
+RATINGS_WRITE_BEHIND = os.getenv("RATINGS_WRITE_BEHIND", "0") == "1"
+RATINGS_FLUSH_INTERVAL = float(os.getenv("RATINGS_FLUSH_INTERVAL", "2"))
+RATINGS_FLUSH_MAX_PENDING = int(os.getenv("RATINGS_FLUSH_MAX_PENDING", "500"))
+ITEM_PUBLIC_PROJECTION = {"_id": 0, "rating_sum": 0}
+
+# Keyed by (site, item id)
+_rating_buffer = CoalescingBuffer(max_pending=RATINGS_FLUSH_MAX_PENDING)
+_rating_flush_lock = threading.Lock()
+
+
+def _rating_update(total: float, count: int) -> list[dict]:
+    """Pipeline update adding count ratings summing to total"""
+    current_sum = {
+        "$ifNull": [
+            "$rating_sum",
+            {"$multiply": [{"$ifNull": ["$rating_avg", 0]}, {"$ifNull": ["$rating_count", 0]}]},
+        ]
+    }
+    return [
+        {"$set": {
+            "rating_sum": {"$add": [current_sum, total]},
+            "rating_count": {"$add": [{"$ifNull": ["$rating_count", 0]}, count]},
+        }},
+        {"$set": {"rating_avg": {"$divide": ["$rating_sum", "$rating_count"]}}},
+    ]
+
+
+def _with_pending_ratings(doc: dict, pending: dict) -> dict:
+    """Item doc as it will look once buffered ratings are flushed.
+
+    ``pending`` comes from the same _rating_buffer.read() as doc, so a
+    batch being flushed is counted in one or the other.
+    """
+    total, count = pending.get((current_site(), int(doc["id"])), (0.0, 0))
+    if count:
+        persisted_count = int(doc.get("rating_count", 0))
+        persisted_sum = doc.get("rating_sum")
+        if persisted_sum is None:
+            persisted_sum = float(doc.get("rating_avg", 0.0)) * persisted_count
+        doc["rating_count"] = persisted_count + count
+        doc["rating_avg"] = (persisted_sum + total) / doc["rating_count"]
+    doc.pop("rating_sum", None)
+    return doc
+
+
 def add_rating(item_id: int, rating: int) -> Optional[dict]:
     if rating < 1 or rating > 5:
         raise ValueError("rating must be between 1 and 5")
     
-    doc = items_col.find_one({"id": item_id})
-    if not doc:
-        return None
-    
-    old_avg = float(doc.get("rating_avg", 0.0))
-    old_count = int(doc.get("rating_count", 0))
+    if RATINGS_WRITE_BEHIND:
+        key = (current_site(), item_id)
+        doc, pending = _rating_buffer.read(lambda: items_col.find_one({"id": item_id}, {"_id": 0}))
+        if not doc:
+            return None
+        if _rating_buffer.add(key, rating):
+            _rating_flusher.wake()
+        total, count = pending.get(key, (0.0, 0))
+        return _with_pending_ratings(doc, {key: (total + rating, count + 1)})
     
-    new_count = old_count + 1
-    new_avg = (old_avg * old_count + rating) / new_count
-    
-    items_col.update_one(
+    updated = items_col.find_one_and_update(
         {"id": item_id},
-        {"$set": {"rating_avg": new_avg, "rating_count": new_count}},
+        _rating_update(rating, 1),
+        projection=ITEM_PUBLIC_PROJECTION,
+        return_document=ReturnDocument.AFTER,
     )
-    
-    updated = items_col.find_one({"id": item_id}, {"_id": 0})
+    if updated is None:
+        return None
+    _bump_menu_version()
     return updated
 
 
+class OrderAlreadyRated(Exception):
+    """The order's ratings were already submitted"""
+
+
+def rate_order(order_id: int, ratings: dict[int, int]) -> Optional[list[dict]]:
+    """Rate items of a completed order in one write; returns their new rating aggregates.
+
+    The order is marked rated first (atomically), so submitting twice can't
+    count the same meal twice. None if the order doesn't exist.
+    """
+    if not ratings:
+        raise ValueError("No ratings given")
+    for rating in ratings.values():
+        if rating < 1 or rating > 5:
+            raise ValueError("rating must be between 1 and 5")
+
+    order = get_order_by_id(order_id, ["status", "items", "rated_at"])
+    if order is None:
+        return None
+    ordered_ids = {int(line["item_id"]) for line in order.get("items", [])}
+    for iid in ratings:
+        if iid not in ordered_ids:
+            raise ValueError(f"Item {iid} is not part of order {order_id}")
+
+    marked = orders_col.find_one_and_update(
+        {"id": order_id, "status": "completed", "rated_at": {"$exists": False}},
+        {"$set": {"rated_at": datetime.utcnow()}},
+        projection={"_id": 1},
+    )
+    if marked is None:
+        # Re-read to tell apart why the guarded update didn't match
+        current = get_order_by_id(order_id, ["status", "rated_at"]) or order
+        if current.get("rated_at"):
+            raise OrderAlreadyRated(f"Order {order_id} has already been rated")
+        if current.get("status") != "completed":
+            raise ValueError("Only completed orders can be rated")
+        raise ValueError(f"Order {order_id} has been archived and can no longer be rated")
+
+    if RATINGS_WRITE_BEHIND:
+        full = False
+        for iid, rating in ratings.items():
+            full = _rating_buffer.add((current_site(), iid), rating) or full
+        if full:
+            _rating_flusher.wake()
+    else:
+        try:
+            items_col.bulk_write(
+                [
+                    UpdateOne(items_col.scope({"id": iid}), _rating_update(rating, 1))
+                    for iid, rating in ratings.items()
+                ],
+                ordered=False,
+            )
+        except Exception:
+            orders_col.update_one({"id": order_id}, {"$unset": {"rated_at": ""}})
+            raise
+        _bump_menu_version()
+
+    docs, pending = _rating_buffer.read(lambda: list(items_col.find(
+        {"id": {"$in": list(ratings)}},
+        {"_id": 0, "id": 1, "name": 1, "rating_avg": 1, "rating_count": 1, "rating_sum": 1},
+    )))
+    return sorted((_with_pending_ratings(d, pending) for d in docs), key=lambda d: d["id"])
+
+
+def flush_ratings() -> int:
+    """Write buffered ratings (of every site) as one bulk_write; returns how many items were updated"""
+    with _rating_flush_lock:
+        batch = _rating_buffer.drain()
+        if not batch:
+            _rating_buffer.commit()
+            return 0
+        try:
+            items_col.bulk_write(
+                [
+                    UpdateOne({"site_id": site, "id": iid}, _rating_update(total, count))
+                    for (site, iid), (total, count) in batch.items()
+                ],
+                ordered=False,
+            )
+        except Exception:
+            _rating_buffer.restore()
+            raise
+        _rating_buffer.commit()
+        for site in {site for site, _ in batch}:
+            with use_site(site):
+                _bump_menu_version()
+        return len(batch)
+
+
+_rating_flusher = PeriodicWorker("rating-flusher", RATINGS_FLUSH_INTERVAL, flush_ratings)
+
+
+def start_rating_flusher() -> None:
+    if RATINGS_WRITE_BEHIND:
+        _rating_flusher.start()
+
+
+def stop_rating_flusher() -> None:
+    """Stop the flush timer and write out whatever is still buffered"""
+    _rating_flusher.stop()
+    flush_ratings()
+
+
 def get_top_rated_items(limit: int = 5) -> list[dict]:
     docs = list(
-        items_col.find({"rating_count": {"$gt": 0}}, {"_id": 0})
+        items_col.find({"rating_count": {"$gt": 0}}, ITEM_PUBLIC_PROJECTION)
         .sort([("rating_avg", -1), ("rating_count", -1)])
         .limit(limit)
     )
     return docs
 
 
+# ORDER SIDE EFFECTS
+# Handlers for tasks queued by the order writes. Payloads are ids where
+# possible, so a retry works from current data, plus the site that queued
+# the task, which the handler runs as.
+def _sync_order_sales(
+    col, docs: list[dict], legacy: Optional[int] = None, categories: Optional[dict] = None
+) -> int:
+    """Bring the rollups in line with each order's status, counting every order at most once.
+
+    An order's sales_counted (1 or 0) says whether the rollups of its
+    sales_gen include it. It is swapped with a compare-and-set before the
+    $inc, so a task that runs twice, or after a newer status change was
+    applied, changes nothing. (A failed $inc leaves the order uncounted
+    until backfill_sales_rollups.) Orders counted in an earlier generation
+    are left to the backfill that started the current one. Orders from
+    before the marker count as ``legacy``. Returns how many orders were
+    added or removed.
+    """
+    gen = _rollup_gen()
+    deltas = {1: [], -1: []}
+    for doc in docs:
+        counted = doc.get("sales_counted", legacy)
+        wanted = 0 if doc.get("status") == "cancelled" else 1
+        if counted is None or counted == wanted or (counted and doc.get("sales_gen", 0) != gen):
+            continue
+        swapped = col.update_one(
+            _sales_marker(doc), {"$set": {"sales_counted": wanted, "sales_gen": gen}},
+        )
+        if swapped.modified_count:
+            deltas[wanted - counted].append(doc)
+    for sign, changed in deltas.items():
+        _record_sales_many(changed, sign, categories, gen)
+    return len(deltas[1]) + len(deltas[-1])
+
+
+def _sales_marker(doc: dict) -> dict:
+    """Filter matching the order only while its status and sales markers are as read"""
+    return {
+        "id": doc["id"],
+        "status": doc.get("status"),
+        **{
+            f: doc[f] if f in doc else {"$exists": False}
+            for f in ("sales_counted", "sales_gen")
+        },
+    }
+
+
+def _record_sales_task(payload: dict) -> None:
+    # Orders from before sales_counted were counted as of the change before this one
+    legacy = 1 if payload["sign"] < 0 else 0
+    projection = {**ROLLUP_PROJECTION, "id": 1, "sales_counted": 1, "sales_gen": 1}
+    for col in (orders_col, orders_archive_col):
+        _sync_order_sales(col, list(col.find({"id": {"$in": payload["order_ids"]}}, projection)), legacy)
+
+
+def _announce_stock_task(payload: dict) -> None:
+    _announce_stock(payload["items"])
+
+
+def _apply_etas_task(payload: dict) -> None:
+    # Whatever the kitchen model says now, so out-of-order runs can't write a stale ETA
+    kitchen = _kitchen()
+    etas = {oid: kitchen.eta(oid) for oid in payload["order_ids"]}
+    _apply_eta_changes({oid: eta for oid, eta in etas.items() if eta is not None})
+
+
+def _site_task(handler):
+    # Tasks queued before sites existed belong to the default site
+    def run(payload: dict) -> None:
+        with use_site(payload.get("site_id")):
+            handler(payload)
+    return run
+
+
+tasks.register("record_sales", _site_task(_record_sales_task))
+tasks.register("announce_stock", _site_task(_announce_stock_task))
+tasks.register("apply_etas", _site_task(_apply_etas_task))
+
+
+def _enqueue(name: str, payload: dict) -> None:
+    tasks.enqueue(name, {**payload, "site_id": current_site()})
+
+
+def _queue_eta_writes(changes: dict) -> None:
+    if changes:
+        _enqueue("apply_etas", {"order_ids": sorted(changes)})
+
+
+def start_task_workers() -> None:
+    tasks.start()
+
+
+def stop_task_workers() -> None:
+    tasks.stop()
+
+
+def get_task_stats() -> dict:
+    return tasks.stats()
+
+
 # ORDERS
-def list_orders(customer_id: Optional[str] = None) -> list[dict]:
-    if customer_id is None:
-        docs = list(orders_col.find({}).sort([("id", -1)]))
-        return [_normalize_order_doc(d) for d in docs]
+def list_orders(
+    customer_id: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> list[dict]:
+    """List orders, newest first; a created_at range old enough also reads the archive"""
+    projection = _order_projection(fields)
+    with_items = fields is None or "items" in fields
     
-    if customer_id == "guest":
+    if customer_id is None:
+        q = {}
+    elif customer_id == "guest":
         q = {
             "$or": [
                 {"customer_id": "guest"},
@@ -436,13 +1296,28 @@ def list_orders(customer_id: Optional[str] = None) -> list[dict]:
     else:
         q = {"customer_id": customer_id}
     
-    docs = list(orders_col.find(q).sort([("id", -1)]))
-    return [_normalize_order_doc(d) for d in docs]
+    if since is not None or until is not None:
+        q["created_at"] = {}
+        if since is not None:
+            q["created_at"]["$gte"] = since
+        if until is not None:
+            q["created_at"]["$lt"] = until
+    
+    docs = list(orders_col.find(q, projection).sort([("id", -1)]))
+    if "created_at" in q and _range_reaches_archive(since):
+        # An order being archived may briefly be in both collections
+        by_id = {d["id"]: d for d in orders_archive_col.find(q, projection)}
+        by_id.update((d["id"], d) for d in docs)
+        docs = sorted(by_id.values(), key=lambda d: d["id"], reverse=True)
+    return [_normalize_order_doc(d, with_items) for d in docs]
 
 
-def get_order_by_id(order_id: int) -> Optional[dict]:
-    doc = orders_col.find_one({"id": order_id})
-    return _normalize_order_doc(doc) if doc else None
+def get_order_by_id(order_id: int, fields: Optional[List[str]] = None) -> Optional[dict]:
+    projection = _order_projection(fields)
+    doc = orders_col.find_one({"id": order_id}, projection)
+    if doc is None:
+        doc = orders_archive_col.find_one({"id": order_id}, projection)
+    return _normalize_order_doc(doc, fields is None or "items" in fields) if doc else None
 
 
 def create_order(customer_id: str, items: list[dict], notes: Optional[str] = None) -> dict:
@@ -453,7 +1328,6 @@ def create_order(customer_id: str, items: list[dict], notes: Optional[str] = Non
     db_items = list(items_col.find({"id": {"$in": ids}}))
     by_id = {int(d["id"]): d for d in db_items}
     
-    total_qty = 0
     for req in items:
         iid = int(req["item_id"])
         qty = int(req["quantity"])
@@ -463,18 +1337,18 @@ def create_order(customer_id: str, items: list[dict], notes: Optional[str] = Non
             raise ValueError("Quantity must be >= 1")
         if int(by_id[iid]["quantity"]) < qty:
             raise ValueError(f"Not enough stock for item {iid}")
-        total_qty += qty
     
     lines = []
     total = 0.0
+    discounts = todays_specials()["discounts"]
     for req in items:
         iid = int(req["item_id"])
         qty = int(req["quantity"])
         d = by_id[iid]
         unit_price = float(d["price"])
         
-        # Apply discount if item is daily special
-        discount = float(d.get("discount_percentage", 0.0))
+        # Apply today's special discount, if any
+        discount = discounts.get(iid, 0.0)
         if discount > 0:
             unit_price = unit_price * (1 - discount / 100)
         
@@ -486,22 +1360,34 @@ def create_order(customer_id: str, items: list[dict], notes: Optional[str] = Non
             "quantity": qty,
             "unit_price": unit_price,
             "line_total": line_total,
+            "category": d["category"],
         })
     
+    stock = []
     for req in items:
         iid = int(req["item_id"])
         qty = int(req["quantity"])
-        current_qty = int(by_id[iid]["quantity"])
-        new_qty = current_qty - qty
+        d = by_id[iid]
+        new_qty = int(d["quantity"]) - qty
+        threshold = int(d.get("low_stock_threshold", LOW_STOCK_THRESHOLD))
         items_col.update_one(
             {"id": iid},
-            {"$set": {"quantity": new_qty, "available": new_qty > 0}},
+            _stock_update(new_qty, threshold, {"quantity": new_qty, "available": new_qty > 0}),
         )
+        stock.append({
+            "id": iid,
+            "name": d["name"],
+            "quantity": new_qty,
+            "low_stock_threshold": threshold,
+        })
+    _bump_menu_version()
+    _enqueue("announce_stock", {"items": stock})
     
-    eta_minutes = BASE_PREP_MINUTES + (total_qty * PER_ITEM_MINUTES)
+    prep_minutes = _prep_minutes(lines, by_id)
     now = datetime.utcnow()
     
-    oid = _get_next_order_id()
+    oid = _next_id("orders")
+    eta = _kitchen().enqueue(oid, prep_minutes, now)
     order_doc = {
         "id": oid,
         "customer_id": customer_id,
@@ -509,12 +1395,17 @@ def create_order(customer_id: str, items: list[dict], notes: Optional[str] = Non
         "items": lines,
         "total_price": total,
         "created_at": now,
-        "estimated_ready_at": now + timedelta(minutes=eta_minutes),
-        "status_history": [{"status": "pending", "at": now}],
+        "estimated_ready_at": eta,
+        "prep_minutes": prep_minutes,
         "notes": notes,
+        # Set to 1 once the record_sales task has added the order to the rollups
+        "sales_counted": 0,
     }
     
     orders_col.insert_one(order_doc)
+    status_history_col.insert_one({"order_id": oid, "status": "pending", "at": now})
+    invalidation.publish(_topic("orders"))
+    _enqueue("record_sales", {"order_ids": [oid], "sign": 1})
     return _normalize_order_doc(order_doc)
 
 
@@ -530,19 +1421,498 @@ def update_order_status(order_id: int, new_status: str) -> Optional[dict]:
     
     if new_status == "completed":
         update_fields["completed_at"] = now
+    if new_status == "preparing":
+        update_fields["started_at"] = now
     
-    res = orders_col.update_one(
+    before = orders_col.find_one_and_update(
         {"id": order_id},
-        {
-            "$set": update_fields,
-            "$push": {"status_history": {"status": new_status, "at": now}},
-        },
+        {"$set": update_fields},
+        projection=ROLLUP_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
     )
-    if res.matched_count == 0:
+    if before is None:
         return None
+    status_history_col.insert_one({"order_id": order_id, "status": new_status, "at": now})
+    
+    # Cancelled orders don't count as sales; un-cancelling counts them again
+    was_cancelled = before.get("status") == "cancelled"
+    if new_status == "cancelled" and not was_cancelled:
+        _enqueue("record_sales", {"order_ids": [order_id], "sign": -1})
+    elif was_cancelled and new_status != "cancelled":
+        _enqueue("record_sales", {"order_ids": [order_id], "sign": 1})
+    
+    # Keep the kitchen model in step; the orders behind this one get new ETAs
+    if new_status == "preparing":
+        _queue_eta_writes(_kitchen().start(order_id, now))
+    elif new_status not in ACTIVE_KITCHEN_STATUSES:
+        _queue_eta_writes(_kitchen().finish(order_id, now))
+    invalidation.publish(_topic("orders"))
     return get_order_by_id(order_id)
 
 
+def update_order_statuses(
+    new_status: str,
+    order_ids: Optional[List[int]] = None,
+    from_status: Optional[str] = None,
+    customer_id: Optional[str] = None,
+) -> list[int]:
+    """Move many orders to new_status at once; returns the ids that changed.
+
+    Orders are picked by id or by filter (from_status, customer_id), and
+    only those whose current status may move to new_status (see
+    ALLOWED_TRANSITIONS) are touched. One update_many per current status
+    keeps the check and the write atomic per order.
+    """
+    if new_status not in VALID_STATUSES:
+        raise ValueError(f"Invalid status: {new_status}")
+    if from_status is not None and from_status not in VALID_STATUSES:
+        raise ValueError(f"Invalid status: {from_status}")
+    sources = [s for s, targets in ALLOWED_TRANSITIONS.items() if new_status in targets]
+    if from_status is not None:
+        sources = [s for s in sources if s == from_status]
+
+    query = {"status": {"$in": sources}}
+    if order_ids is not None:
+        query["id"] = {"$in": list(order_ids)}
+    if customer_id is not None:
+        query["customer_id"] = customer_id
+    if not sources or order_ids == []:
+        return []
+
+    candidates = {}
+    for doc in orders_col.find(query, {**ROLLUP_PROJECTION, "id": 1}):
+        candidates.setdefault(doc["status"], []).append(doc)
+    if not candidates:
+        return []
+
+    now = datetime.utcnow()
+    update_fields = {"status": new_status, "updated_at": now}
+    if new_status == "completed":
+        update_fields["completed_at"] = now
+    if new_status == "preparing":
+        update_fields["started_at"] = now
+
+    changed = []
+    for status, docs in candidates.items():
+        ids = [doc["id"] for doc in docs]
+        result = orders_col.update_many(
+            {"id": {"$in": ids}, "status": status},
+            {"$set": update_fields},
+        )
+        if result.modified_count != len(ids):
+            # Some moved on since we read them; keep only the ones this update hit
+            hit = {
+                d["id"] for d in orders_col.find(
+                    {"id": {"$in": ids}, "status": new_status, "updated_at": now}, {"_id": 0, "id": 1}
+                )
+            }
+            docs = [doc for doc in docs if doc["id"] in hit]
+        changed.extend(docs)
+    if not changed:
+        return []
+
+    changed_ids = sorted(doc["id"] for doc in changed)
+    status_history_col.insert_many(
+        [{"order_id": oid, "status": new_status, "at": now} for oid in changed_ids]
+    )
+
+    # Cancelled orders don't count as sales (there are no moves out of "cancelled")
+    if new_status == "cancelled":
+        _enqueue("record_sales", {"order_ids": changed_ids, "sign": -1})
+
+    if new_status == "preparing":
+        _queue_eta_writes(_kitchen().start_many(changed_ids, now))
+    elif new_status not in ACTIVE_KITCHEN_STATUSES:
+        _queue_eta_writes(_kitchen().finish_many(changed_ids, now))
+    invalidation.publish(_topic("orders"))
+    return changed_ids
+
+
+def get_order_status_history(order_id: int) -> list[dict]:
+    """Get the status changes of an order, oldest first"""
+    docs = status_history_col.find(
+        {"order_id": order_id},
+        {"_id": 0, "status": 1, "at": 1},
+    ).sort([("at", 1)])
+    return list(docs)
+
+
+# ORDER ARCHIVE
+# Finished orders are moved out of orders_col so it (and its indexes) stay
+# small. Their units sold are added to archived_item_sales, so the
+# top-selling counts don't change; sales rollups are kept separately.
+def _range_reaches_archive(since: Optional[datetime]) -> bool:
+    if since is None:
+        return True
+    return since < datetime.utcnow() - timedelta(days=ORDER_ARCHIVE_AFTER_DAYS)
+
+
+def _add_archived_sales(docs: list[dict], sign: int = 1) -> None:
+    units = {}
+    for doc in docs:
+        for line in _order_sales_lines(doc, categories={}):
+            units[line["item_id"]] = units.get(line["item_id"], 0) + sign * line["units"]
+    if units:
+        archived_sales_col.bulk_write(
+            [
+                UpdateOne(archived_sales_col.scope({"item_id": iid}), {"$inc": {"units_sold": n}}, upsert=True)
+                for iid, n in units.items()
+            ],
+            ordered=False,
+        )
+
+
+def archive_orders(
+    older_than_days: float = ORDER_ARCHIVE_AFTER_DAYS,
+    batch_size: int = ORDER_ARCHIVE_BATCH_SIZE,
+) -> int:
+    """Move completed/cancelled orders created more than older_than_days ago to the archive"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    query = {"status": {"$in": list(ARCHIVABLE_STATUSES)}, "created_at": {"$lt": cutoff}}
+    moved = 0
+    while True:
+        docs = list(orders_col.find(query).sort([("id", 1)]).limit(batch_size))
+        if not docs:
+            break
+        now = datetime.utcnow()
+        for doc in docs:
+            doc["archived_at"] = now
+            doc["sales_archived"] = False
+        
+        try:
+            orders_archive_col.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Ids already in the archive were copied by an interrupted run or
+            # another worker; their copies keep their own sales_archived
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+        
+        # Each copy's sales_archived is flipped with a compare-and-set before
+        # the $inc, so a rerun adds exactly the orders no run counted yet.
+        # (Copies from before the flag were counted when they were moved.)
+        counted = [
+            doc for doc in docs
+            if orders_archive_col.update_one(
+                {"id": doc["id"], "sales_archived": False}, {"$set": {"sales_archived": True}},
+            ).modified_count
+        ]
+        _add_archived_sales(counted)
+        
+        ids = [doc["id"] for doc in docs]
+        removed = orders_col.delete_many({**query, "id": {"$in": ids}}).deleted_count
+        if removed != len(ids):
+            # Orders that left completed/cancelled since we read them (un-cancelled)
+            # stay live; drop their copies from the archive and take back their sales
+            kept = [d["id"] for d in orders_col.find({"id": {"$in": ids}}, {"_id": 0, "id": 1})]
+            if kept:
+                uncounted = list(orders_archive_col.find(
+                    {"id": {"$in": kept}, "sales_archived": {"$ne": False}}, ROLLUP_PROJECTION,
+                ))
+                orders_archive_col.delete_many({"id": {"$in": kept}})
+                _add_archived_sales(uncounted, sign=-1)
+        moved += removed
+        if len(docs) < batch_size:
+            break
+    return moved
+
+
+def _archive_due_orders() -> None:
+    if ORDER_ARCHIVE_AFTER_DAYS > 0:
+        for site in orders_col.raw.distinct("site_id"):
+            with use_site(site):
+                archive_orders()
+
+
+_order_archiver = PeriodicWorker("order-archiver", ORDER_ARCHIVE_INTERVAL, _archive_due_orders)
+
+
+def start_order_archiver() -> None:
+    if ORDER_ARCHIVE_AFTER_DAYS > 0:
+        _order_archiver.start()
+
+
+def stop_order_archiver() -> None:
+    _order_archiver.stop()
+
+
+# IDEMPOTENCY
+# Keys live in idempotency_keys (_id = key, TTL-expired) with the most
+# recent completed responses mirrored in an in-process LRU. Keys sent to
+# other sites than the default one are stored as "<site>:<key>".
+_idempotency_lru = LRUCache(max_entries=2048)
+
+
+def _site_key(key: str) -> str:
+    site = current_site()
+    return key if site == DEFAULT_SITE_ID else f"{site}:{key}"
+
+
+class IdempotencyKeyConflict(Exception):
+    """The key was reused for a different request, or its first request is still running"""
+
+    def __init__(self, message: str, in_progress: bool = False):
+        super().__init__(message)
+        self.in_progress = in_progress
+
+
+def begin_idempotent_request(key: str, fingerprint: str) -> Optional[dict]:
+    """Claim an idempotency key.
+
+    Returns the stored response if the key already completed, or None once
+    the caller owns the key and should process the request.
+    """
+    original_key, key = key, _site_key(key)
+    cached = _idempotency_lru.get(key)
+    if cached is not None:
+        if cached["fingerprint"] != fingerprint:
+            raise IdempotencyKeyConflict("Idempotency-Key was already used for a different request")
+        return cached["response"]
+    
+    now = datetime.utcnow()
+    try:
+        idempotency_col.insert_one({
+            "_id": key,
+            "fingerprint": fingerprint,
+            "state": "in_progress",
+            "created_at": now,
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+    
+    doc = idempotency_col.find_one({"_id": key})
+    if doc is None:
+        # Expired or aborted between our insert and read; try once more
+        return begin_idempotent_request(original_key, fingerprint)
+    if doc["fingerprint"] != fingerprint:
+        raise IdempotencyKeyConflict("Idempotency-Key was already used for a different request")
+    if doc["state"] == "completed":
+        _idempotency_lru.put(key, doc, ttl=IDEMPOTENCY_TTL_SECONDS)
+        return doc["response"]
+    
+    taken_over = idempotency_col.find_one_and_update(
+        {
+            "_id": key,
+            "state": "in_progress",
+            "created_at": {"$lt": now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)},
+        },
+        {"$set": {"created_at": now}},
+    )
+    if taken_over is None:
+        raise IdempotencyKeyConflict("A request with this Idempotency-Key is still being processed", in_progress=True)
+    return None
+
+
+def complete_idempotent_request(key: str, fingerprint: str, response: dict) -> None:
+    key = _site_key(key)
+    idempotency_col.update_one(
+        {"_id": key},
+        {"$set": {"state": "completed", "response": response}},
+    )
+    _idempotency_lru.put(
+        key,
+        {"fingerprint": fingerprint, "response": response},
+        ttl=IDEMPOTENCY_TTL_SECONDS,
+    )
+
+
+def abort_idempotent_request(key: str) -> None:
+    """Release a claimed key after a failed request so a corrected retry can run"""
+    key = _site_key(key)
+    idempotency_col.delete_one({"_id": key, "state": "in_progress"})
+    _idempotency_lru.pop(key)
+
+
+# SALES ROLLUPS
+# One document per (granularity, bucket) with orders, units and revenue in
+# total, per item and per category, kept current with $inc as orders are
+# created or cancelled.
+ROLLUP_PROJECTION = {
+    "_id": 0,
+    "status": 1,
+    "created_at": 1,
+    "items": 1,
+    "total_price": 1,
+    "item_id": 1,
+    "quantity": 1,
+}
+
+
+def _bucket_start(ts: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _order_sales_lines(doc: dict, categories: Optional[dict] = None) -> list[dict]:
+    """(item_id, category, units, revenue) for each line of an order"""
+    if isinstance(doc.get("items"), list):
+        lines = doc["items"]
+    else:
+        qty = int(doc.get("quantity", 0))
+        lines = [{"item_id": doc.get("item_id"), "quantity": qty, "line_total": float(doc.get("total_price", 0.0))}]
+    
+    out = []
+    for line in lines:
+        iid = line.get("item_id")
+        if iid is None:
+            continue
+        category = line.get("category")
+        if category is None:
+            if categories is None:
+                item = items_col.find_one({"id": iid}, {"_id": 0, "category": 1})
+                category = item["category"] if item else "unknown"
+            else:
+                category = categories.get(iid, "unknown")
+        out.append({
+            "item_id": int(iid),
+            "category": category,
+            "units": int(line.get("quantity", 0)),
+            "revenue": float(line.get("line_total", 0.0)),
+        })
+    return out
+
+
+def _field_name(value) -> str:
+    """value as a single field name: no dots (they nest) and no leading $ (operators)"""
+    name = str(value).replace(".", "\uff0e") or "unknown"
+    return "\uff04" + name[1:] if name.startswith("$") else name
+
+
+def _sales_increments(lines: list[dict], sign: int = 1) -> dict:
+    inc = {
+        "orders": sign,
+        "units": sign * sum(x["units"] for x in lines),
+        "revenue": sign * sum(x["revenue"] for x in lines),
+    }
+    for scope, key in (("items", "item_id"), ("categories", "category")):
+        counted = set()
+        for x in lines:
+            name = _field_name(x[key])
+            prefix = f"{scope}.{name}"
+            inc[f"{prefix}.units"] = inc.get(f"{prefix}.units", 0) + sign * x["units"]
+            inc[f"{prefix}.revenue"] = inc.get(f"{prefix}.revenue", 0.0) + sign * x["revenue"]
+            if name not in counted:
+                counted.add(name)
+                inc[f"{prefix}.orders"] = sign
+    return inc
+
+
+def _record_sales(doc: dict, sign: int = 1) -> None:
+    """Add (or with sign=-1, remove) an order's sales in every rollup bucket"""
+    _record_sales_many([doc], sign)
+
+
+def _rollup_gen_key() -> str:
+    return f"{current_site()}:sales_rollups"
+
+
+def _rollup_gen() -> int:
+    """The site's current generation of rollup documents (see backfill_sales_rollups)"""
+    doc = counters_col.find_one({"_id": _rollup_gen_key()}, {"gen": 1})
+    return int(doc.get("gen", 0)) if doc else 0
+
+
+def _record_sales_many(
+    docs: list[dict], sign: int = 1, categories: Optional[dict] = None, gen: Optional[int] = None
+) -> None:
+    """_record_sales for several orders, with one $inc per rollup bucket of generation ``gen``"""
+    if gen is None:
+        gen = _rollup_gen()
+    buckets = {}
+    for doc in docs:
+        created_at = doc.get("created_at")
+        if created_at is None:
+            continue
+        inc = _sales_increments(_order_sales_lines(doc, categories), sign)
+        for g in ROLLUP_GRANULARITIES:
+            bucket = buckets.setdefault((g, _bucket_start(created_at, g)), {})
+            for path, value in inc.items():
+                bucket[path] = bucket.get(path, 0) + value
+    if not buckets:
+        return
+    rollups_col.bulk_write(
+        [
+            UpdateOne(rollups_col.scope({"gen": gen, "granularity": g, "bucket": b}), {"$inc": inc}, upsert=True)
+            for (g, b), inc in buckets.items()
+        ],
+        ordered=False,
+    )
+
+
+def _recount_sales(col, docs: list[dict], gen: int, categories: dict) -> int:
+    """Move orders into rollup generation ``gen``, adding the ones that count; returns how many did"""
+    projection = {**ROLLUP_PROJECTION, "id": 1, "sales_counted": 1, "sales_gen": 1}
+    added = []
+    while docs:
+        changed = []
+        for doc in docs:
+            wanted = 0 if doc.get("status") == "cancelled" else 1
+            swapped = col.update_one(
+                _sales_marker(doc), {"$set": {"sales_counted": wanted, "sales_gen": gen}},
+            )
+            if not swapped.modified_count:
+                changed.append(doc["id"])
+            elif wanted:
+                added.append(doc)
+        # Status changes (or archiving) since they were read: read them again
+        docs = list(col.find({"id": {"$in": changed}, "sales_gen": {"$ne": gen}}, projection)) if changed else []
+    _record_sales_many(added, 1, categories, gen)
+    return len(added)
+
+
+def backfill_sales_rollups(batch_size: int = 500) -> int:
+    """Rebuild the site's rollup documents from its live and archived orders; returns how many count.
+
+    The rebuild goes into a new generation of rollup documents, which
+    readers switch to straight away. Orders counted in the old one are
+    left alone by the record_sales task until they are recounted here,
+    each with a compare-and-set that moves it to the new generation and
+    adds its sales in one step, so no order is counted twice or lost to a
+    concurrent status change. The old generation is dropped at the end.
+    """
+    categories = {
+        int(d["id"]): d["category"]
+        for d in items_col.find({}, {"_id": 0, "id": 1, "category": 1})
+    }
+    gen = int(counters_col.find_one_and_update(
+        {"_id": _rollup_gen_key()},
+        {"$inc": {"gen": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )["gen"])
+
+    counted = 0
+    projection = {**ROLLUP_PROJECTION, "id": 1, "sales_counted": 1, "sales_gen": 1}
+    while True:
+        # Again until nothing is left, for orders archived after the archive was read
+        seen = 0
+        for col in (orders_col, orders_archive_col):
+            batch = []
+            for doc in col.find({"sales_gen": {"$ne": gen}}, projection):
+                batch.append(doc)
+                seen += 1
+                if len(batch) >= batch_size:
+                    counted += _recount_sales(col, batch, gen, categories)
+                    batch = []
+            counted += _recount_sales(col, batch, gen, categories)
+        if not seen:
+            break
+    rollups_col.delete_many({"gen": {"$ne": gen}})
+    return counted
+
+
+def get_sales_rollups(granularity: str, start: datetime, end: datetime) -> list[dict]:
+    """Get rollup buckets with start <= bucket < end, oldest first"""
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(ROLLUP_GRANULARITIES)}")
+    docs = rollups_col.find(
+        {"gen": _rollup_gen(), "granularity": granularity, "bucket": {"$gte": start, "$lt": end}},
+        {"_id": 0, "gen": 0},
+    ).sort([("bucket", 1)])
+    return list(docs)
+
+
 # ANALYTICS
 def get_top_selling_items(limit: int = 5) -> list[dict]:
     pipeline_cart = [
@@ -562,6 +1932,9 @@ def get_top_selling_items(limit: int = 5) -> list[dict]:
     for r in cart + old:
         iid = int(r["_id"])
         combined[iid] = combined.get(iid, 0) + int(r["units_sold"])
+    for r in archived_sales_col.find({}, {"_id": 0, "item_id": 1, "units_sold": 1}):
+        iid = int(r["item_id"])
+        combined[iid] = combined.get(iid, 0) + int(r["units_sold"])
     
     out = []
     for iid, units in sorted(combined.items(), key=lambda x: x[1], reverse=True)[:limit]:
@@ -574,6 +1947,93 @@ def get_top_selling_items(limit: int = 5) -> list[dict]:
     return out
 
 
+def _top_selling_from_rollups(limit: int) -> list[dict]:
+    """Units sold per item summed over the daily rollups (so without cancelled orders)"""
+    rows = list(rollups_col.aggregate([
+        {"$match": {"gen": _rollup_gen(), "granularity": "day"}},
+        {"$project": {"items": {"$objectToArray": "$items"}}},
+        {"$unwind": "$items"},
+        {"$group": {"_id": "$items.k", "units_sold": {"$sum": "$items.v.units"}}},
+        {"$match": {"units_sold": {"$gt": 0}}},
+        {"$sort": {"units_sold": -1, "_id": 1}},
+        {"$limit": limit},
+    ]))
+    ids = [int(r["_id"]) for r in rows]
+    names = {d["id"]: d["name"] for d in items_col.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "name": 1})}
+    return [
+        {"item_id": iid, "name": names.get(iid, f"Item {iid}"), "units_sold": r["units_sold"]}
+        for iid, r in zip(ids, rows)
+    ]
+
+
+def get_dashboard_snapshot(top_limit: int = 5) -> dict:
+    """Everything the admin dashboard shows, in a handful of queries"""
+    item_card = {"_id": 0, "id": 1, "name": 1, "category": 1, "quantity": 1}
+    facets = list(items_col.aggregate([
+        {"$facet": {
+            "summary": [
+                {"$group": {
+                    "_id": None,
+                    "total_items": {"$sum": 1},
+                    "available_items": {"$sum": {"$cond": ["$available", 1, 0]}},
+                    "total_units": {"$sum": "$quantity"},
+                }},
+            ],
+            "low_stock": [
+                {"$match": {"stock_alert": "low"}},
+                {"$sort": {"quantity": 1}},
+                {"$project": item_card},
+            ],
+            "out_of_stock": [
+                {"$match": {"stock_alert": "out"}},
+                {"$project": item_card},
+            ],
+            "top_rated": [
+                {"$match": {"rating_count": {"$gt": 0}}},
+                {"$sort": {"rating_avg": -1, "rating_count": -1}},
+                {"$limit": top_limit},
+                {"$project": {"_id": 0, "id": 1, "name": 1, "category": 1, "rating_avg": 1, "rating_count": 1}},
+            ],
+        }},
+    ]))[0]
+    summary = facets["summary"][0] if facets["summary"] else {}
+    summary.pop("_id", None)
+    
+    by_status = {s: 0 for s in ACTIVE_ORDER_STATUSES}
+    for row in orders_col.aggregate([
+        {"$match": {"status": {"$in": list(ACTIVE_ORDER_STATUSES)}}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+    ]):
+        by_status[row["_id"]] = row["count"]
+    
+    # Today's totals come from the maintained daily rollup
+    today = rollups_col.find_one(
+        {"gen": _rollup_gen(), "granularity": "day", "bucket": _bucket_start(datetime.utcnow(), "day")},
+        {"_id": 0, "orders": 1, "units": 1, "revenue": 1},
+    ) or {}
+    
+    return {
+        "menu": {
+            "total_items": summary.get("total_items", 0),
+            "available_items": summary.get("available_items", 0),
+            "total_units": summary.get("total_units", 0),
+            "low_stock_count": len(facets["low_stock"]),
+            "out_of_stock_count": len(facets["out_of_stock"]),
+        },
+        "low_stock_items": facets["low_stock"],
+        "out_of_stock_items": facets["out_of_stock"],
+        "active_orders": by_status,
+        "today": {
+            "orders": today.get("orders", 0),
+            "units": today.get("units", 0),
+            "revenue": today.get("revenue", 0.0),
+        },
+        "top_selling": _top_selling_from_rollups(top_limit),
+        "top_rated": facets["top_rated"],
+        "generated_at": datetime.utcnow(),
+    }
+
+
 # FAVORITES
 def add_favorite(customer_id: str, item_id: int) -> bool:
     """Add item to user's favorites"""
@@ -606,7 +2066,156 @@ def get_favorites(customer_id: str) -> list[int]:
     return [int(d["item_id"]) for d in docs]
 
 
+# DAILY SPECIALS
+# specials_schedule holds (item, date range, discount) entries. Today's
+# specials are resolved from it once per (UTC) day, and again whenever the
+# "specials" version moves: on schedule changes, and on writes to the older
+# per-item is_daily_special/discount_percentage fields, which still count.
+# create_order prices lines from the resolved discounts.
+# site -> {"key", "item_ids", "discounts"}
+_todays_specials: dict = {}
+_todays_specials_lock = threading.Lock()
+
+
+def _bump_specials_version() -> None:
+    invalidation.publish(_topic("specials"))
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+def _special_out(doc: dict) -> dict:
+    doc = dict(doc)
+    doc["start_date"] = doc["start_date"].date()
+    doc["end_date"] = doc["end_date"].date()
+    return doc
+
+
+def _resolve_specials(day: date) -> dict:
+    item_ids, discounts = [], {}
+    for doc in items_col.find(
+        {"$or": [{"is_daily_special": True}, {"discount_percentage": {"$gt": 0}}]},
+        {"_id": 0, "id": 1, "is_daily_special": 1, "discount_percentage": 1},
+    ):
+        if doc.get("is_daily_special"):
+            item_ids.append(int(doc["id"]))
+        if float(doc.get("discount_percentage") or 0.0) > 0:
+            discounts[int(doc["id"])] = float(doc["discount_percentage"])
+    
+    start = _day_start(day)
+    # Where scheduled entries overlap, the one that started last wins
+    for entry in specials_col.find(
+        {"start_date": {"$lte": start}, "end_date": {"$gte": start}},
+        {"_id": 0, "item_id": 1, "discount_percentage": 1},
+    ).sort([("start_date", 1), ("id", 1)]):
+        item_ids.append(int(entry["item_id"]))
+        discounts[int(entry["item_id"])] = float(entry["discount_percentage"])
+    return {"item_ids": list(dict.fromkeys(item_ids)), "discounts": discounts}
+
+
+def todays_specials() -> dict:
+    """Today's special item ids and discounts by item id, resolved at most once per change"""
+    site = current_site()
+    day = datetime.utcnow().date()
+    key = (day.isoformat(), invalidation.version(_topic("specials")))
+    with _todays_specials_lock:
+        specials = _todays_specials.get(site)
+        if specials is None or specials["key"] != key:
+            specials = _todays_specials[site] = {"key": key, **_resolve_specials(day)}
+            specials["special_ids"] = frozenset(specials["item_ids"])
+        return specials
+
+
+def apply_specials(doc: dict, specials: Optional[dict] = None) -> dict:
+    """Set the is_daily_special/discount_percentage an item dict holds to today's"""
+    specials = specials or todays_specials()
+    iid = int(doc["id"])
+    if "is_daily_special" in doc:
+        doc["is_daily_special"] = iid in specials["special_ids"]
+    if "discount_percentage" in doc:
+        doc["discount_percentage"] = specials["discounts"].get(iid, 0.0)
+    return doc
+
+
+def _sold_today(item: CafeteriaItem, specials: dict) -> CafeteriaItem:
+    return replace(
+        item,
+        is_daily_special=item.id in specials["special_ids"],
+        discount_percentage=specials["discounts"].get(item.id, 0.0),
+    )
+
+
+def list_menu_items() -> List[CafeteriaItem]:
+    """Items as sold today: flagged and discounted per todays_specials()"""
+    specials = todays_specials()
+    return [_sold_today(item, specials) for item in list_items()]
+
+
 def get_daily_specials() -> list[dict]:
-    """Get items marked as daily specials"""
-    docs = list(items_col.find({"is_daily_special": True}, {"_id": 0}))
-    return docs
\ No newline at end of file
+    """Get today's specials with the discount that applies today"""
+    specials = todays_specials()
+    by_id = {
+        int(doc["id"]): doc
+        for doc in items_col.find({"id": {"$in": specials["item_ids"]}}, ITEM_PUBLIC_PROJECTION)
+    }
+    docs = []
+    for iid in specials["item_ids"]:
+        if iid in by_id:
+            doc = by_id[iid]
+            doc["is_daily_special"] = True
+            doc["discount_percentage"] = specials["discounts"].get(iid, 0.0)
+            docs.append(doc)
+    return docs
+
+
+# One MenuIndex per site, for its menu version and specials resolution
+_menu_index_cache = VersionedCache(max_entries=max(16, len(SITES)))
+
+
+def get_menu_index() -> MenuIndex:
+    """Sorted snapshot of the menu for range queries and paging"""
+    specials = todays_specials()
+    version = (get_menu_version(), specials["key"])
+    return _menu_index_cache.get(
+        current_site(),
+        version,
+        lambda: MenuIndex([_sold_today(it, specials) for it in list_items()], specials["discounts"], version),
+    )
+
+
+def list_specials(on: Optional[date] = None) -> list[dict]:
+    """Scheduled specials, optionally only those running on a given day"""
+    q = {}
+    if on is not None:
+        q = {"start_date": {"$lte": _day_start(on)}, "end_date": {"$gte": _day_start(on)}}
+    docs = specials_col.find(q, {"_id": 0}).sort([("start_date", 1), ("id", 1)])
+    return [_special_out(d) for d in docs]
+
+
+def add_special(item_id: int, start_date: date, end_date: date, discount_percentage: float = 0.0) -> dict:
+    if end_date < start_date:
+        raise ValueError("end_date must not be before start_date")
+    if items_col.find_one({"id": item_id}, {"_id": 1}) is None:
+        raise ValueError(f"Item {item_id} not found")
+    
+    doc = {
+        "id": _next_id("specials"),
+        "item_id": item_id,
+        "start_date": _day_start(start_date),
+        "end_date": _day_start(end_date),
+        "discount_percentage": float(discount_percentage),
+        "created_at": datetime.utcnow(),
+    }
+    specials_col.insert_one(doc)
+    _bump_specials_version()
+    doc.pop("_id", None)
+    return _special_out(doc)
+
+
+def delete_special(special_id: int) -> bool:
+    res = specials_col.delete_one({"id": special_id})
+    if res.deleted_count != 1:
+        return False
+    _bump_specials_version()
+    return True
\ No newline at end of file
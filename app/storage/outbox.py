@@ -0,0 +1,196 @@
+# app/storage/outbox.py
+
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from app.core.background import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+
+class TaskOutbox:
+    """Runs side effects of a write after the request that made it has returned.
+
+    ``enqueue()`` records a task in the outbox collection and hands it to a
+    bounded in-memory queue served by ``workers`` threads. A task is claimed
+    atomically before it runs and deleted once it succeeds; a failure puts
+    it back with a backoff until ``max_attempts``, after which it stays in
+    the collection as ``failed``. A sweeper picks up tasks that are due for
+    a retry, that didn't fit in the queue, or whose worker died (its claim
+    is older than ``lease``), including tasks left over from before a
+    restart. Tasks may therefore run more than once.
+
+    Until ``start()`` is called (scripts, tests) tasks run inline; only a
+    failed one is written to the outbox.
+    """
+
+    def __init__(
+        self,
+        col: Collection,
+        workers: int = 2,
+        queue_size: int = 1000,
+        max_attempts: int = 5,
+        sweep_interval: float = 5.0,
+        lease: float = 60.0,
+    ):
+        self.col = col
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.lease = timedelta(seconds=lease)
+        self._handlers: Dict[str, Callable[[dict], None]] = {}
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._sweeper = PeriodicWorker("outbox-sweeper", sweep_interval, self.sweep)
+
+    @property
+    def running(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def register(self, name: str, handler: Callable[[dict], None]) -> None:
+        self._handlers[name] = handler
+
+    def enqueue(self, name: str, payload: dict) -> None:
+        if name not in self._handlers:
+            raise ValueError(f"No handler for task {name}")
+        now = datetime.utcnow()
+        if not self.running:
+            try:
+                self._handlers[name](payload)
+            except Exception as e:
+                logger.exception("task %s failed, queued for retry", name)
+                self.col.insert_one(self._doc(name, payload, now, attempts=1, error=repr(e)))
+            return
+
+        doc = self._doc(name, payload, now)
+        self.col.insert_one(doc)
+        self._offer(doc["_id"], {"status": "pending"})
+
+    def _doc(self, name: str, payload: dict, now: datetime, attempts: int = 0, error: Optional[str] = None) -> dict:
+        return {
+            "name": name,
+            "payload": payload,
+            "status": "pending",
+            "attempts": attempts,
+            "error": error,
+            "created_at": now,
+            # Until then only this process's workers take it; after that any sweeper may
+            "next_at": now + (self._backoff(attempts) if attempts else self.lease),
+        }
+
+    @staticmethod
+    def _backoff(attempts: int) -> timedelta:
+        return timedelta(seconds=min(2 ** attempts, 60))
+
+    def _offer(self, task_id, claim: dict) -> None:
+        with self._queued_lock:
+            if task_id in self._queued:
+                return
+            try:
+                self._queue.put_nowait((task_id, claim))
+            except queue.Full:
+                # Left in the outbox; the sweeper brings it back when there's room
+                return
+            self._queued.add(task_id)
+
+    def _due(self, now: datetime, startup: bool = False) -> dict:
+        pending = {"status": "pending"} if startup else {"status": "pending", "next_at": {"$lte": now}}
+        return {"$or": [pending, {"status": "running", "claimed_at": {"$lt": now - self.lease}}]}
+
+    def sweep(self, startup: bool = False) -> int:
+        """Queue every task that is due (on startup: every pending one); returns how many were offered"""
+        now = datetime.utcnow()
+        due = self._due(now, startup)
+        offered = 0
+        for doc in self.col.find(due, {"_id": 1}).sort([("next_at", 1)]).limit(self._queue.maxsize):
+            self._offer(doc["_id"], due)
+            offered += 1
+        return offered
+
+    def _claim(self, task_id, claim: dict) -> Optional[dict]:
+        return self.col.find_one_and_update(
+            {"_id": task_id, **claim},
+            {"$set": {"status": "running", "claimed_at": datetime.utcnow()}, "$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _run_one(self, task_id, claim: dict) -> None:
+        task = self._claim(task_id, claim)
+        if task is None:
+            return  # done or taken by another worker
+        try:
+            self._handlers[task["name"]](task["payload"])
+        except Exception as e:
+            logger.exception("task %s failed (attempt %s)", task["name"], task["attempts"])
+            failed = task["attempts"] >= self.max_attempts
+            self.col.update_one({"_id": task_id}, {"$set": {
+                "status": "failed" if failed else "pending",
+                "error": repr(e),
+                "next_at": datetime.utcnow() + self._backoff(task["attempts"]),
+            }})
+            return
+        self.col.delete_one({"_id": task_id})
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            try:
+                task_id, claim = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self._queued_lock:
+                self._queued.discard(task_id)
+            try:
+                self._run_one(task_id, claim)
+            except PyMongoError:
+                logger.exception("outbox task %s could not be updated", task_id)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"outbox-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+        self._sweeper.start()
+        # Whatever a previous run left behind
+        self.sweep(startup=True)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Let the workers finish what's queued (up to timeout); the rest runs after the next start"""
+        self._sweeper.stop()
+        deadline = datetime.utcnow() + timedelta(seconds=timeout)
+        while not self._queue.empty() and datetime.utcnow() < deadline and self.running:
+            self._stop.wait(0.05)
+        self._stop.set()
+        for t in self._threads:
+            t.join(max(0.0, (deadline - datetime.utcnow()).total_seconds()))
+        self._threads = []
+        with self._queued_lock:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queued.clear()
+
+    def stats(self) -> dict:
+        """Tasks in memory and in the outbox by status, plus the latest failures"""
+        counts = {
+            d["_id"]: d["n"]
+            for d in self.col.aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}])
+        }
+        failed = self.col.find(
+            {"status": "failed"}, {"_id": 0, "name": 1, "attempts": 1, "error": 1, "created_at": 1}
+        ).sort([("created_at", -1)]).limit(20)
+        return {"running": self.running, "queued": self._queue.qsize(), "outbox": counts, "failed": list(failed)}
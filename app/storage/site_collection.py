@@ -0,0 +1,135 @@
+# app/storage/site_collection.py
+
+from __future__ import annotations
+
+from typing import Any, List, Optional
+
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
+
+from app.core.sites import current_site
+
+SITE_FIELD = "site_id"
+INDEX_NOT_FOUND = 27
+
+
+def _is_inclusion(projection: dict) -> bool:
+    return any(v not in (0, False) for k, v in projection.items() if k != "_id")
+
+
+class SiteScopedCollection:
+    """A collection seen through the current site (``app.core.sites.current_site()``).
+
+    Filters and aggregation pipelines are limited to the site's documents,
+    inserted documents are stamped with it, and indexes are created with
+    ``site_id`` as their leading key, so every query can use an index and
+    the collections can be sharded on ``site_id``. ``site_id`` is left out
+    of returned documents unless a projection asks for it.
+
+    ``bulk_write`` can't see into its operations: filters passed to it must
+    come from ``scope()``. Everything else (``name``, ``drop_index``, ...)
+    goes straight to the underlying collection, also available as ``raw``.
+    """
+
+    def __init__(self, raw: Collection):
+        self.raw = raw
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.raw, name)
+
+    def scope(self, filter: Optional[dict] = None) -> dict:
+        scoped = dict(filter or {})
+        scoped.setdefault(SITE_FIELD, current_site())
+        return scoped
+
+    def _stamp(self, doc: dict) -> dict:
+        # A copy, so documents handed back to callers don't gain site_id (or _id)
+        return {SITE_FIELD: current_site(), **doc}
+
+    @staticmethod
+    def _projection(args: tuple, kwargs: dict) -> tuple:
+        """Hide site_id from exclusion projections (and from "everything")"""
+        if args:
+            projection, args = args[0], args[1:]
+        else:
+            projection = kwargs.pop("projection", None)
+        if projection is None:
+            projection = {SITE_FIELD: 0}
+        elif isinstance(projection, dict) and not _is_inclusion(projection):
+            projection = {**projection, SITE_FIELD: 0}
+        return args, {**kwargs, "projection": projection}
+
+    # --- reads ---
+
+    def find(self, filter: Optional[dict] = None, *args, **kwargs):
+        args, kwargs = self._projection(args, kwargs)
+        return self.raw.find(self.scope(filter), *args, **kwargs)
+
+    def find_one(self, filter: Optional[dict] = None, *args, **kwargs):
+        args, kwargs = self._projection(args, kwargs)
+        return self.raw.find_one(self.scope(filter), *args, **kwargs)
+
+    def count_documents(self, filter: dict, **kwargs) -> int:
+        return self.raw.count_documents(self.scope(filter), **kwargs)
+
+    def distinct(self, key: str, filter: Optional[dict] = None, **kwargs) -> list:
+        return self.raw.distinct(key, self.scope(filter), **kwargs)
+
+    def aggregate(self, pipeline: List[dict], **kwargs):
+        return self.raw.aggregate([{"$match": self.scope()}] + list(pipeline), **kwargs)
+
+    # --- writes ---
+
+    def insert_one(self, document: dict, **kwargs):
+        return self.raw.insert_one(self._stamp(document), **kwargs)
+
+    def insert_many(self, documents, **kwargs):
+        return self.raw.insert_many([self._stamp(d) for d in documents], **kwargs)
+
+    # Upserts copy site_id from the filter into the new document
+    def update_one(self, filter: dict, update, **kwargs):
+        return self.raw.update_one(self.scope(filter), update, **kwargs)
+
+    def update_many(self, filter: dict, update, **kwargs):
+        return self.raw.update_many(self.scope(filter), update, **kwargs)
+
+    def find_one_and_update(self, filter: dict, update, *args, **kwargs):
+        args, kwargs = self._projection(args, kwargs)
+        return self.raw.find_one_and_update(self.scope(filter), update, *args, **kwargs)
+
+    def delete_one(self, filter: dict, **kwargs):
+        return self.raw.delete_one(self.scope(filter), **kwargs)
+
+    def delete_many(self, filter: dict, **kwargs):
+        return self.raw.delete_many(self.scope(filter), **kwargs)
+
+    def bulk_write(self, requests, **kwargs):
+        return self.raw.bulk_write(requests, **kwargs)
+
+    # --- indexes ---
+
+    def create_index(self, keys, **kwargs) -> str:
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        keys = list(keys)
+        if keys[0][0] != SITE_FIELD:
+            keys = [(SITE_FIELD, 1)] + keys
+        return self.raw.create_index(keys, **kwargs)
+
+    def drop_unscoped_indexes(self) -> List[str]:
+        """Drop indexes that don't lead with site_id (those from before sites); returns their names.
+
+        Safe to run from several workers at once: an index another one
+        dropped first is skipped.
+        """
+        dropped = []
+        for name, info in self.raw.index_information().items():
+            if name != "_id_" and info["key"][0][0] != SITE_FIELD:
+                try:
+                    self.raw.drop_index(name)
+                except OperationFailure as e:
+                    if e.code != INDEX_NOT_FOUND:
+                        raise
+                    continue
+                dropped.append(name)
+        return dropped
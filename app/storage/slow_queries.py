@@ -0,0 +1,235 @@
+# app/storage/slow_queries.py
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.2"))
+SLOW_QUERY_KEEP = int(os.getenv("SLOW_QUERY_KEEP", "200"))
+
+EXPLAINABLE = ("find", "aggregate")
+# Driver/session fields that explain rejects or that don't belong to the query
+_SESSION_FIELDS = ("lsid", "txnNumber", "autocommit", "startTransaction")
+# Modules that only pass queries through; the caller is whoever called them
+WRAPPER_MODULES = ("app.storage.site_collection",)
+
+
+# Keys that lead from a plan stage to the stages under it
+_PLAN_CHILDREN = ("winningPlan", "queryPlan", "inputStage", "inputStages", "shards")
+
+
+def _plan_stages(node: Any) -> Iterator[str]:
+    """Stage names in a plan tree; rejectedPlans hang off queryPlanner, so they're never reached"""
+    if isinstance(node, dict):
+        stage = node.get("stage")
+        if isinstance(stage, str):
+            yield stage
+        for key in _PLAN_CHILDREN:
+            if key in node:
+                yield from _plan_stages(node[key])
+    elif isinstance(node, list):
+        for value in node:
+            yield from _plan_stages(value)
+
+
+def _stages(explain: dict) -> Iterator[str]:
+    """Stage names of the plan an explain chose (find or aggregate)"""
+    steps = explain.get("stages")
+    if isinstance(steps, list):
+        # Aggregation stages the query layer didn't absorb: [{"$cursor": ...}, {"$sort": ...}]
+        for step in steps:
+            name = next(iter(step), "") if isinstance(step, dict) else ""
+            if name.startswith("$") and name != "$cursor":
+                yield name
+        for step in steps:
+            if isinstance(step, dict) and isinstance(step.get("$cursor"), dict):
+                yield from _stages(step["$cursor"])
+    shards = explain.get("shards")
+    if isinstance(shards, dict):
+        # Aggregates on a sharded cluster explain per shard
+        for shard in shards.values():
+            if isinstance(shard, dict):
+                yield from _stages(shard)
+    planner = explain.get("queryPlanner")
+    if isinstance(planner, dict):
+        yield from _plan_stages(planner.get("winningPlan"))
+
+
+def plan_summary(explain: dict) -> dict:
+    """Stages of the plan an explain chose, with the ones worth a look flagged.
+
+    A blocking SORT (or a $sort the query layer couldn't absorb) means the
+    results were sorted in memory instead of read in index order.
+    """
+    stages = list(dict.fromkeys(_stages(explain)))
+    return {
+        "stages": stages,
+        "collscan": "COLLSCAN" in stages,
+        "in_memory_sort": "SORT" in stages or "$sort" in stages,
+    }
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    """Logs Mongo commands slower than ``threshold_ms``, tagged with the app function that issued them.
+
+    The caller is found by walking the stack when the command finishes
+    (listeners run on the thread that issued it), so only slow commands pay
+    for it. A sample of slow finds and aggregates is re-run through explain
+    on a background thread so the request that was slow doesn't wait for
+    it; the plan is attached to the entry when it arrives. Frames in
+    ``wrapper_modules`` (the site-scoped collection every repo query goes
+    through) are skipped, so entries name the repo function.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float = SLOW_QUERY_MS,
+        explain_rate: float = SLOW_QUERY_EXPLAIN_RATE,
+        keep: int = SLOW_QUERY_KEEP,
+        caller_prefix: str = "app.",
+        wrapper_modules: tuple = WRAPPER_MODULES,
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self.caller_prefix = caller_prefix
+        self.skip_modules = frozenset(wrapper_modules) | {__name__}
+        self.client = None
+        self._entries: deque = deque(maxlen=keep)
+        self._commands: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+        self._explains: queue.Queue = queue.Queue(maxsize=50)
+        self._thread: Optional[threading.Thread] = None
+
+    def bind(self, client) -> None:
+        """The client explains are run with"""
+        self.client = client
+
+    # --- listener ---
+
+    def started(self, event):
+        if event.command_name in EXPLAINABLE and threading.current_thread() is not self._thread:
+            with self._lock:
+                self._commands[event.request_id] = event.command
+
+    def succeeded(self, event):
+        self._finished(event, ok=True)
+
+    def failed(self, event):
+        self._finished(event, ok=False)
+
+    def _finished(self, event, ok: bool) -> None:
+        with self._lock:
+            command = self._commands.pop(event.request_id, None)
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms or threading.current_thread() is self._thread:
+            return
+
+        caller = self._caller()
+        target = command.get(event.command_name) if command else None
+        entry = {
+            "at": datetime.utcnow().isoformat(),
+            "command": event.command_name,
+            "database": event.database_name,
+            "collection": target if isinstance(target, str) else None,
+            "duration_ms": round(duration_ms, 3),
+            "ok": ok,
+            "caller": caller,
+            "plan": None,
+        }
+        if command:
+            entry["filter"] = command.get("filter", command.get("pipeline"))
+        with self._lock:
+            self._entries.append(entry)
+        logger.warning("slow mongo command %s", json.dumps(entry, default=str))
+
+        if command and ok and self.client is not None and random.random() < self.explain_rate:
+            self._queue_explain(entry, command)
+
+    def _caller(self) -> Optional[str]:
+        frame = sys._getframe(1)
+        while frame is not None:
+            module = frame.f_globals.get("__name__", "")
+            if module.startswith(self.caller_prefix) and module not in self.skip_modules:
+                return f"{module.rsplit('.', 1)[-1]}.{frame.f_code.co_name}:{frame.f_lineno}"
+            frame = frame.f_back
+        return None
+
+    # --- explain ---
+
+    def _queue_explain(self, entry: dict, command: dict) -> None:
+        # queryPlanner verbosity only plans, so even $out/$merge pipelines are safe to explain
+        command = {
+            k: v for k, v in command.items()
+            if not k.startswith("$") and k not in _SESSION_FIELDS
+        }
+        self._ensure_thread()
+        try:
+            self._explains.put_nowait((entry, command))
+        except queue.Full:
+            pass
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="slow-query-explain", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            entry, command = self._explains.get()
+            try:
+                explain = self.client[entry["database"]].command(
+                    {"explain": command, "verbosity": "queryPlanner"}
+                )
+            except PyMongoError as e:
+                logger.info("explain of slow %s failed: %s", entry["command"], e)
+                continue
+            entry["plan"] = plan_summary(explain)
+            if entry["plan"]["collscan"] or entry["plan"]["in_memory_sort"]:
+                logger.warning(
+                    "slow mongo command plan %s",
+                    json.dumps({k: entry[k] for k in ("caller", "collection", "plan")}, default=str),
+                )
+
+    # --- view ---
+
+    def entries(self, limit: int = 50, flagged_only: bool = False) -> List[dict]:
+        """Recent slow commands, newest first"""
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        if flagged_only:
+            entries = [e for e in entries if e["plan"] and (e["plan"]["collscan"] or e["plan"]["in_memory_sort"])]
+        return entries[:limit]
+
+    def by_caller(self) -> List[dict]:
+        """Slow command counts and times per calling function, slowest total first"""
+        rows: Dict[Any, dict] = {}
+        with self._lock:
+            entries = list(self._entries)
+        for e in entries:
+            key = (e["caller"], e["command"], e["collection"])
+            row = rows.setdefault(key, {
+                "caller": e["caller"], "command": e["command"], "collection": e["collection"],
+                "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+            })
+            row["count"] += 1
+            row["total_ms"] = round(row["total_ms"] + e["duration_ms"], 3)
+            row["max_ms"] = max(row["max_ms"], e["duration_ms"])
+        return sorted(rows.values(), key=lambda r: r["total_ms"], reverse=True)
+
@@ -48,6 +48,7 @@ function AdminPage() {
   const [orders, setOrders] = useState([]);
   const [topSelling, setTopSelling] = useState([]);
   const [topRated, setTopRated] = useState([]);
+  const [stockAlerts, setStockAlerts] = useState({});
   
   // Loading states
   const [loading, setLoading] = useState(false);
@@ -183,14 +184,11 @@ function AdminPage() {
 
   const fetchAnalytics = async () => {
     try {
-      const [sellingRes, ratedRes] = await Promise.all([
-        fetch(`${API_BASE}/api/analytics/top-selling?limit=8`),
-        fetch(`${API_BASE}/api/analytics/top-rated?limit=5`),
-      ]);
-      const selling = await sellingRes.json();
-      const rated = await ratedRes.json();
-      setTopSelling(selling);
-      setTopRated(rated);
+      // One snapshot call instead of a request per widget
+      const res = await fetch(`${API_BASE}/api/admin/dashboard?top_limit=8`);
+      const dashboard = await res.json();
+      setTopSelling(dashboard.top_selling);
+      setTopRated(dashboard.top_rated.slice(0, 5));
     } catch (err) {
       console.error("Analytics fetch error:", err);
     }
@@ -212,6 +210,39 @@ function AdminPage() {
     }
   }, [authenticated]);
 
+  // Stock alerts are pushed by the server: a snapshot, then each change
+  useEffect(() => {
+    if (!authenticated) return;
+
+    const source = new EventSource(`${API_BASE}/api/admin/stock-alerts/stream`);
+    source.addEventListener("snapshot", (e) => {
+      const alerts = {};
+      JSON.parse(e.data).forEach((a) => {
+        alerts[a.id] = { id: a.id, name: a.name, quantity: a.quantity, level: a.stock_alert };
+      });
+      setStockAlerts(alerts);
+    });
+    source.addEventListener("stock", (e) => {
+      const event = JSON.parse(e.data);
+      setStockAlerts((prev) => {
+        const next = { ...prev };
+        if (event.level === "ok") {
+          delete next[event.item_id];
+        } else {
+          next[event.item_id] = {
+            id: event.item_id,
+            name: event.name,
+            quantity: event.quantity,
+            level: event.level,
+          };
+        }
+        return next;
+      });
+    });
+
+    return () => source.close();
+  }, [authenticated]);
+
   const updateOrderStatus = async (orderId, newStatus) => {
     try {
       const res = await fetch(`${API_BASE}/api/admin/orders/${orderId}/status`, {
@@ -228,6 +259,22 @@ function AdminPage() {
     }
   };
 
+  const bulkUpdateStatus = async (fromStatus, newStatus) => {
+    try {
+      const res = await fetch(`${API_BASE}/api/admin/orders/status`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ status: newStatus, from_status: fromStatus }),
+      });
+      const data = await res.json();
+      if (!res.ok) throw new Error(data?.detail || `HTTP ${res.status}`);
+      showNotification(`${data.changed.length} order(s) moved to ${newStatus}`, "success");
+      fetchOrders();
+    } catch (err) {
+      showNotification("Failed to update orders", "error");
+    }
+  };
+
   const deleteItem = async (itemId) => {
     if (!window.confirm("Delete this item?")) return;
     try {
@@ -338,8 +385,9 @@ function AdminPage() {
       revenue: parseFloat(revenue.toFixed(2)),
     }));
 
-    const lowStock = items.filter((item) => item.quantity < 5 && item.quantity > 0);
-    const outOfStock = items.filter((item) => item.quantity === 0);
+    const alerts = Object.values(stockAlerts);
+    const lowStock = alerts.filter((a) => a.level === "low");
+    const outOfStock = alerts.filter((a) => a.level === "out");
 
     const inventoryData = items.slice(0, 10).map((item) => ({
       name: item.name.length > 15 ? item.name.slice(0, 15) + "..." : item.name,
@@ -358,7 +406,7 @@ function AdminPage() {
       outOfStock,
       inventoryData,
     };
-  }, [items, orders]);
+  }, [items, orders, stockAlerts]);
 
   // Login Screen
   if (!authenticated) {
@@ -653,7 +701,7 @@ function AdminPage() {
                         🍽️
                       </div>
                     )}
-                    {item.quantity < 5 && (
+                    {item.quantity < (item.low_stock_threshold ?? 5) && (
                       <div className="absolute top-2 right-2 bg-rose-500 text-white px-2 py-1 rounded-full text-xs font-bold">
                         Low Stock
                       </div>
@@ -732,6 +780,24 @@ function AdminPage() {
               })}
             </div>
 
+            {/* Bulk kitchen actions */}
+            <div className="flex flex-wrap gap-3">
+              {[
+                ["pending", "preparing"],
+                ["preparing", "ready"],
+                ["ready", "completed"],
+              ].map(([fromStatus, toStatus]) => (
+                <button
+                  key={fromStatus}
+                  onClick={() => bulkUpdateStatus(fromStatus, toStatus)}
+                  disabled={!orders.some((o) => o.status === fromStatus)}
+                  className="px-4 py-2 rounded-lg bg-white border hover:bg-slate-50 transition font-semibold capitalize disabled:opacity-50 disabled:cursor-not-allowed"
+                >
+                  All {fromStatus} → {toStatus}
+                </button>
+              ))}
+            </div>
+
             {/* Orders List */}
             <div className="space-y-4">
               {orders.map((order) => (
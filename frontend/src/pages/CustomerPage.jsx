@@ -349,6 +349,8 @@ export default function CustomerPage() {
 
   // Ratings feedback
   const [ratingMsg, setRatingMsg] = useState("");
+  // Stars picked per order before they're submitted: { [orderId]: { [itemId]: rating } }
+  const [draftRatings, setDraftRatings] = useState({});
 
   // Toast notifications
   const [toast, setToast] = useState(null);
@@ -600,20 +602,39 @@ export default function CustomerPage() {
     }
   };
 
-  const rateItem = async (itemId, rating) => {
+  const pickRating = (orderId, itemId, rating) => {
+    setDraftRatings(prev => ({
+      ...prev,
+      [orderId]: { ...(prev[orderId] || {}), [itemId]: rating },
+    }));
+  };
+
+  const submitRatings = async (orderId) => {
+    const picked = draftRatings[orderId] || {};
+    const ratings = Object.entries(picked).map(([itemId, rating]) => ({
+      item_id: Number(itemId),
+      rating,
+    }));
+    if (!ratings.length) return;
+
     setRatingMsg("");
     try {
-      const res = await fetch(`${API_BASE}/api/items/${itemId}/rating`, {
+      const res = await fetch(`${API_BASE}/api/orders/${orderId}/ratings`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ rating }),
+        body: JSON.stringify({ ratings }),
       });
       const data = await res.json();
       if (!res.ok) throw new Error(data?.detail || `HTTP ${res.status}`);
 
-      setRatingMsg(`✅ Rated item #${itemId} with ${rating} stars!`);
-      showToast(`Rated ${rating} stars! ⭐`, "success");
-      await fetchItems();
+      setRatingMsg(`✅ Thanks for rating order #${orderId}!`);
+      showToast(`Rated ${ratings.length} item${ratings.length > 1 ? "s" : ""}! ⭐`, "success");
+      setDraftRatings(prev => {
+        const next = { ...prev };
+        delete next[orderId];
+        return next;
+      });
+      await Promise.all([fetchItems(), fetchMyOrders()]);
     } catch (e) {
       setRatingMsg(`❌ ${String(e)}`);
     }
@@ -1178,7 +1199,7 @@ export default function CustomerPage() {
                   ))}
                 </div>
 
-                {o.status === "completed" && o.items?.length ? (
+                {o.status === "completed" && o.items?.length && !o.rated_at ? (
                   <div className="mt-4 border-t-2 pt-4">
                     <div className="text-sm font-bold text-slate-900 mb-3">⭐ Rate your experience:</div>
                     <div className="flex flex-wrap gap-3">
@@ -1189,8 +1210,10 @@ export default function CustomerPage() {
                             {[1, 2, 3, 4, 5].map((r) => (
                               <button
                                 key={r}
-                                onClick={() => rateItem(line.item_id, r)}
-                                className="w-10 h-10 rounded-xl bg-gradient-to-br from-amber-400 to-orange-500 text-white font-bold hover:from-amber-500 hover:to-orange-600 transition-all transform hover:scale-110 shadow-md"
+                                onClick={() => pickRating(o.id, line.item_id, r)}
+                                className={`w-10 h-10 rounded-xl bg-gradient-to-br from-amber-400 to-orange-500 text-white font-bold hover:from-amber-500 hover:to-orange-600 transition-all transform hover:scale-110 shadow-md ${
+                                  draftRatings[o.id]?.[line.item_id] === r ? "ring-4 ring-amber-300" : ""
+                                }`}
                               >
                                 {r}★
                               </button>
@@ -1199,6 +1222,13 @@ export default function CustomerPage() {
                         </div>
                       ))}
                     </div>
+                    <button
+                      onClick={() => submitRatings(o.id)}
+                      disabled={!Object.keys(draftRatings[o.id] || {}).length}
+                      className="mt-3 px-5 py-2 rounded-xl bg-gradient-to-r from-amber-500 to-orange-600 text-white font-bold shadow-md hover:shadow-lg transition disabled:opacity-50 disabled:cursor-not-allowed"
+                    >
+                      Submit ratings
+                    </button>
                   </div>
                 ) : null}
               </div>
@@ -0,0 +1,190 @@
+# replay_traffic.py
+
+import argparse
+import glob
+import http.client
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+_NUMERIC_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def load_requests(paths: List[str]) -> List[dict]:
+    """Captured requests from JSONL files (rotated files included), oldest first"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "traffic-*.jsonl*")))
+        else:
+            files.extend(glob.glob(path))
+    records = []
+    for name in files:
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def route_of(record: dict) -> str:
+    return f"{record['method']} {_NUMERIC_SEGMENT.sub('/{id}', record['path'])}"
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+class Replayer:
+    """Sends captured requests to a running instance and times the responses"""
+
+    def __init__(self, url: str, concurrency: int, timeout: float):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.https = parts.scheme == "https"
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=concurrency)
+        self.results: List[dict] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = self._local.conn = cls(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def send(self, record: dict) -> None:
+        headers = dict(record.get("headers") or {})
+        if "idempotency-key" in headers:
+            # A recorded key would only replay the stored response
+            headers["idempotency-key"] = uuid.uuid4().hex
+        body = record.get("body") or {}
+        if "json" in body:
+            payload: Optional[bytes] = json.dumps(body["json"]).encode()
+        elif "text" in body:
+            payload = body["text"].encode()
+        else:
+            payload = None
+        target = record["path"] + (f"?{record['query']}" if record.get("query") else "")
+
+        started = time.perf_counter()
+        status = None
+        error = None
+        try:
+            conn = self._connection()
+            conn.request(record["method"], target, body=payload, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            error = type(e).__name__
+            self._local.conn = None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.results.append({
+                "route": route_of(record),
+                "status": status,
+                "error": error,
+                "ms": elapsed_ms,
+                "recorded_ms": record.get("duration_ms"),
+            })
+
+    def run(self, records: List[dict], speed: Optional[float]) -> float:
+        """Replay ``records``; speed None sends as fast as the pool allows. Returns wall seconds."""
+        started = time.perf_counter()
+        first_ts = records[0]["ts"] if records else 0.0
+        for record in records:
+            if speed is not None:
+                due = started + (record["ts"] - first_ts) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self.pool.submit(self.send, record)
+        self.pool.shutdown(wait=True)
+        return time.perf_counter() - started
+
+
+def report(results: List[dict], wall_seconds: float, top_routes: int = 15) -> str:
+    lines = []
+    latencies = sorted(r["ms"] for r in results if r["error"] is None)
+    statuses = Counter(r["status"] or r["error"] for r in results)
+    lines.append(f"requests:   {len(results)} in {wall_seconds:.2f}s")
+    lines.append(f"throughput: {len(results) / wall_seconds:.1f} req/s" if wall_seconds > 0 else "throughput: n/a")
+    lines.append("statuses:   " + ", ".join(f"{k}={v}" for k, v in sorted(statuses.items(), key=str)))
+    lines.append(
+        "latency ms: "
+        + "  ".join(f"p{p}={percentile(latencies, p):.1f}" for p in (50, 90, 95, 99))
+        + f"  max={latencies[-1] if latencies else 0:.1f}"
+    )
+
+    by_route: Dict[str, List[dict]] = defaultdict(list)
+    for r in results:
+        by_route[r["route"]].append(r)
+    lines.append("")
+    lines.append(f"{'route':<44} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'rec p50':>8} {'rec p95':>8}")
+    for route, rows in sorted(by_route.items(), key=lambda kv: len(kv[1]), reverse=True)[:top_routes]:
+        ms = sorted(r["ms"] for r in rows if r["error"] is None)
+        rec = sorted(r["recorded_ms"] for r in rows if r["recorded_ms"] is not None)
+        lines.append(
+            f"{route[:44]:<44} {len(rows):>6} {percentile(ms, 50):>8.1f} {percentile(ms, 95):>8.1f} "
+            f"{percentile(ms, 99):>8.1f} {percentile(rec, 50):>8.1f} {percentile(rec, 95):>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def parse_speed(value: str) -> Optional[float]:
+    if value == "max":
+        return None
+    speed = float(value.rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive, or 'max'")
+    return speed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay traffic captured with TRAFFIC_CAPTURE_RATE against a running instance",
+    )
+    parser.add_argument("paths", nargs="+", help="capture files, globs or directories")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="instance to replay against")
+    parser.add_argument(
+        "--speed", type=parse_speed, default=1.0,
+        help="1 (or 1x) keeps the recorded spacing, 4x is four times faster, max sends without waiting",
+    )
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight at most")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    parser.add_argument("--json", action="store_true", help="print raw per-request results as JSON")
+    args = parser.parse_args()
+
+    records = load_requests(args.paths)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        parser.error("no captured requests found")
+
+    replayer = Replayer(args.url, args.concurrency, args.timeout)
+    wall = replayer.run(records, args.speed)
+    if args.json:
+        print(json.dumps(replayer.results))
+    else:
+        print(report(replayer.results, wall))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,50 @@
 # run_fastapi.py
 
+import argparse
+import os
+
 import uvicorn
 
-if __name__ == "__main__":
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Cafeteria API")
+    parser.add_argument(
+        "--prod",
+        action="store_true",
+        help="production mode: several worker processes, no auto-reload",
+    )
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+    )
+    args = parser.parse_args()
+
+    if not args.prod:
+        uvicorn.run(
+            "app.fastapi_app:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+        )
+        return
+
+    # Workers share cache versions through MongoDB (see
+    # app/storage/invalidation.py), so a write in one is seen by all.
     uvicorn.run(
         "app.fastapi_app:app",
-        host="127.0.0.1",
-        port=8000,
-        reload=True,
-    )
\ No newline at end of file
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        reload=False,
+        proxy_headers=True,
+        # Let in-flight requests finish and the lifespan flush buffered writes
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "30")),
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
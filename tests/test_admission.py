@@ -0,0 +1,98 @@
+# tests/test_admission.py
+
+import asyncio
+
+from app.core.admission import AdmissionController, RouteClass
+
+
+def make_controller(max_concurrent=1, max_queue=1, max_wait=1.0, latency_threshold=None):
+    classes = [
+        RouteClass("checkout", 0, max_concurrent=max_concurrent, max_queue=max_queue, max_wait=max_wait),
+        RouteClass("standard", 1, max_concurrent=max_concurrent, max_queue=max_queue, max_wait=max_wait),
+        RouteClass(
+            "analytics", 2, max_concurrent=max_concurrent, max_queue=max_queue,
+            max_wait=max_wait, latency_threshold=latency_threshold,
+        ),
+    ]
+    rules = [
+        ("POST", r"^/api/orders$", "checkout"),
+        (None, r"^/api/(admin/)?analytics/", "analytics"),
+    ]
+    return AdmissionController(classes=classes, rules=rules, max_concurrent=max_concurrent)
+
+
+def test_classify_routes():
+    controller = make_controller()
+    assert controller.classify("POST", "/api/orders").name == "checkout"
+    assert controller.classify("GET", "/api/orders").name == "standard"
+    assert controller.classify("GET", "/api/analytics/top-rated").name == "analytics"
+    assert controller.is_exempt("/api/admin/stock-alerts/stream")
+    assert not controller.is_exempt("/api/admin/stock-alerts")
+
+
+def test_sheds_when_queue_is_full():
+    async def scenario():
+        controller = make_controller()
+        standard = controller.classes["standard"]
+        assert await controller.acquire(standard)
+
+        waiter = asyncio.ensure_future(controller.acquire(standard))
+        await asyncio.sleep(0)
+        assert controller.queue_depth(standard) == 1
+        # Queue holds one request; the next one is shed right away
+        assert await controller.acquire(standard) is False
+
+        controller.release(standard, 0.01)
+        assert await waiter is True
+
+    asyncio.run(scenario())
+
+
+def test_sheds_after_max_wait():
+    async def scenario():
+        controller = make_controller(max_wait=0.01)
+        standard = controller.classes["standard"]
+        assert await controller.acquire(standard)
+        assert await controller.acquire(standard) is False
+        assert controller.queue_depth() == 0
+
+    asyncio.run(scenario())
+
+
+def test_checkout_is_admitted_before_analytics():
+    async def scenario():
+        controller = make_controller()
+        standard = controller.classes["standard"]
+        analytics = controller.classes["analytics"]
+        checkout = controller.classes["checkout"]
+        assert await controller.acquire(standard)
+
+        order = []
+
+        async def wait_for(route_class):
+            await controller.acquire(route_class)
+            order.append(route_class.name)
+            controller.release(route_class, 0.01)
+
+        tasks = [
+            asyncio.ensure_future(wait_for(analytics)),
+            asyncio.ensure_future(wait_for(checkout)),
+        ]
+        await asyncio.sleep(0)
+        controller.release(standard, 0.01)
+        await asyncio.gather(*tasks)
+        assert order == ["checkout", "analytics"]
+
+    asyncio.run(scenario())
+
+
+def test_low_priority_shed_while_latency_is_high():
+    async def scenario():
+        controller = make_controller(max_queue=10, latency_threshold=0.5)
+        checkout = controller.classes["checkout"]
+        analytics = controller.classes["analytics"]
+        controller.avg_latency = 2.0
+        assert await controller.acquire(checkout)
+        assert await controller.acquire(analytics) is False
+
+    asyncio.run(scenario())
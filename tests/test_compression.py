@@ -0,0 +1,58 @@
+# tests/test_compression.py
+
+from fastapi.testclient import TestClient
+from app import fastapi_app
+from app.core.compression import choose_encoding
+from app.fastapi_app import app
+
+client = TestClient(app)
+
+
+def test_choose_encoding():
+    assert choose_encoding(None) is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("*") in ("br", "gzip")
+
+
+def test_cached_menu_is_served_precompressed():
+    resp = client.get("/api/items", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.headers["vary"]
+    assert isinstance(resp.json(), list)
+
+
+def test_identity_when_client_does_not_accept_compression():
+    resp = client.get("/api/items", headers={"Accept-Encoding": "identity"})
+    assert resp.status_code == 200
+    assert "content-encoding" not in resp.headers
+
+
+def test_small_responses_are_not_compressed():
+    resp = client.get("/api/items/1", params={"fields": "name"}, headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert "content-encoding" not in resp.headers
+
+
+def test_uncached_large_response_compressed_by_middleware():
+    resp = client.get("/api/search", params={"q": "a"}, headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == "gzip"
+    assert int(resp.headers["content-length"]) < len(resp.content)
+
+
+def test_streamed_page_compressed_in_chunks(monkeypatch):
+    monkeypatch.setattr(fastapi_app, "ITEMS_HTML_STREAM_THRESHOLD", 0)
+    client.post("/api/items", json={
+        "name": "Compressed Stream Scone",
+        "category": "snack",
+        "price": 1.75,
+        "quantity": 4,
+        "available": True,
+    })
+    resp = client.get("/items-html", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == "gzip"
+    assert "Compressed Stream Scone" in resp.text
@@ -0,0 +1,111 @@
+# tests/test_invalidation.py
+
+import time
+
+from pymongo.errors import AutoReconnect
+
+from app.storage import invalidation
+from app.storage.invalidation import InvalidationBus
+from app.storage.mongo_repo import db
+
+col = db["test_cache_versions"]
+
+
+def _workers():
+    col.delete_many({})
+    return InvalidationBus(col, mode="poll"), InvalidationBus(col, mode="poll", poll_interval=0.05)
+
+
+def test_publish_is_seen_by_other_worker_after_refresh():
+    writer, reader = _workers()
+    seen = []
+    reader.subscribe("menu", seen.append)
+
+    version = writer.publish("menu")
+    assert writer.version("menu") == version
+    assert reader.version("menu") == 0
+
+    reader.refresh()
+    assert reader.version("menu") == version
+    assert reader.changed_at("menu") is not None
+    assert seen == [version]
+
+
+def test_own_publish_does_not_notify_subscribers():
+    writer, _ = _workers()
+    seen = []
+    writer.subscribe("orders", seen.append)
+    writer.publish("orders")
+    writer.refresh()
+    assert seen == []
+
+
+def test_polling_listener_picks_up_changes():
+    writer, reader = _workers()
+    reader.start()
+    try:
+        version = writer.publish("menu")
+        deadline = time.monotonic() + 2
+        while reader.version("menu") != version and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert reader.version("menu") == version
+    finally:
+        reader.stop()
+
+
+def test_publish_after_missed_bumps_notifies_subscribers():
+    other, worker = _workers()
+    seen = []
+    worker.subscribe("orders", seen.append)
+    other.publish("orders")
+
+    # worker never saw version 1; its own publish must not hide it
+    version = worker.publish("orders")
+    assert version == 2
+    assert seen == [2]
+
+
+class _FlakyStream:
+    def __init__(self, doc):
+        self.changes = [{"fullDocument": doc}]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def try_next(self):
+        time.sleep(0.01)
+        return self.changes.pop() if self.changes else None
+
+
+class _FlakyCollection:
+    """Stands in for cache_versions: the first watch() drops the connection"""
+
+    def __init__(self):
+        self.opened = 0
+
+    def find(self, *args, **kwargs):
+        return []
+
+    def watch(self, *args, **kwargs):
+        self.opened += 1
+        if self.opened == 1:
+            raise AutoReconnect("connection reset")
+        return _FlakyStream({"_id": "menu", "v": 3, "at": None})
+
+
+def test_change_stream_is_reopened_after_network_errors(monkeypatch):
+    monkeypatch.setattr(invalidation, "RECONNECT_MIN_DELAY", 0.01)
+    flaky = _FlakyCollection()
+    bus = InvalidationBus(flaky, mode="changestream")
+    bus.start()
+    try:
+        deadline = time.monotonic() + 2
+        while bus.version("menu") != 3 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert bus.version("menu") == 3
+        assert flaky.opened == 2
+    finally:
+        bus.stop()
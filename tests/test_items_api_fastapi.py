@@ -1,5 +1,7 @@
 # tests/test_items_api_fastapi.py
 
+import uuid
+
 from fastapi.testclient import TestClient
 from app.fastapi_app import app
 
@@ -7,6 +9,19 @@ from app.fastapi_app import app
 client = TestClient(app)
 
 
+def _category(prefix):
+    """A category no other test (or earlier run against the same database) uses"""
+    return f"{prefix}-{uuid.uuid4().hex[:8]}"
+
+
+def _create_item(name, category, price=3.0, quantity=5, **fields):
+    resp = client.post("/api/items", json={
+        "name": name, "category": category, "price": price, "quantity": quantity, **fields,
+    })
+    assert resp.status_code == 201
+    return resp.json()
+
+
 def test_fastapi_get_items_ok():
     resp = client.get("/api/items")
     assert resp.status_code == 200
@@ -130,4 +145,131 @@ def test_fastapi_filter_items_by_available_and_category():
     data = resp.json()
     assert len(data) >= 1
     assert all(item["available"] is True for item in data)
-    assert all(item["category"] == "drink" for item in data)
\ No newline at end of file
+    assert all(item["category"] == "drink" for item in data)
+
+def test_fastapi_items_cache_sees_updates():
+    create_resp = client.post("/api/items", json={
+        "name": "Cache Test Bagel",
+        "category": "snack",
+        "price": 1.5,
+        "quantity": 3,
+        "available": True,
+    })
+    assert create_resp.status_code == 201
+    item_id = create_resp.json()["id"]
+
+    # Same payload twice while the menu is unchanged
+    first = client.get("/api/items")
+    second = client.get("/api/items")
+    assert first.content == second.content
+    assert any(item["id"] == item_id for item in first.json())
+
+    client.put(f"/api/items/{item_id}", json={"price": 2.25})
+
+    data = client.get("/api/items").json()
+    updated = next(item for item in data if item["id"] == item_id)
+    assert updated["price"] == 2.25
+
+
+def test_fastapi_items_sparse_fields():
+    resp = client.get("/api/items", params={"fields": "name,price"})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert len(data) >= 1
+    assert set(data[0].keys()) == {"id", "name", "price"}
+
+    single = client.get("/api/items/1", params={"fields": "name"})
+    assert single.status_code == 200
+    assert single.json() == {"id": 1, "name": single.json()["name"]}
+
+
+def test_fastapi_items_unknown_field():
+    resp = client.get("/api/items", params={"fields": "name,secret"})
+    assert resp.status_code == 400
+    assert resp.json()["detail"] == "Unknown fields: secret"
+
+
+def test_fastapi_item_facets():
+    category = _category("facet-test")
+    _create_item(
+        "Facet Test Salad", category, quantity=4, is_vegetarian=True, is_vegan=True, allergens=["sesame"],
+    )
+    _create_item(
+        "Facet Test Pie", category, price=3.5, quantity=0, is_vegetarian=True, allergens=["gluten", "sesame"],
+    )
+
+    resp = client.get("/api/items/facets", params={"category": category})
+    assert resp.status_code == 200
+    facets = resp.json()
+    assert facets["total"] == 2
+    assert facets["categories"] == {category: 2}
+    assert facets["dietary"]["vegetarian"] == 2
+    assert facets["dietary"]["vegan"] == 1
+    assert facets["allergens"] == {"gluten": 1, "sesame": 2}
+    assert facets["availability"] == {"available": 1, "unavailable": 1}
+
+    resp = client.get("/api/items/facets", params={"category": category, "vegan": True})
+    assert resp.json()["total"] == 1
+
+
+def test_fastapi_exclude_allergens():
+    category = _category("allergen-test")
+    pancake = _create_item("Allergen Test Pancake", category, allergens=["Wheat", "milk", "eggs"])
+    assert pancake["allergens"] == ["gluten", "dairy", "eggs"]
+    fruit = _create_item("Allergen Test Fruit Cup", category, price=2.0)
+
+    for fields in (None, "name"):
+        params = {"category": category, "exclude_allergens": "gluten,dairy"}
+        if fields:
+            params["fields"] = fields
+        ids = [it["id"] for it in client.get("/api/items", params=params).json()]
+        assert ids == [fruit["id"]]
+
+    # Dropping the allergen from the item makes it show up again
+    client.put(f"/api/items/{pancake['id']}", json={"allergens": ["eggs"]})
+    resp = client.get("/api/items", params={"category": category, "exclude_allergens": "gluten"})
+    assert sorted(it["id"] for it in resp.json()) == sorted([pancake["id"], fruit["id"]])
+
+
+def test_fastapi_unknown_allergen_rejected():
+    resp = client.get("/api/items", params={"exclude_allergens": "gluten,kryptonite"})
+    assert resp.status_code == 400
+    assert resp.json()["detail"] == "Unknown allergen: kryptonite"
+
+    resp = client.post("/api/items", json={
+        "name": "Allergen Test Mystery",
+        "category": _category("allergen-test"),
+        "price": 1.0,
+        "quantity": 1,
+        "allergens": ["kryptonite"],
+    })
+    assert resp.status_code == 400
+
+
+def test_fastapi_items_range_sort_and_paging():
+    category = _category("range-test")
+    for name, price, calories in (("Range Test A", 2.5, 300), ("Range Test B", 4.5, 150), ("Range Test C", 9.0, 800)):
+        _create_item(name, category, price=price, calories=calories)
+
+    resp = client.get("/api/items", params={
+        "category": category, "min_price": 2, "max_price": 5, "sort": "calories", "order": "desc",
+    })
+    assert resp.status_code == 200
+    assert [it["name"] for it in resp.json()] == ["Range Test A", "Range Test B"]
+    assert resp.headers["x-total-count"] == "2"
+
+    resp = client.get("/api/items", params={
+        "category": category, "sort": "price", "limit": 1, "offset": 1, "fields": "name",
+    })
+    assert resp.json() == [{"id": resp.json()[0]["id"], "name": "Range Test B"}]
+    assert resp.headers["x-total-count"] == "3"
+
+    resp = client.get("/api/items", params={"sort": "colour"})
+    assert resp.status_code == 400
+
+
+def test_fastapi_total_count_is_exposed_to_browsers():
+    resp = client.get(
+        "/api/items", params={"limit": 1}, headers={"Origin": "http://localhost:3000"},
+    )
+    assert "x-total-count" in resp.headers["access-control-expose-headers"].lower()
@@ -0,0 +1,55 @@
+# tests/test_items_html_fastapi.py
+
+from fastapi.testclient import TestClient
+from app import fastapi_app
+from app.fastapi_app import app
+
+client = TestClient(app)
+
+
+def test_items_html_ok():
+    resp = client.get("/items-html")
+    assert resp.status_code == 200
+    assert "text/html" in resp.headers["content-type"]
+    assert "Student Cafeteria Menu" in resp.text
+    assert resp.headers["etag"]
+    assert resp.headers["last-modified"]
+
+
+def test_items_html_not_modified():
+    first = client.get("/items-html")
+    resp = client.get("/items-html", headers={"If-None-Match": first.headers["etag"]})
+    assert resp.status_code == 304
+
+
+def test_items_html_new_etag_after_menu_change():
+    first = client.get("/items-html")
+    client.post("/api/items", json={
+        "name": "Signage Test Muffin",
+        "category": "dessert",
+        "price": 2.0,
+        "quantity": 6,
+        "available": True,
+    })
+    resp = client.get("/items-html", headers={"If-None-Match": first.headers["etag"]})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != first.headers["etag"]
+    assert "Signage Test Muffin" in resp.text
+
+
+def test_items_html_streamed_for_large_menu(monkeypatch):
+    monkeypatch.setattr(fastapi_app, "ITEMS_HTML_STREAM_THRESHOLD", 0)
+    client.post("/api/items", json={
+        "name": "Streamed Test Tea",
+        "category": "drink",
+        "price": 1.0,
+        "quantity": 3,
+        "available": True,
+    })
+    streamed = client.get("/items-html")
+    assert streamed.status_code == 200
+    assert "Streamed Test Tea" in streamed.text
+
+    # The streamed render is cached for the next request
+    cached = client.get("/items-html")
+    assert cached.text == streamed.text
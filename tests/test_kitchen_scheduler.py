@@ -0,0 +1,64 @@
+# tests/test_kitchen_scheduler.py
+
+from datetime import datetime, timedelta
+
+from app.core.kitchen import KitchenScheduler, KitchenTicket
+
+NOW = datetime(2025, 1, 1, 12, 0)
+
+
+def minutes(n):
+    return timedelta(minutes=n)
+
+
+def test_orders_queue_behind_busy_stations():
+    kitchen = KitchenScheduler(stations=2)
+    assert kitchen.enqueue(1, 10, NOW) == NOW + minutes(10)
+    assert kitchen.enqueue(2, 4, NOW) == NOW + minutes(4)
+    # Third order waits for the station that frees up first
+    assert kitchen.enqueue(3, 5, NOW) == NOW + minutes(9)
+
+
+def test_finishing_an_order_pulls_later_orders_forward():
+    kitchen = KitchenScheduler(stations=1)
+    kitchen.enqueue(1, 10, NOW)
+    kitchen.enqueue(2, 5, NOW)
+    kitchen.enqueue(3, 5, NOW)
+
+    changed = kitchen.finish(1, NOW + minutes(2))
+    assert changed == {2: NOW + minutes(7), 3: NOW + minutes(12)}
+    assert 1 not in kitchen
+
+
+def test_started_order_is_timed_from_its_start():
+    kitchen = KitchenScheduler(stations=1)
+    kitchen.enqueue(1, 10, NOW)
+    kitchen.enqueue(2, 5, NOW)
+
+    # Kitchen picks order 2 first
+    changed = kitchen.start(2, NOW + minutes(1))
+    assert changed[2] == NOW + minutes(6)
+    assert changed[1] == NOW + minutes(16)
+
+
+def test_load_restores_queue():
+    kitchen = KitchenScheduler(stations=1)
+    etas = kitchen.load(
+        [
+            KitchenTicket(order_id=7, minutes=8, started_at=NOW - minutes(2)),
+            KitchenTicket(order_id=8, minutes=3),
+        ],
+        NOW,
+    )
+    assert etas == {7: NOW + minutes(6), 8: NOW + minutes(9)}
+
+
+def test_finish_many_re_estimates_once():
+    kitchen = KitchenScheduler(stations=1)
+    for order_id in (1, 2, 3):
+        kitchen.enqueue(order_id, 5, NOW)
+
+    changed = kitchen.finish_many([1, 2, 99], NOW)
+    assert changed == {3: NOW + minutes(5)}
+    assert len(kitchen) == 1
+    assert kitchen.finish_many([99], NOW) == {}
@@ -0,0 +1,45 @@
+# tests/test_menu_index.py
+
+from app.core.menu_index import MenuIndex
+from app.core.models import CafeteriaItem
+
+
+def _item(iid, name, price, calories=None, **kw):
+    return CafeteriaItem(
+        id=iid, name=name, category="main", price=price, quantity=5, available=True,
+        calories=calories, **kw,
+    )
+
+
+INDEX = MenuIndex(
+    [
+        _item(1, "soup", 3.0, calories=200),
+        _item(2, "Burger", 8.0, calories=700),
+        _item(3, "salad", 5.0),
+        _item(4, "pasta", 6.0, calories=550, is_vegetarian=True),
+    ],
+    discounts={2: 50.0},
+)
+
+
+def test_range_is_inclusive():
+    assert INDEX.in_range("price", 5.0, 6.0) == [3, 4]
+    assert INDEX.in_range("effective_price", None, 4.0) == [1, 2]
+    # Items without calories never match a calories range
+    assert INDEX.in_range("calories", 0) == [1, 4, 2]
+
+
+def test_query_sorts_filters_and_pages():
+    total, page = INDEX.query({"price": (4.0, None)}, sort="price", descending=True, limit=2)
+    assert total == 3
+    assert [d["id"] for d in page] == [2, 4]
+
+    total, page = INDEX.query({}, sort="calories")
+    assert [d["id"] for d in page] == [1, 4, 2, 3]
+
+    total, page = INDEX.query({}, where=lambda it: it.is_vegetarian, sort="name")
+    assert (total, [d["id"] for d in page]) == (1, [4])
+
+    total, page = INDEX.query({}, sort="name", offset=1, limit=2)
+    assert total == 4
+    assert [d["name"] for d in page] == ["pasta", "salad"]
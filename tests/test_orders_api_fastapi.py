@@ -0,0 +1,387 @@
+# tests/test_orders_api_fastapi.py
+
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from app.core import sites
+from app.core.sites import use_site
+from app.fastapi_app import app
+from app.storage import mongo_repo
+from app.storage.mongo_repo import _migrate_status_history, _next_id, _record_sales_task, orders_col
+
+client = TestClient(app)
+
+
+def _create_test_item(name="Order Test Wrap", quantity=10):
+    resp = client.post("/api/items", json={
+        "name": name,
+        "category": "main",
+        "price": 4.0,
+        "quantity": quantity,
+        "available": True,
+        "preparation_time": 6,
+    })
+    assert resp.status_code == 201
+    return resp.json()
+
+
+def _own_site(monkeypatch, prefix="site"):
+    """Headers for a site no other test uses, added to the served sites for this test"""
+    site = f"{prefix}-{uuid.uuid4().hex[:8]}"
+    monkeypatch.setattr(sites, "SITES", [*sites.SITES, site])
+    return {"X-Site-Id": site}
+
+
+def test_fastapi_create_order_ok():
+    item = _create_test_item()
+    resp = client.post("/api/orders", json={
+        "customer_id": "order-tester",
+        "items": [{"item_id": item["id"], "quantity": 2}],
+    })
+    assert resp.status_code == 201
+    data = resp.json()
+    assert data["status"] == "pending"
+    assert data["total_price"] == 8.0
+    assert data["estimated_ready_at"] is not None
+    assert "status_history" not in data
+
+
+def test_fastapi_order_status_history():
+    item = _create_test_item()
+    order = client.post("/api/orders", json={
+        "items": [{"item_id": item["id"], "quantity": 1}],
+    }).json()
+
+    resp = client.put(f"/api/admin/orders/{order['id']}/status", json={"status": "preparing"})
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "preparing"
+
+    history = client.get(f"/api/admin/orders/{order['id']}/history")
+    assert history.status_code == 200
+    assert [h["status"] for h in history.json()] == ["pending", "preparing"]
+
+
+def test_status_history_migration_can_rerun():
+    order_id = _next_id("orders")
+    at = datetime(2024, 1, 1, 12, 0)
+    legacy = [{"status": "pending", "at": at}, {"status": "completed", "at": at + timedelta(minutes=5)}]
+    orders_col.insert_one({"id": order_id, "status": "completed", "items": [], "status_history": legacy})
+
+    _migrate_status_history()
+    # As if an earlier run had crashed before removing the embedded array
+    orders_col.update_one({"id": order_id}, {"$set": {"status_history": legacy}})
+    _migrate_status_history()
+
+    history = client.get(f"/api/admin/orders/{order_id}/history").json()
+    assert [h["status"] for h in history] == ["pending", "completed"]
+
+
+def test_fastapi_order_history_not_found():
+    resp = client.get("/api/admin/orders/999999/history")
+    assert resp.status_code == 404
+    assert resp.json()["detail"] == "Order not found"
+
+
+def test_fastapi_orders_sparse_fields():
+    item = _create_test_item()
+    customer = f"sparse-{uuid.uuid4().hex[:8]}"
+    client.post("/api/orders", json={
+        "customer_id": customer,
+        "items": [{"item_id": item["id"], "quantity": 1}],
+    })
+
+    resp = client.get("/api/orders", params={"customer_id": customer, "fields": "status,total_price"})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert len(data) == 1
+    assert set(data[0].keys()) == {"id", "status", "total_price"}
+
+
+def _hourly_item_sales(item_id, headers=None):
+    resp = client.get("/api/admin/analytics/sales", params={"granularity": "hour"}, headers=headers)
+    assert resp.status_code == 200
+    buckets = resp.json()
+    return sum(b["items"].get(str(item_id), {}).get("units", 0) for b in buckets)
+
+
+def test_fastapi_sales_rollups_follow_orders():
+    item = _create_test_item(name="Rollup Test Soup")
+    order = client.post("/api/orders", json={
+        "items": [{"item_id": item["id"], "quantity": 3}],
+    }).json()
+    assert _hourly_item_sales(item["id"]) == 3
+
+    client.put(f"/api/admin/orders/{order['id']}/status", json={"status": "cancelled"})
+    assert _hourly_item_sales(item["id"]) == 0
+
+
+def test_sales_task_counts_an_order_once():
+    item = _create_test_item(name="Rollup Retry Soup")
+    order = client.post("/api/orders", json={
+        "items": [{"item_id": item["id"], "quantity": 2}],
+    }).json()
+
+    # Re-run, as the outbox does after a lost delete or an expired lease
+    _record_sales_task({"order_ids": [order["id"]], "sign": 1})
+    _record_sales_task({"order_ids": [order["id"]], "sign": 1})
+    assert _hourly_item_sales(item["id"]) == 2
+
+    client.put(f"/api/admin/orders/{order['id']}/status", json={"status": "cancelled"})
+    _record_sales_task({"order_ids": [order["id"]], "sign": -1})
+    # A stale task from before the cancellation doesn't count it again either
+    _record_sales_task({"order_ids": [order["id"]], "sign": 1})
+    assert _hourly_item_sales(item["id"]) == 0
+
+
+def test_sales_backfill_matches_live_rollups():
+    resp = client.post("/api/items", json={
+        "name": "Rollup Dotted Tea", "category": "hot.drinks", "price": 2.0, "quantity": 10,
+    })
+    item = resp.json()
+    client.post("/api/orders", json={"items": [{"item_id": item["id"], "quantity": 2}]})
+    assert _hourly_item_sales(item["id"]) == 2
+
+    resp = client.post("/api/admin/analytics/sales/backfill")
+    assert resp.status_code == 200
+    assert resp.json()["orders_processed"] >= 1
+    assert _hourly_item_sales(item["id"]) == 2
+
+    buckets = client.get("/api/admin/analytics/sales", params={"granularity": "hour"}).json()
+    # The dot doesn't nest the category under "hot"
+    assert any("hot\uff0edrinks" in b["categories"] for b in buckets)
+    assert not any("hot" in b["categories"] for b in buckets)
+
+
+def test_orders_changed_during_backfill_count_once(monkeypatch):
+    headers = _own_site(monkeypatch)
+    item = client.post(
+        "/api/items", json={"name": "Backfill Race Stew", "category": "main", "price": 3.0, "quantity": 20},
+        headers=headers,
+    ).json()
+
+    def place(quantity):
+        return client.post(
+            "/api/orders", json={"items": [{"item_id": item["id"], "quantity": quantity}]}, headers=headers,
+        )
+
+    order = place(3).json()
+    recount = mongo_repo._recount_sales
+    changed = []
+
+    def change_orders_first(col, docs, *args):
+        # Live writes after the backfill started, before it reached the orders
+        if not changed:
+            changed.append(client.put(
+                f"/api/admin/orders/{order['id']}/status", json={"status": "cancelled"}, headers=headers,
+            ))
+            changed.append(place(2))
+        return recount(col, docs, *args)
+
+    with monkeypatch.context() as m:
+        m.setattr(mongo_repo, "_recount_sales", change_orders_first)
+        with use_site(headers["X-Site-Id"]):
+            mongo_repo.backfill_sales_rollups()
+    assert [r.status_code for r in changed] == [200, 201]
+    assert _hourly_item_sales(item["id"], headers) == 2
+
+
+def test_fastapi_sales_rollups_bad_granularity():
+    resp = client.get("/api/admin/analytics/sales", params={"granularity": "week"})
+    assert resp.status_code == 400
+
+
+def test_fastapi_admin_dashboard():
+    resp = client.get("/api/admin/dashboard")
+    assert resp.status_code == 200
+    data = resp.json()
+    assert {"menu", "low_stock_items", "active_orders", "today", "top_selling", "top_rated"} <= set(data.keys())
+    assert data["menu"]["total_items"] >= 1
+    assert set(data["active_orders"].keys()) == {"pending", "preparing", "ready"}
+
+
+def test_fastapi_admin_dashboard_top_selling_from_rollups(monkeypatch):
+    # A site of its own, so no other test's sales rank in between
+    site = _own_site(monkeypatch, "dash")
+    item = client.post("/api/items", headers=site, json={
+        "name": "Dashboard Curry", "category": "main", "price": 6.0, "quantity": 10,
+    }).json()
+    client.post("/api/orders", headers=site, json={"items": [{"item_id": item["id"], "quantity": 4}]})
+
+    top = client.get("/api/admin/dashboard", headers=site).json()["top_selling"]
+    assert top == [{"item_id": item["id"], "name": "Dashboard Curry", "units_sold": 4}]
+
+
+def test_fastapi_create_order_idempotent_replay():
+    item = _create_test_item(name="Idempotent Test Pasta", quantity=5)
+    body = {"customer_id": "retry-tester", "items": [{"item_id": item["id"], "quantity": 2}]}
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+
+    first = client.post("/api/orders", json=body, headers=headers)
+    assert first.status_code == 201
+    replay = client.post("/api/orders", json=body, headers=headers)
+    assert replay.status_code == 201
+    assert replay.json()["id"] == first.json()["id"]
+    assert replay.headers["idempotent-replayed"] == "true"
+
+    # Stock was only decremented once
+    assert client.get(f"/api/items/{item['id']}").json()["quantity"] == 3
+
+
+def test_fastapi_idempotency_key_reused_for_other_request():
+    item = _create_test_item(name="Idempotent Test Salad")
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    client.post("/api/orders", json={"items": [{"item_id": item["id"], "quantity": 1}]}, headers=headers)
+
+    resp = client.post("/api/orders", json={"items": [{"item_id": item["id"], "quantity": 2}]}, headers=headers)
+    assert resp.status_code == 422
+
+
+def test_archived_orders_stay_readable():
+    item = _create_test_item(name="Archive Test Soup")
+    order = client.post("/api/orders", json={
+        "customer_id": "archive-tester",
+        "items": [{"item_id": item["id"], "quantity": 3}],
+    }).json()
+    client.put(f"/api/admin/orders/{order['id']}/status", json={"status": "completed"})
+    units_before = {
+        r["item_id"]: r["units_sold"] for r in client.get("/api/analytics/top-selling?limit=100").json()
+    }[item["id"]]
+
+    resp = client.post("/api/admin/orders/archive?older_than_days=0")
+    assert resp.status_code == 200
+    assert resp.json()["orders_archived"] >= 1
+
+    # A specific id falls through to the archive
+    resp = client.get(f"/api/orders/{order['id']}")
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "completed"
+
+    # Plain listings only read live orders; a historical range includes the archive
+    recent = client.get("/api/orders", params={"customer_id": "archive-tester"}).json()
+    assert order["id"] not in [o["id"] for o in recent]
+    history = client.get("/api/orders", params={
+        "customer_id": "archive-tester",
+        "since": "2000-01-01T00:00:00",
+    }).json()
+    assert [o["id"] for o in history] == [order["id"]]
+
+    top = {r["item_id"]: r["units_sold"] for r in client.get("/api/analytics/top-selling?limit=100").json()}
+    assert top[item["id"]] == units_before == 3
+
+    # New orders don't reuse archived ids
+    newer = client.post("/api/orders", json={"items": [{"item_id": item["id"], "quantity": 1}]}).json()
+    assert newer["id"] > order["id"]
+
+
+def test_order_changed_while_archiving_stays_live(monkeypatch):
+    headers = _own_site(monkeypatch)
+    item = client.post(
+        "/api/items", json={"name": "Archive Race Pie", "category": "main", "price": 2.0, "quantity": 5},
+        headers=headers,
+    ).json()
+    order = client.post("/api/orders", json={"items": [{"item_id": item["id"], "quantity": 1}]}, headers=headers).json()
+    client.put(f"/api/admin/orders/{order['id']}/status", json={"status": "cancelled"}, headers=headers)
+
+    insert_many = mongo_repo.orders_archive_col.insert_many
+
+    def uncancel_then_insert(docs, **kwargs):
+        result = insert_many(docs, **kwargs)
+        orders_col.update_one({"id": order["id"]}, {"$set": {"status": "pending"}})
+        return result
+
+    with monkeypatch.context() as m:
+        m.setattr(mongo_repo.orders_archive_col, "insert_many", uncancel_then_insert)
+        resp = client.post("/api/admin/orders/archive?older_than_days=0", headers=headers)
+        assert resp.json()["orders_archived"] == 0
+
+    resp = client.get(f"/api/orders/{order['id']}", headers=headers)
+    assert resp.json()["status"] == "pending"
+    with use_site(headers["X-Site-Id"]):
+        assert mongo_repo.orders_archive_col.find_one({"id": order["id"]}) is None
+
+
+def test_archive_rerun_after_crash_keeps_sales(monkeypatch):
+    headers = _own_site(monkeypatch)
+    item = client.post(
+        "/api/items", json={"name": "Archive Crash Tart", "category": "main", "price": 2.0, "quantity": 5},
+        headers=headers,
+    ).json()
+    order = client.post("/api/orders", json={"items": [{"item_id": item["id"], "quantity": 2}]}, headers=headers).json()
+    client.put(f"/api/admin/orders/{order['id']}/status", json={"status": "completed"}, headers=headers)
+
+    # A run that copied the order and died before counting its sales
+    with use_site(headers["X-Site-Id"]):
+        copy = orders_col.find_one({"id": order["id"]})
+        mongo_repo.orders_archive_col.insert_one({**copy, "sales_archived": False})
+
+    for _ in range(2):
+        client.post("/api/admin/orders/archive?older_than_days=0", headers=headers)
+    top = client.get("/api/analytics/top-selling?limit=10", headers=headers).json()
+    assert [(r["item_id"], r["units_sold"]) for r in top] == [(item["id"], 2)]
+
+
+def test_fastapi_rate_completed_order_once():
+    wrap = _create_test_item("Rated Wrap")
+    soup = _create_test_item("Rated Soup")
+    order = client.post("/api/orders", json={
+        "items": [{"item_id": wrap["id"], "quantity": 1}, {"item_id": soup["id"], "quantity": 2}],
+    }).json()
+    ratings = {"ratings": [{"item_id": wrap["id"], "rating": 5}, {"item_id": soup["id"], "rating": 3}]}
+
+    resp = client.post(f"/api/orders/{order['id']}/ratings", json=ratings)
+    assert resp.status_code == 400  # still pending
+
+    client.put(f"/api/admin/orders/{order['id']}/status", json={"status": "completed"})
+    resp = client.post(f"/api/orders/{order['id']}/ratings", json=ratings)
+    assert resp.status_code == 200
+    items = {i["id"]: i for i in resp.json()["items"]}
+    assert items[wrap["id"]]["rating_avg"] == 5 and items[wrap["id"]]["rating_count"] == 1
+    assert items[soup["id"]]["rating_avg"] == 3
+    assert "rating_sum" not in items[wrap["id"]]
+
+    assert client.post(f"/api/orders/{order['id']}/ratings", json=ratings).status_code == 409
+    assert client.get(f"/api/orders/{order['id']}").json()["rated_at"] is not None
+
+
+def test_fastapi_rate_order_rejects_items_not_ordered():
+    item = _create_test_item()
+    other = _create_test_item("Not Ordered")
+    order = client.post("/api/orders", json={"items": [{"item_id": item["id"], "quantity": 1}]}).json()
+    client.put(f"/api/admin/orders/{order['id']}/status", json={"status": "completed"})
+
+    resp = client.post(f"/api/orders/{order['id']}/ratings", json={"ratings": [{"item_id": other["id"], "rating": 4}]})
+    assert resp.status_code == 400
+    assert client.post("/api/orders/999999/ratings", json={"ratings": [{"item_id": 1, "rating": 4}]}).status_code == 404
+
+
+def test_fastapi_bulk_status_only_makes_allowed_moves():
+    item = _create_test_item()
+    customer = f"bulk-{uuid.uuid4().hex[:8]}"
+    orders = [
+        client.post("/api/orders", json={
+            "customer_id": customer,
+            "items": [{"item_id": item["id"], "quantity": 1}],
+        }).json()
+        for _ in range(3)
+    ]
+    ids = [o["id"] for o in orders]
+    client.put(f"/api/admin/orders/{ids[2]}/status", json={"status": "completed"})
+
+    resp = client.post("/api/admin/orders/status", json={"status": "preparing", "order_ids": ids})
+    assert resp.status_code == 200
+    assert resp.json() == {"status": "preparing", "changed": ids[:2]}
+
+    # A filter update only touches this customer's orders, not those other tests left preparing
+    resp = client.post("/api/admin/orders/status", json={
+        "status": "ready", "from_status": "preparing", "customer_id": customer,
+    })
+    assert resp.json()["changed"] == ids[:2]
+    history = client.get(f"/api/admin/orders/{ids[0]}/history").json()
+    assert [h["status"] for h in history] == ["pending", "preparing", "ready"]
+    assert client.get(f"/api/orders/{ids[2]}").json()["status"] == "completed"
+
+
+def test_fastapi_bulk_status_needs_a_selection():
+    assert client.post("/api/admin/orders/status", json={"status": "ready"}).status_code == 400
+    assert client.post("/api/admin/orders/status", json={"status": "bogus", "order_ids": [1]}).status_code == 400
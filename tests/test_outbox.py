@@ -0,0 +1,81 @@
+# tests/test_outbox.py
+
+import threading
+import time
+
+from app.storage.mongo_repo import db
+from app.storage.outbox import TaskOutbox
+
+col = db["test_task_outbox"]
+
+
+def _outbox(**kwargs):
+    col.delete_many({})
+    return TaskOutbox(col, workers=2, sweep_interval=0.05, **kwargs)
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_tasks_run_inline_until_started():
+    outbox = _outbox()
+    seen = []
+    outbox.register("note", lambda p: seen.append(p["n"]))
+    outbox.enqueue("note", {"n": 1})
+    assert seen == [1]
+    assert col.count_documents({}) == 0
+
+
+def test_inline_failure_is_kept_and_retried_after_start():
+    outbox = _outbox()
+    attempts = []
+
+    def flaky(payload):
+        attempts.append(payload)
+        if len(attempts) == 1:
+            raise RuntimeError("boom")
+
+    outbox.register("flaky", flaky)
+    outbox.enqueue("flaky", {"n": 1})
+    assert col.find_one({"name": "flaky"})["status"] == "pending"
+
+    # Left over from "before the restart": picked up as soon as workers start
+    outbox.start()
+    try:
+        assert _wait_for(lambda: col.count_documents({}) == 0)
+        assert len(attempts) == 2
+    finally:
+        outbox.stop()
+
+
+def test_started_outbox_runs_tasks_off_the_caller_thread():
+    outbox = _outbox()
+    threads = []
+    outbox.register("note", lambda p: threads.append(threading.current_thread().name))
+    outbox.start()
+    try:
+        outbox.enqueue("note", {})
+        assert _wait_for(lambda: threads and col.count_documents({}) == 0)
+        assert threads[0].startswith("outbox-worker")
+    finally:
+        outbox.stop()
+
+
+def test_task_is_marked_failed_after_max_attempts():
+    outbox = _outbox(max_attempts=1)
+
+    def broken(payload):
+        raise RuntimeError("always")
+
+    outbox.register("broken", broken)
+    outbox.start()
+    try:
+        outbox.enqueue("broken", {})
+        assert _wait_for(lambda: col.count_documents({"status": "failed"}) == 1)
+        assert outbox.stats()["outbox"] == {"failed": 1}
+    finally:
+        outbox.stop()
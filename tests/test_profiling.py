@@ -0,0 +1,75 @@
+# tests/test_profiling.py
+
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from app.core import profiling
+from app.core.profiling import ProfileStore
+from app.fastapi_app import app
+
+client = TestClient(app)
+
+
+def _setup(monkeypatch, tmp_path):
+    store = ProfileStore(str(tmp_path), keep=2)
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "profile_store", store)
+    monkeypatch.setattr("app.fastapi_api.profile_store", store)
+    for middleware in app.user_middleware:
+        if middleware.cls is profiling.ProfilingMiddleware:
+            monkeypatch.setitem(middleware.kwargs, "store", store)
+    app.middleware_stack = None
+    return store
+
+
+def test_profiled_request_records_mongo_commands(monkeypatch, tmp_path):
+    store = _setup(monkeypatch, tmp_path)
+    headers = {"X-Admin-Token": "secret"}
+
+    response = client.get("/api/items", headers={"X-Profile": "1", **headers})
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+
+    summary = client.get(f"/api/admin/profiles/{profile_id}", headers=headers).json()
+    assert summary["path"] == "/api/items"
+    assert summary["mongo"]["count"] == len(summary["mongo"]["commands"])
+    assert "top_functions" in summary
+
+    download = client.get(f"/api/admin/profiles/{profile_id}/download", headers=headers)
+    assert download.status_code == 200
+    assert store.path(profile_id, "prof") is not None
+
+
+def test_profiling_needs_admin_token(monkeypatch, tmp_path):
+    _setup(monkeypatch, tmp_path)
+
+    response = client.get("/api/items", headers={"X-Profile": "1", "X-Admin-Token": "wrong"})
+    assert "x-profile-id" not in response.headers
+    assert client.get("/api/admin/profiles").status_code == 403
+    assert client.get("/api/admin/profiles", headers={"X-Admin-Token": "secret"}).json() == []
+
+
+def test_store_keeps_newest_profiles(tmp_path):
+    store = ProfileStore(str(tmp_path), keep=2)
+    for _ in range(3):
+        store.save(profiling.RequestProfile("GET", "/api/items"))
+    assert len(store.list()) == 2
+
+
+def test_recorder_attributes_commands_to_current_profile():
+    recorder = profiling.MongoCommandRecorder()
+    profile = profiling.RequestProfile("GET", "/api/items")
+    event = SimpleNamespace(command_name="find", command={"find": "items"}, request_id=1)
+
+    recorder.started(event)
+    recorder.succeeded(event)
+    assert profile.commands == []
+
+    token = profiling._current.set(profile)
+    try:
+        recorder.started(event)
+        recorder.succeeded(event)
+    finally:
+        profiling._current.reset(token)
+    assert profile.summary()["mongo"]["by_command"][0]["command"] == "find items"
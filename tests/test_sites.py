@@ -0,0 +1,111 @@
+# tests/test_sites.py
+
+import uuid
+
+from fastapi.testclient import TestClient
+from pymongo.errors import OperationFailure
+
+from app.core import sites
+from app.fastapi_app import app
+from app.storage.site_collection import SiteScopedCollection
+
+client = TestClient(app)
+
+
+def _site(monkeypatch):
+    """A fresh site id, added to the served sites for this test"""
+    site = f"site-{uuid.uuid4().hex[:8]}"
+    monkeypatch.setattr(sites, "SITES", [*sites.SITES, site])
+    return site
+
+
+def _create_item(site, name="Site Bagel", quantity=10):
+    resp = client.post(
+        "/api/items",
+        json={"name": name, "category": "breakfast", "price": 3.0, "quantity": quantity},
+        headers={"X-Site-Id": site},
+    )
+    assert resp.status_code == 201
+    return resp.json()
+
+
+def test_items_are_scoped_to_their_site(monkeypatch):
+    north, south = _site(monkeypatch), _site(monkeypatch)
+    item = _create_item(north)
+    assert item["id"] == 1
+    assert "site_id" not in item
+
+    north_items = client.get("/api/items", headers={"X-Site-Id": north}).json()
+    assert [i["name"] for i in north_items] == ["Site Bagel"]
+    assert client.get("/api/items", headers={"X-Site-Id": south}).json() == []
+    assert "Site Bagel" not in [i["name"] for i in client.get("/api/items").json()]
+
+
+def test_ids_are_allocated_per_site(monkeypatch):
+    north, south = _site(monkeypatch), _site(monkeypatch)
+    assert [_create_item(north)["id"] for _ in range(2)] == [1, 2]
+    assert _create_item(south)["id"] == 1
+
+    first = client.post(
+        "/api/orders",
+        json={"customer_id": "alice", "items": [{"item_id": 1, "quantity": 1}]},
+        headers={"X-Site-Id": south},
+    )
+    assert first.status_code == 201
+    assert first.json()["id"] == 1
+    assert client.get(f"/api/orders/{first.json()['id']}", params={"site": north}).status_code == 404
+
+
+def test_orders_use_their_sites_items(monkeypatch):
+    site = _site(monkeypatch)
+    _create_item(site, name="Site Soup", quantity=3)
+    resp = client.post(
+        f"/api/orders?site={site}",
+        json={"customer_id": "bob", "items": [{"item_id": 1, "quantity": 2}]},
+    )
+    assert resp.status_code == 201
+    assert resp.json()["items"][0]["name"] == "Site Soup"
+
+    item = client.get("/api/items/1", headers={"X-Site-Id": site}).json()
+    assert item["quantity"] == 1
+    orders = client.get("/api/orders", params={"customer_id": "bob", "site": site}).json()
+    assert [o["id"] for o in orders] == [resp.json()["id"]]
+
+
+def test_invalid_site_is_rejected():
+    resp = client.get("/api/items", headers={"X-Site-Id": "../etc"})
+    assert resp.status_code == 400
+    assert "site" in resp.json()["detail"]
+
+
+def test_unlisted_site_is_rejected():
+    # Each site gets per-worker state, so clients can't make up new ones
+    resp = client.get("/api/items", headers={"X-Site-Id": f"site-{uuid.uuid4().hex[:8]}"})
+    assert resp.status_code == 400
+    assert resp.json()["detail"].startswith("Unknown site")
+
+
+class _RacedIndexes:
+    """An index list another worker is dropping from at the same time"""
+
+    def __init__(self):
+        self.indexes = {
+            "_id_": {"key": [("_id", 1)]},
+            "category_1": {"key": [("category", 1)]},
+            "name_1": {"key": [("name", 1)]},
+            "site_id_1_name_1": {"key": [("site_id", 1), ("name", 1)]},
+        }
+
+    def index_information(self):
+        return dict(self.indexes)
+
+    def drop_index(self, name):
+        if name == "category_1":
+            raise OperationFailure("index not found with name [category_1]", code=27)
+        del self.indexes[name]
+
+
+def test_unscoped_index_drop_tolerates_other_workers():
+    raw = _RacedIndexes()
+    assert SiteScopedCollection(raw).drop_unscoped_indexes() == ["name_1"]
+    assert sorted(raw.indexes) == ["_id_", "category_1", "site_id_1_name_1"]
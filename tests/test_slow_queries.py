@@ -0,0 +1,83 @@
+# tests/test_slow_queries.py
+
+from types import SimpleNamespace
+
+from app.storage import mongo_repo
+from app.storage.site_collection import SiteScopedCollection
+from app.storage.slow_queries import SlowQueryLog, plan_summary
+
+
+def _run(log, name, command, duration_ms, request_id=1):
+    event = SimpleNamespace(
+        command_name=name, command=command, request_id=request_id,
+        database_name="cafeteria_db", duration_micros=int(duration_ms * 1000),
+    )
+    log.started(event)
+    log.succeeded(event)
+
+
+def test_only_commands_over_threshold_are_logged_with_caller():
+    log = SlowQueryLog(threshold_ms=50, explain_rate=0, caller_prefix="tests.")
+    _run(log, "find", {"find": "items", "filter": {"category": "Drinks"}}, 10, request_id=1)
+    _run(log, "find", {"find": "items", "filter": {"category": "Mains"}}, 80, request_id=2)
+
+    [entry] = log.entries()
+    assert entry["collection"] == "items"
+    assert entry["filter"] == {"category": "Mains"}
+    assert entry["caller"].startswith("test_slow_queries._run:")
+    assert log.by_caller()[0]["count"] == 1
+
+
+class _ListenedCollection:
+    """Calls the listener from inside find_one, on the caller's thread, as the driver does"""
+
+    def __init__(self, log):
+        self.log = log
+
+    def find_one(self, filter, *args, **kwargs):
+        _run(self.log, "find", {"find": "items", "filter": filter}, 80)
+        return None
+
+
+def test_caller_skips_the_site_scoped_wrapper(monkeypatch):
+    log = SlowQueryLog(threshold_ms=50, explain_rate=0)
+    monkeypatch.setattr(mongo_repo, "items_col", SiteScopedCollection(_ListenedCollection(log)))
+    assert mongo_repo.get_item_by_id(1) is None
+
+    [entry] = log.entries()
+    assert entry["caller"].startswith("mongo_repo.get_item_by_id:")
+
+
+def test_plan_summary_flags_collscan_and_sort():
+    find_explain = {
+        "queryPlanner": {
+            "parsedQuery": {"$and": [{"price": {"$gte": 1}}]},
+            "winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}},
+        },
+    }
+    summary = plan_summary(find_explain)
+    assert summary == {"stages": ["SORT", "COLLSCAN"], "collscan": True, "in_memory_sort": True}
+
+    aggregate_explain = {
+        "stages": [
+            {"$cursor": {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}}},
+            {"$group": {}},
+            {"$sort": {}},
+        ],
+    }
+    summary = plan_summary(aggregate_explain)
+    assert summary["stages"] == ["$group", "$sort", "FETCH", "IXSCAN"]
+    assert not summary["collscan"]
+    assert summary["in_memory_sort"]
+
+
+def test_plan_summary_ignores_rejected_plans():
+    planner = {
+        "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}},
+        "rejectedPlans": [{"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}],
+    }
+    summary = plan_summary({"queryPlanner": planner, "command": {"find": "items", "sort": {"price": 1}}})
+    assert summary == {"stages": ["FETCH", "IXSCAN"], "collscan": False, "in_memory_sort": False}
+
+    summary = plan_summary({"stages": [{"$cursor": {"queryPlanner": planner}}]})
+    assert summary["stages"] == ["FETCH", "IXSCAN"]
@@ -0,0 +1,113 @@
+# tests/test_specials_api_fastapi.py
+
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from app.fastapi_app import app
+
+client = TestClient(app)
+
+
+def _create_item(price=10.0):
+    resp = client.post("/api/items", json={
+        "name": "Special Test Curry",
+        "category": "main",
+        "price": price,
+        "quantity": 20,
+    })
+    assert resp.status_code == 201
+    return resp.json()
+
+
+def _special_ids():
+    return [s["id"] for s in client.get("/api/daily-specials").json()]
+
+
+def test_scheduled_special_applies_today_only():
+    item = _create_item()
+    today = datetime.utcnow().date()
+    tomorrow = today + timedelta(days=1)
+
+    later = client.post("/api/admin/specials", json={
+        "item_id": item["id"],
+        "start_date": tomorrow.isoformat(),
+        "discount_percentage": 50,
+    })
+    assert later.status_code == 201
+    assert later.json()["end_date"] == tomorrow.isoformat()
+    assert item["id"] not in _special_ids()
+
+    resp = client.post("/api/admin/specials", json={
+        "item_id": item["id"],
+        "start_date": today.isoformat(),
+        "end_date": tomorrow.isoformat(),
+        "discount_percentage": 20,
+    })
+    assert resp.status_code == 201
+    special = resp.json()
+
+    specials = {s["id"]: s for s in client.get("/api/daily-specials").json()}
+    assert specials[item["id"]]["discount_percentage"] == 20
+    assert specials[item["id"]]["is_daily_special"] is True
+
+    order = client.post("/api/orders", json={"items": [{"item_id": item["id"], "quantity": 2}]})
+    assert order.json()["total_price"] == 16.0
+
+    running = client.get("/api/admin/specials", params={"on": today.isoformat()}).json()
+    assert special["id"] in [s["id"] for s in running]
+    assert later.json()["id"] not in [s["id"] for s in running]
+
+    assert client.delete(f"/api/admin/specials/{special['id']}").status_code == 204
+    assert item["id"] not in _special_ids()
+    order = client.post("/api/orders", json={"items": [{"item_id": item["id"], "quantity": 2}]})
+    assert order.json()["total_price"] == 20.0
+
+
+def test_legacy_daily_special_flag_still_counts():
+    item = _create_item(price=8.0)
+    client.put(f"/api/items/{item['id']}", json={"is_daily_special": True, "discount_percentage": 25})
+    assert item["id"] in _special_ids()
+    order = client.post("/api/orders", json={"items": [{"item_id": item["id"], "quantity": 1}]})
+    assert order.json()["total_price"] == 6.0
+
+
+def test_special_validation():
+    item = _create_item()
+    today = datetime.utcnow().date()
+    resp = client.post("/api/admin/specials", json={
+        "item_id": item["id"],
+        "start_date": today.isoformat(),
+        "end_date": (today - timedelta(days=1)).isoformat(),
+    })
+    assert resp.status_code == 400
+    resp = client.post("/api/admin/specials", json={"item_id": 999999, "start_date": today.isoformat()})
+    assert resp.status_code == 400
+    assert client.delete("/api/admin/specials/999999").status_code == 404
+
+
+def test_menu_listings_show_todays_specials():
+    item = _create_item(price=12.0)
+    today = datetime.utcnow().date()
+    special = client.post("/api/admin/specials", json={
+        "item_id": item["id"],
+        "start_date": today.isoformat(),
+        "discount_percentage": 25,
+    }).json()
+
+    listed = {i["id"]: i for i in client.get("/api/items").json()}[item["id"]]
+    assert listed["is_daily_special"] is True
+    assert listed["discount_percentage"] == 25
+    assert item["id"] in [i["id"] for i in client.get("/api/items", params={"daily_special": True}).json()]
+    sparse = client.get("/api/items", params={"daily_special": True, "fields": "discount_percentage"}).json()
+    assert {"id": item["id"], "discount_percentage": 25} in sparse
+    paged = client.get("/api/items", params={"daily_special": True, "limit": 500}).json()
+    assert item["id"] in [i["id"] for i in paged]
+    assert client.get(f"/api/items/{item['id']}").json()["discount_percentage"] == 25
+    specials_total = client.get("/api/items/facets").json()["dietary"]["daily_special"]
+
+    client.delete(f"/api/admin/specials/{special['id']}")
+    listed = {i["id"]: i for i in client.get("/api/items").json()}[item["id"]]
+    assert listed["is_daily_special"] is False
+    assert listed["discount_percentage"] == 0
+    assert item["id"] not in [i["id"] for i in client.get("/api/items", params={"daily_special": True}).json()]
+    assert client.get("/api/items/facets").json()["dietary"]["daily_special"] == specials_total - 1
@@ -0,0 +1,75 @@
+# tests/test_stock_alerts.py
+
+import asyncio
+
+from fastapi.testclient import TestClient
+from app.fastapi_app import app
+from app.storage.mongo_repo import create_order, stock_events
+
+client = TestClient(app)
+
+
+def _create_item(quantity, low_stock_threshold=5):
+    resp = client.post("/api/items", json={
+        "name": "Stock Alert Muffin",
+        "category": "dessert",
+        "price": 2.0,
+        "quantity": quantity,
+        "low_stock_threshold": low_stock_threshold,
+    })
+    assert resp.status_code == 201
+    return resp.json()
+
+
+def _alert_levels():
+    resp = client.get("/api/admin/stock-alerts")
+    assert resp.status_code == 200
+    return {a["id"]: a["stock_alert"] for a in resp.json()}
+
+
+def test_stock_alerts_follow_quantity():
+    item = _create_item(quantity=6)
+    assert item["low_stock_threshold"] == 5
+    assert item["id"] not in _alert_levels()
+
+    client.post("/api/orders", json={"items": [{"item_id": item["id"], "quantity": 2}]})
+    assert _alert_levels()[item["id"]] == "low"
+
+    client.post("/api/orders", json={"items": [{"item_id": item["id"], "quantity": 4}]})
+    assert _alert_levels()[item["id"]] == "out"
+
+    client.put(f"/api/items/{item['id']}", json={"quantity": 20})
+    assert item["id"] not in _alert_levels()
+
+
+def test_per_item_threshold():
+    item = _create_item(quantity=8, low_stock_threshold=10)
+    assert _alert_levels()[item["id"]] == "low"
+
+    client.put(f"/api/items/{item['id']}", json={"low_stock_threshold": 3})
+    assert item["id"] not in _alert_levels()
+
+    resp = client.put(f"/api/items/{item['id']}", json={"low_stock_threshold": -1})
+    assert resp.status_code == 422
+
+
+def test_crossing_publishes_one_event():
+    item = _create_item(quantity=7)
+
+    async def scenario():
+        queue = stock_events.subscribe()
+        try:
+            # Still above the threshold: no event
+            await asyncio.to_thread(create_order, "guest", [{"item_id": item["id"], "quantity": 1}])
+            await asyncio.to_thread(create_order, "guest", [{"item_id": item["id"], "quantity": 2}])
+            await asyncio.to_thread(create_order, "guest", [{"item_id": item["id"], "quantity": 1}])
+            event = await asyncio.wait_for(queue.get(), 1)
+            assert queue.empty()
+            return event
+        finally:
+            stock_events.unsubscribe(queue)
+
+    event = asyncio.run(scenario())
+    assert event["item_id"] == item["id"]
+    assert event["level"] == "low"
+    assert event["quantity"] == 4
@@ -0,0 +1,45 @@
+# tests/test_traffic.py
+
+import time
+
+from fastapi.testclient import TestClient
+
+from app.core.traffic import TrafficCaptureMiddleware, scrub, scrub_query, scrub_value
+from app.fastapi_app import app
+from replay_traffic import load_requests, percentile, route_of
+
+
+def test_scrub_replaces_fields_with_stable_pseudonyms():
+    body = {"customer_id": "alice", "items": [{"item_id": 1, "notes": "no onions"}]}
+    scrubbed = scrub(body, ["customer_id", "notes"])
+    assert scrubbed["customer_id"] == scrub_value("alice") != "alice"
+    assert scrubbed["items"][0] == {"item_id": 1, "notes": scrub_value("no onions")}
+    assert scrub_query("customer_id=alice&limit=5", ["customer_id"]) == f"customer_id={scrub_value('alice')}&limit=5"
+
+
+def test_captured_requests_can_be_loaded_for_replay(tmp_path):
+    capture = TrafficCaptureMiddleware(app, sample_rate=1, directory=str(tmp_path), scrub_fields=["customer_id"])
+    client = TestClient(capture)
+    client.get("/api/items?customer_id=alice", headers={"X-Admin-Token": "secret"})
+    client.post("/api/orders", json={"customer_id": "alice", "items": []}, headers={"Idempotency-Key": "k1"})
+
+    deadline = time.monotonic() + 2
+    records = []
+    while len(records) < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+        records = load_requests([str(tmp_path)])
+
+    get, post = records
+    assert get["status"] == 200 and get["query"] == f"customer_id={scrub_value('alice')}"
+    assert "x-admin-token" not in get["headers"]
+    assert post["body"]["json"]["customer_id"] == scrub_value("alice")
+    assert post["headers"]["idempotency-key"] == "k1"
+    assert route_of({"method": "GET", "path": "/api/orders/12/history"}) == "GET /api/orders/{id}/history"
+    assert post["duration_ms"] >= 0
+
+
+def test_percentile():
+    values = sorted(float(v) for v in range(1, 101))
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 50) == 0.0
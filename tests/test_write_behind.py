@@ -0,0 +1,75 @@
+# tests/test_write_behind.py
+
+import threading
+
+from app.core.write_behind import CoalescingBuffer
+
+
+def test_buffer_coalesces_per_key():
+    buffer = CoalescingBuffer(max_pending=3)
+    assert buffer.add(1, 5) is False
+    assert buffer.add(1, 3) is False
+    assert buffer.add(2, 4) is True
+    assert buffer.pending(1) == (8, 2)
+    assert buffer.pending(3) == (0, 0)
+
+
+def test_drained_batch_stays_visible_until_commit():
+    buffer = CoalescingBuffer()
+    buffer.add(1, 4)
+    batch = buffer.drain()
+    assert batch == {1: (4, 1)}
+    assert len(buffer) == 0
+
+    buffer.add(1, 2)
+    assert buffer.pending(1) == (6, 2)
+    buffer.commit()
+    assert buffer.pending(1) == (2, 1)
+
+
+def test_restore_puts_failed_batch_back():
+    buffer = CoalescingBuffer()
+    buffer.add(1, 5)
+    buffer.drain()
+    buffer.add(1, 1)
+    buffer.restore()
+    assert buffer.pending(1) == (6, 2)
+    assert len(buffer) == 2
+    assert buffer.drain() == {1: (6, 2)}
+
+
+def test_read_waits_for_a_batch_being_written():
+    buffer = CoalescingBuffer()
+    persisted = {1: (0, 0)}
+    buffer.add(1, 4)
+    buffer.drain()
+
+    results = []
+    reader = threading.Thread(target=lambda: results.append(buffer.read(lambda: persisted[1])))
+    reader.start()
+    reader.join(0.05)
+    assert reader.is_alive()
+
+    persisted[1] = (4, 1)
+    buffer.commit()
+    reader.join(1)
+    # Counted once: in the persisted value, not again as pending
+    assert results == [((4, 1), {})]
+
+
+def test_read_reloads_when_a_flush_finished_during_it():
+    buffer = CoalescingBuffer()
+    persisted = {1: (0, 0)}
+    buffer.add(1, 4)
+    loads = []
+
+    def load():
+        loads.append(persisted[1])
+        if len(loads) == 1:
+            buffer.drain()
+            persisted[1] = (4, 1)
+            buffer.commit()
+        return persisted[1]
+
+    assert buffer.read(load) == ((4, 1), {})
+    assert len(loads) == 2